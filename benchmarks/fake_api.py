@@ -0,0 +1,236 @@
+import re
+import json
+import math
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, Any, Optional
+from pydantic import BaseModel
+
+class EndpointBehavior(BaseModel):
+    # How a stand-in endpoint responds: after latency seconds (plus up to jitter
+    # more), failing a fraction error_rate of requests with a 500, and answering 429
+    # beyond rate_limit requests per second (0: unlimited).
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    # Pause between the chunks of a streamed completion.
+    stream_interval: float = 0.0
+
+class _RateLimiter:
+    # Token bucket holding up to one second's worth of requests.
+
+    def __init__(self, per_second: float):
+
+        self.per_second = per_second
+        self.tokens = per_second
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        # Returns 0 if the request may go ahead, or else the seconds until it could.
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.per_second
+
+SCENE_LINE = re.compile(r'^\{"i":.*\}$', re.MULTILINE)
+
+def chat_answer(messages) -> str:
+    # What the stand-in model says: a description for each keyframe of a vision
+    # request, a summary per part for a narrative outline, and one narration segment
+    # per scene (from the compact scene lines in the prompt) for a narrative.
+
+    content = messages[-1]["content"]
+    if isinstance(content, list):
+        text = " ".join(part["text"] for part in content if part["type"] == "text")
+        scenes = [int(n) for n in re.findall(r"[Ss]cene (\d+)", text)]
+        if len(scenes) == 1:
+            return f"Scene {scenes[0]} shows a street at dusk. A figure crosses under the lights and turns a corner."
+        return json.dumps({"descriptions": [
+            {"scene": n, "description": f"Scene {n} shows a street at dusk. A figure crosses under the lights."}
+            for n in scenes
+        ]})
+
+    if "Summarize the story of each part" in content:
+        parts = [int(n) for n in re.findall(r"^Part (\d+) ", content, re.MULTILINE)]
+        return json.dumps({"parts": [{"part": n, "summary": f"In part {n} the figure walks on."} for n in parts]})
+
+    segments = []
+    for line in SCENE_LINE.findall(content):
+        scene = json.loads(line)
+        segments.append({
+            "scene_idx": scene["i"],
+            "start_time": scene["s"],
+            "end_time": scene["e"],
+            "text": f"The figure walks on through scene {scene['i'] + 1}, under lights that flicker and fade."
+        })
+    return json.dumps({"segments": segments})
+
+class FakeAPIServer:
+    # A local HTTP server standing in for both APIs the pipeline calls: OpenAI's
+    # POST /v1/chat/completions (streamed or not, with usage) and ElevenLabs'
+    # POST /v1/text-to-speech/<voice_id>, which answers with audio(text). Point the
+    # SDK clients at url (OpenAI at url + "/v1"). Counts every request in stats.
+
+    def __init__(
+        self,
+        audio: Callable[[str], bytes],
+        openai: Optional[EndpointBehavior] = None,
+        elevenlabs: Optional[EndpointBehavior] = None,
+        seed: int = 0
+    ):
+
+        self.audio = audio
+        self.behavior = {"openai": openai or EndpointBehavior(), "elevenlabs": elevenlabs or EndpointBehavior()}
+        self.limiters = {
+            name: _RateLimiter(behavior.rate_limit) for name, behavior in self.behavior.items() if behavior.rate_limit > 0
+        }
+        self.stats = {
+            name: {"requests": 0, "errors": 0, "rate_limited": 0, "max_active": 0} for name in self.behavior
+        }
+        self._active = dict.fromkeys(self.behavior, 0)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeAPIServer":
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeAPIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _admit(self, name: str) -> Optional[Dict[str, Any]]:
+        # Counts the request and sleeps for its latency. Returns the error response
+        # to send instead of an answer, if any.
+
+        behavior = self.behavior[name]
+        with self._lock:
+            stats = self.stats[name]
+            stats["requests"] += 1
+            fail = self._random.random() < behavior.error_rate
+            delay = behavior.latency + self._random.random() * behavior.jitter
+        if name in self.limiters:
+            retry_after = self.limiters[name].acquire()
+            if retry_after:
+                with self._lock:
+                    stats["rate_limited"] += 1
+                return {"status": 429, "retry_after": retry_after}
+        with self._lock:
+            self._active[name] += 1
+            stats["max_active"] = max(stats["max_active"], self._active[name])
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._active[name] -= 1
+        if fail:
+            with self._lock:
+                stats["errors"] += 1
+            return {"status": 500}
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.startswith("/v1/chat/completions"):
+                    self._chat(body)
+                elif self.path.startswith("/v1/text-to-speech/"):
+                    self._speech(body)
+                else:
+                    self._send(404, b'{"error": "not found"}')
+
+            def _send(self, status: int, data: bytes, content_type: str = "application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, error: Dict[str, Any]):
+                headers = {}
+                if "retry_after" in error:
+                    headers["retry-after-ms"] = str(int(error["retry_after"] * 1000) + 1)
+                    headers["Retry-After"] = str(math.ceil(error["retry_after"]))
+                message = "rate limited" if error["status"] == 429 else "injected failure"
+                self._send(error["status"], json.dumps({"error": {"message": message}}).encode(), headers=headers)
+
+            def _chat(self, body):
+                error = server._admit("openai")
+                if error:
+                    return self._error(error)
+                answer = chat_answer(body["messages"])
+                usage = {
+                    "prompt_tokens": len(json.dumps(body["messages"])) // 4,
+                    "completion_tokens": len(answer) // 4,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                base = {"id": "chatcmpl-benchmark", "created": int(time.time()), "model": body["model"]}
+
+                if not body.get("stream"):
+                    return self._send(200, json.dumps(dict(base, object="chat.completion", choices=[{
+                        "index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"
+                    }], usage=usage)).encode())
+
+                # Server-sent events, ending when the connection closes.
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def event(payload):
+                    self.wfile.write(b"data: " + json.dumps(payload).encode() + b"\n\n")
+                    self.wfile.flush()
+
+                for i in range(0, len(answer), 24):
+                    time.sleep(server.behavior["openai"].stream_interval)
+                    event(dict(base, object="chat.completion.chunk", choices=[
+                        {"index": 0, "delta": {"content": answer[i:i + 24]}, "finish_reason": None}
+                    ]))
+                event(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if body.get("stream_options", {}).get("include_usage"):
+                    event(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _speech(self, body):
+                error = server._admit("elevenlabs")
+                if error:
+                    return self._error(error)
+                self._send(200, server.audio(body["text"]), content_type="audio/mpeg")
+
+        return Handler
@@ -0,0 +1,45 @@
+# Synthetic media shared by the benchmark and the test suite.
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+def find_ffmpeg():
+    return shutil.which("ffmpeg")
+
+def make_tone_mp3(ffmpeg_path: str, seconds: float, frequency: int = 440, sample_rate: int = 44100) -> bytes:
+    # Returns an MP3-encoded sine tone, like the clips the TTS service sends back.
+
+    result = subprocess.run(
+        [
+            ffmpeg_path, "-v", "error",
+            "-f", "lavfi", "-i", f"sine=frequency={frequency}:duration={seconds}",
+            "-ac", "1", "-ar", str(sample_rate),
+            "-f", "mp3", "-"
+        ],
+        capture_output=True,
+        check=True
+    )
+    return result.stdout
+
+
+def make_test_video(
+    path: str,
+    num_scenes: int = 5,
+    frames_per_scene: int = 45,
+    size: tuple = (320, 240),
+    fps: int = 30,
+    seed: int = 0
+) -> str:
+    # Writes a video made of `num_scenes` visually distinct shots. Each shot is a
+    # coarse random block pattern that pans slowly, so cuts are sharp and unambiguous.
+
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for _ in range(num_scenes):
+        blocks = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+        base = cv2.resize(blocks, size, interpolation=cv2.INTER_NEAREST)
+        for i in range(frames_per_scene):
+            writer.write(np.roll(base, i, axis=1))
+    writer.release()
+    return path
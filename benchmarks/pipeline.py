@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import functools
+import statistics
+import contextlib
+from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARK_DIR, "..", "src"))
+
+from fake_api import FakeAPIServer, EndpointBehavior
+from fixtures import make_test_video, make_tone_mp3
+from toolchain import find_ffmpeg
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# The module-level components of main that each run replaces.
+COMPONENTS = ("input_handler", "scene_analyzer", "narrative_generator", "audio_generator", "output_renderer", "artifact_store")
+
+class Scenario(BaseModel):
+    # A synthetic video of `scenes` shots of scene_seconds each, and how the stand-in
+    # APIs behave. env is applied for the run, e.g. to change the narrative windows.
+    scenes: int = 12
+    scene_seconds: float = 2.0
+    openai: EndpointBehavior = Field(default_factory=EndpointBehavior)
+    elevenlabs: EndpointBehavior = Field(default_factory=EndpointBehavior)
+    env: Dict[str, str] = Field(default_factory=dict)
+
+# Latencies are in the range of the real APIs' for short requests.
+SCENARIOS = {
+    "default": Scenario(
+        openai=EndpointBehavior(latency=0.4, jitter=0.2, stream_interval=0.01),
+        elevenlabs=EndpointBehavior(latency=0.3, jitter=0.1)
+    ),
+    # Failed and rate-limited requests, which have to be retried.
+    "flaky": Scenario(
+        openai=EndpointBehavior(latency=0.4, jitter=0.2, error_rate=0.1, rate_limit=6, stream_interval=0.01),
+        elevenlabs=EndpointBehavior(latency=0.3, jitter=0.1, error_rate=0.05, rate_limit=5)
+    ),
+    # Long enough to be narrated in concurrent windows.
+    "long": Scenario(
+        scenes=48,
+        openai=EndpointBehavior(latency=0.4, jitter=0.2, stream_interval=0.01),
+        elevenlabs=EndpointBehavior(latency=0.3, jitter=0.1),
+        env={"NARRATIVE_WINDOW_SECONDS": "30"}
+    ),
+}
+
+@functools.lru_cache(maxsize=None)
+def _tone(seconds: float, frequency: int) -> bytes:
+    return make_tone_mp3(find_ffmpeg(), seconds, frequency=frequency)
+
+def narration_audio(text: str) -> bytes:
+    # About as long as the text would take to read, in half-second steps.
+    seconds = min(4.0, max(0.5, round(len(text.split()) * 0.3 * 2) / 2))
+    return _tone(seconds, 300 + 100 * (len(text) % 5))
+
+def run_once(video_path: str, work_dir: str, server: FakeAPIServer, pipelined: bool) -> Dict[str, Any]:
+    # One cold run: fresh caches, components and output directory.
+
+    import main
+    from openai import OpenAI
+    from elevenlabs import ElevenLabs
+
+    os.environ["NARRATION_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    for component_name in COMPONENTS:
+        setattr(main, component_name, None)
+    main.load_components()
+    main.narrative_generator.client = OpenAI(api_key="benchmark", base_url=server.url + "/v1")
+    main.audio_generator.client = ElevenLabs(api_key="benchmark", base_url=server.url)
+
+    started = time.perf_counter()
+    result = main.process_video(video_path, os.path.join(work_dir, "output"), pipelined=pipelined, profile=True)
+    result["seconds"] = time.perf_counter() - started
+    shutil.rmtree(work_dir)
+    return result
+
+def run_scenario(name: str, scenario: Scenario, runs: int, pipelined: bool = True, verbose: bool = False) -> Dict[str, Any]:
+
+    import main
+
+    saved_env = dict(os.environ)
+    saved_components = {component_name: getattr(main, component_name) for component_name in COMPONENTS}
+    temp_dir = tempfile.mkdtemp(prefix=f"benchmark_{name}_")
+    cwd = os.getcwd()
+    try:
+        os.environ.update({"OPENAI_API_KEY": "benchmark", "ELEVEN_API_KEY": "benchmark"}, **scenario.env)
+        fps = 30
+        video_path = make_test_video(
+            os.path.join(temp_dir, f"{name}.mp4"),
+            num_scenes=scenario.scenes,
+            frames_per_scene=int(scenario.scene_seconds * fps),
+            fps=fps
+        )
+        os.chdir(temp_dir)
+
+        results = []
+        with FakeAPIServer(narration_audio, scenario.openai, scenario.elevenlabs) as server:
+            for run in range(runs):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                    results.append(run_once(video_path, os.path.join(temp_dir, f"run_{run}"), server, pipelined))
+            server_stats = server.stats
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+        for component_name, component in saved_components.items():
+            setattr(main, component_name, component)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return summarize(name, scenario, results, server_stats)
+
+def summarize(name: str, scenario: Scenario, results: List[Dict[str, Any]], server_stats: Dict[str, Any]) -> Dict[str, Any]:
+    # Medians over the runs. Stage times overlap when pipelined; see RunProfile.
+
+    seconds = [result["seconds"] for result in results]
+    video_seconds = results[0]["metadata"]["duration"]
+    stage_names = sorted({stage for result in results for stage in result["profile"]["stages"]})
+    request_names = sorted({request for result in results for request in result["profile"]["requests"]})
+
+    def median_of(values):
+        return round(statistics.median(values), 4)
+
+    return {
+        "scenario": name,
+        "settings": scenario.model_dump(),
+        "runs": len(results),
+        "video_seconds": video_seconds,
+        "scenes": results[0]["scenes"],
+        "narrative_segments": results[0]["narrative_segments"],
+        "seconds": {"median": median_of(seconds), "min": round(min(seconds), 4), "max": round(max(seconds), 4)},
+        # Seconds of video processed per second of wall time.
+        "throughput": round(video_seconds / statistics.median(seconds), 3),
+        "stages": {
+            stage: median_of([result["profile"]["stages"].get(stage, {}).get("wall_seconds", 0.0) for result in results])
+            for stage in stage_names
+        },
+        "requests": {
+            request: {
+                "count": median_of([result["profile"]["requests"].get(request, {}).get("count", 0) for result in results]),
+                "mean_seconds": median_of([
+                    result["profile"]["requests"][request]["mean_seconds"]
+                    for result in results if request in result["profile"]["requests"]
+                ])
+            }
+            for request in request_names
+        },
+        "tokens_per_video_minute": results[0]["token_usage"].get("per_video_minute", {}),
+        "server": server_stats
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_seconds: float) -> List[str]:
+    # Returns a description of every timing that is more than `tolerance` (a
+    # fraction) and min_seconds slower than in the baseline.
+
+    pairs = [("total", report["seconds"]["median"], baseline["seconds"]["median"])]
+    pairs += [
+        (f"stage {stage}", seconds, baseline["stages"][stage])
+        for stage, seconds in report["stages"].items() if stage in baseline["stages"]
+    ]
+    return [
+        f"{report['scenario']}: {label} took {current:.3f}s, baseline {previous:.3f}s"
+        for label, current, previous in pairs
+        if current > previous * (1 + tolerance) and current - previous > min_seconds
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run process_video end to end against local stand-ins for OpenAI and ElevenLabs, fully offline"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run (repeatable; default: all)"
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Runs per scenario; timings are medians"
+    )
+    parser.add_argument(
+        "--no-pipeline",
+        action="store_true",
+        help="Run each stage to completion before starting the next"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help="Baseline to compare against (default: benchmarks/baseline.json)"
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Save these results as the baseline instead of comparing"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fail if a timing is this fraction slower than the baseline"
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.1,
+        help="Ignore slowdowns smaller than this many seconds"
+    )
+    parser.add_argument(
+        "--output",
+        help="Also write the report to this file"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Show the pipeline's own output"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        find_ffmpeg()
+    except FileNotFoundError as e:
+        sys.exit(f"ffmpeg is required to run the benchmarks: {e}")
+
+    reports = {
+        name: run_scenario(name, SCENARIOS[name], args.runs, not args.no_pipeline, args.verbose)
+        for name in args.scenario or sorted(SCENARIOS)
+    }
+    print(json.dumps(reports, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        for name, report in reports.items():
+            baseline[name] = {"seconds": report["seconds"], "stages": report["stages"], "throughput": report["throughput"]}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressions = []
+    for name, report in reports.items():
+        if name not in baseline:
+            print(f"No baseline for scenario {name}")
+            continue
+        print(f"{name}: {report['seconds']['median']:.3f}s, baseline {baseline[name]['seconds']['median']:.3f}s")
+        regressions += compare(report, baseline[name], args.tolerance, args.min_seconds)
+    if regressions:
+        print("Slower than the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from typing import List, Dict
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Each command runs in a fresh interpreter, so the timings include interpreter start.
+COMMANDS = {
+    "import_main": [sys.executable, "-c", "import main"],
+    "cli_help": [sys.executable, os.path.join(SRC_DIR, "main.py"), "--help"],
+    "service_help": [sys.executable, os.path.join(SRC_DIR, "service.py"), "--help"],
+}
+
+def measure(command: List[str], runs: int) -> Dict[str, float]:
+
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, env=env, cwd=SRC_DIR, check=True, capture_output=True)
+        timings.append(time.perf_counter() - started)
+    return {"median": statistics.median(timings), "max": max(timings), "runs": runs}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the CLI entry points")
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Runs per command"
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=1.0,
+        help="Fail if any command's median time exceeds this"
+    )
+
+    args = parser.parse_args()
+
+    report = {name: measure(command, args.runs) for name, command in COMMANDS.items()}
+    print(json.dumps(report, indent=2))
+
+    slow = [name for name, timing in report.items() if timing["median"] > args.max_seconds]
+    if slow:
+        print(f"Slower than {args.max_seconds}s: {', '.join(slow)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import tempfile
+import functools
+import threading
+from typing import Optional, Dict, Any
+
+@functools.lru_cache(maxsize=256)
+def _file_sha256(path: str, size: int, mtime_ns: int) -> str:
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_hash(path: str) -> str:
+    # SHA-256 of the file, memoized by (path, size, mtime) so each input is read once.
+
+    stat = os.stat(path)
+    return _file_sha256(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+class ArtifactStore:
+    # Checkpoints of pipeline stages (scene lists, scene descriptions, narratives),
+    # each keyed by a hash of everything the stage's output depends on: the input
+    # video's content and the stage's settings, or the key of the stage it was built
+    # from. Keyframes are stored once each, addressed by their own SHA-256. The
+    # least recently used files are evicted once the store outgrows max_bytes.
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = sum(os.path.getsize(path) for path in self._entries())
+
+    def key(self, stage: str, inputs: Dict[str, Any]) -> str:
+
+        settings = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def _path(self, stage: str, key: str, extension: str) -> str:
+        return os.path.join(self.directory, stage, key[:2], f"{key}{extension}")
+
+    def _entries(self):
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".part"):
+                    yield os.path.join(root, name)
+
+    def _read(self, path: str) -> Optional[bytes]:
+
+        with self._lock:
+            try:
+                os.utime(path)
+                with open(path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+
+    def get_json(self, stage: str, key: str) -> Optional[Any]:
+
+        data = self._read(self._path(stage, key, ".json"))
+        try:
+            return json.loads(data) if data is not None else None
+        except ValueError:
+            return None
+
+    def put_json(self, stage: str, key: str, value: Any) -> None:
+        self._write(self._path(stage, key, ".json"), json.dumps(value).encode("utf-8"))
+
+    def put_blob(self, data: bytes) -> str:
+        # Stores data under its SHA-256, which is returned.
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path("blobs", digest, "")
+        with self._lock:
+            try:
+                # Already stored; it counts as used again.
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+        self._write(path, data)
+        return digest
+
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        return self._read(self._path("blobs", digest, ""))
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.exists(self._path("blobs", digest, ""))
+
+    def _write(self, path: str, data: bytes) -> None:
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so readers never see a partial file.
+        fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except Exception:
+            os.remove(partial_path)
+            raise
+
+        with self._lock:
+            # A file already stored under this name is replaced, not added to.
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(partial_path, path)
+            self._total_bytes += len(data) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Removes least recently used files until the store fits in max_bytes.
+
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+
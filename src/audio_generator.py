@@ -1,134 +1,254 @@
 import os
-import warnings
-warnings.filterwarnings("ignore", message="Couldn't find ffmpeg or avconv*", category=RuntimeWarning)
+import json
+import time
+import random
+import threading
+import contextvars
 from typing import List, Dict, Any
-import subprocess
-from elevenlabs import ElevenLabs, VoiceSettings
-import shutil
-from pydub import AudioSegment
-import requests
-import zipfile
-
-def ensure_ffmpeg():
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    tools_dir = os.path.join(project_root, "tools")
-    os.makedirs(tools_dir, exist_ok=True)
-    ffmpeg_path = os.path.join(tools_dir, "ffmpeg.exe")
-    ffprobe_path = os.path.join(tools_dir, "ffprobe.exe")
-    if not (os.path.exists(ffmpeg_path) and os.path.exists(ffprobe_path)):
-        ffmpeg_url = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
-        zip_path = os.path.join(tools_dir, "ffmpeg.zip")
-        try:
-            response = requests.get(ffmpeg_url, stream=True)
-            response.raise_for_status()
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(tools_dir)
-            extracted_dir = os.path.join(tools_dir, "ffmpeg-master-latest-win64-gpl", "bin")
-            shutil.move(os.path.join(extracted_dir, "ffmpeg.exe"), ffmpeg_path)
-            shutil.move(os.path.join(extracted_dir, "ffprobe.exe"), ffprobe_path)
-            shutil.rmtree(os.path.join(tools_dir, "ffmpeg-master-latest-win64-gpl"))
-            os.remove(zip_path)
-        except Exception as e:
-            print(f"Error downloading ffmpeg: {e}")
-            raise
-    if not os.path.exists(ffmpeg_path):
-        raise FileNotFoundError(f"ffmpeg.exe not found at {ffmpeg_path}")
-    if not os.path.exists(ffprobe_path):
-        raise FileNotFoundError(f"ffprobe.exe not found at {ffprobe_path}")
-    AudioSegment.converter = ffmpeg_path
-    AudioSegment.ffprobe = ffprobe_path
-
-ensure_ffmpeg()
+from concurrent.futures import ThreadPoolExecutor
 
 from narrative_generator import NarrativeSegment
+from tts_cache import TTSCache, normalize_text
+from audio_mixer import TimelineMixer, timeline_path
+from toolchain import find_ffmpeg
+import instrumentation
+
+class SegmentSynthesisError(RuntimeError):
+    def __init__(self, failures: List[Dict[str, Any]]):
+        self.failures = failures
+        details = "; ".join(f"segment {f['index']} ({f['start_time']:.2f}s): {f['error']}" for f in failures)
+        super().__init__(f"Failed to generate audio for {len(failures)} segment(s): {details}")
 
 class AudioGenerator:
-    def __init__(self):
-        api_key = os.environ.get("ELEVEN_API_KEY")
-        if not api_key:
+    def __init__(self, max_concurrency: int = None, tts_cache: TTSCache = None):
+        self.api_key = os.environ.get("ELEVEN_API_KEY")
+        if not self.api_key:
             raise ValueError("ELEVEN_API_KEY environment variable not set")
-        self.client = ElevenLabs(api_key=api_key)
+        # The SDK is imported and the client built on first use.
+        self._client = None
+        self._client_lock = threading.Lock()
         self.voice_id = os.environ.get("ELEVEN_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+        self.model_id = os.environ.get("ELEVEN_MODEL_ID", "eleven_monolingual_v1")
         self.stability = float(os.environ.get("ELEVEN_STABILITY", "0.5"))
         self.similarity_boost = float(os.environ.get("ELEVEN_SIMILARITY_BOOST", "0.75"))
+        self.max_concurrency = max_concurrency or int(os.environ.get("ELEVEN_MAX_CONCURRENCY", "4"))
+        # The SDK doesn't retry streamed responses, so rate-limited and failed requests are retried here.
+        self.max_retries = int(os.environ.get("ELEVEN_MAX_RETRIES", "3"))
+        # Caps concurrent ElevenLabs requests across every job sharing this generator.
+        self._request_slots = threading.BoundedSemaphore(max(1, self.max_concurrency))
+        self.sample_rate = int(os.environ.get("NARRATION_SAMPLE_RATE", "44100"))
+        self.mix_block_seconds = float(os.environ.get("NARRATION_MIX_BLOCK_SECONDS", "30"))
+        cache_dir = os.environ.get("NARRATION_CACHE_DIR", "cache")
+        if tts_cache is None and cache_dir:
+            tts_cache = TTSCache(
+                os.path.join(cache_dir, "tts"),
+                max_bytes=int(os.environ.get("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+            )
+        self.tts_cache = tts_cache
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                from elevenlabs import ElevenLabs
+                self._client = ElevenLabs(api_key=self.api_key)
+            return self._client
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
     def generate_audio(self, narrative_segments: List[NarrativeSegment], temp_dir: str = None) -> str:
         if not narrative_segments:
             raise ValueError("No narrative segments provided")
+        return self.start_synthesis(temp_dir).finish(narrative_segments)
+    def start_synthesis(self, temp_dir: str = None) -> "SpeculativeSynthesis":
+        # Starts synthesizing segments before the final narrative is known; see
+        # SpeculativeSynthesis.
         if temp_dir is None:
             temp_dir = os.path.abspath("temp_audio")
         os.makedirs(temp_dir, exist_ok=True)
-        segment_files = []
-        for i, segment in enumerate(narrative_segments):
+        return SpeculativeSynthesis(self, temp_dir)
+    def _synthesize_segment(self, index: int, segment: NarrativeSegment, temp_dir: str, name: str = None) -> Dict[str, Any]:
+        segment_path = os.path.join(temp_dir, f"{name or f'segment_{index}'}.mp3")
+        segment_file = {
+            "path": segment_path,
+            "start_time": segment.start_time,
+            "end_time": segment.end_time,
+            "duration": segment.duration,
+            "cached": False
+        }
+        cache_key = None
+        if self.tts_cache:
+            cache_key = self.tts_cache.key(
+                segment.text, self.voice_id, self.model_id, self.stability, self.similarity_boost
+            )
+            if self.tts_cache.get(cache_key, segment_path):
+                print(f"Reused cached audio for segment {index+1}")
+                instrumentation.count("tts_cache.hits")
+                return dict(segment_file, cached=True)
+            instrumentation.count("tts_cache.misses")
+        # Chunks are written as they arrive; the file only appears once complete. The
+        # request slot is held until the download finishes.
+        partial_path = segment_path + ".part"
+        from elevenlabs import VoiceSettings
+        attempt = 0
+        while True:
             try:
-                audio = self.client.text_to_speech.convert(
-                            voice_id=self.voice_id,
-                            model_id="eleven_monolingual_v1",
-                            text=segment.text,
-                            voice_settings=VoiceSettings(
-                                stability=self.stability,
-                                similarity_boost=self.similarity_boost
+                with self._request_slots, instrumentation.request("elevenlabs.tts"):
+                    instrumentation.count("elevenlabs.bytes_sent", len(segment.text.encode("utf-8")))
+                    audio = self.client.text_to_speech.convert(
+                                voice_id=self.voice_id,
+                                model_id=self.model_id,
+                                text=segment.text,
+                                voice_settings=VoiceSettings(
+                                    stability=self.stability,
+                                    similarity_boost=self.similarity_boost
+                                )
                             )
-                        )
-                segment_path = os.path.join(temp_dir, f"segment_{i}.wav")
-                with open(segment_path, "wb") as f:
-                    data = b"".join(chunk for chunk in audio)
-                    f.write(data)
-                segment_files.append({
-                    "path": segment_path,
-                    "start_time": segment.start_time,
-                    "end_time": segment.end_time,
-                    "duration": segment.duration
-                })
-                print(f"Generated audio for segment {i+1}/{len(narrative_segments)}")
+                    with open(partial_path, "wb", buffering=1024 * 1024) as f:
+                        for chunk in audio:
+                            f.write(chunk)
+                            instrumentation.count("elevenlabs.bytes_received", len(chunk))
+                break
             except Exception as e:
-                print(f"Error generating audio for segment {i}: {str(e)}")
-        output_path = os.path.join(temp_dir, "narration.wav")
-        self._combine_audio_segments(segment_files, output_path)
-        return output_path
+                delay = _retry_delay(e, attempt, self.max_retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                instrumentation.count("elevenlabs.retries")
+                print(f"Retrying audio for segment {index+1} in {delay:.2f}s: {str(e)[:200]}")
+                time.sleep(delay)
+        os.replace(partial_path, segment_path)
+        if cache_key:
+            self.tts_cache.put(cache_key, segment_path)
+        print(f"Generated audio for segment {index+1}")
+        return segment_file
     def _combine_audio_segments(self, segment_files: List[Dict[str, Any]], output_path: str) -> None:
-        try:
-            segment_files.sort(key=lambda x: x["start_time"])
-            if not segment_files:
-                raise ValueError("No audio segments to combine")
-            for segment in segment_files:
-                if not os.path.exists(segment['path']):
-                    raise FileNotFoundError(f"Segment file not found: {segment['path']}")
-            temp_dir = os.path.dirname(output_path)
-            file_list_path = os.path.join(temp_dir, "file_list.txt")
-            with open(file_list_path, "w") as f:
-                for segment in segment_files:
-                    abs_path = os.path.abspath(segment['path'])
-                    f.write(f"file '{abs_path}'\n")
-            with open(file_list_path, 'r') as f:
-                print("File list contents:")
-                print(f.read())
-            ffmpeg_path = AudioSegment.converter
-            if not os.path.exists(ffmpeg_path):
-                raise FileNotFoundError(f"ffmpeg not found at {ffmpeg_path}")
-            ffmpeg_cmd = [
-                ffmpeg_path, "-y",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", file_list_path,
-                "-c", "copy",
-                output_path
-            ]
-            result = subprocess.run(
-                ffmpeg_cmd,
-                check=True,
-                capture_output=True,
-                text=True
+        if not segment_files:
+            raise ValueError("No audio segments to combine")
+        for segment in segment_files:
+            if not os.path.exists(segment['path']):
+                raise FileNotFoundError(f"Segment file not found: {segment['path']}")
+        # Each clip is decoded once and placed at its segment's start time, with silence
+        # in between, so the narration stays aligned with the video however long it runs.
+        mixer = TimelineMixer(
+            ffmpeg_path=find_ffmpeg(),
+            sample_rate=self.sample_rate,
+            block_seconds=self.mix_block_seconds
+        )
+        with instrumentation.stage("mix"):
+            duration = mixer.mix(
+                segment_files,
+                output_path,
+                min_duration=max(segment["end_time"] for segment in segment_files)
             )
-            os.remove(file_list_path)
-        except subprocess.CalledProcessError as e:
-            if segment_files:
-                shutil.copy(segment_files[0]["path"], output_path)
-                print(f"Used fallback: copied first segment to {output_path}")
-        except Exception as e:
-            print(f"Error combining audio segments: {e}")
-            if segment_files:
-                shutil.copy(segment_files[0]["path"], output_path)
-                print(f"Used fallback: copied first segment to {output_path}")
+        # Records which clip sits where, so edited segments can later be spliced into
+        # the track without mixing it again.
+        write_timeline(output_path, segment_files, self.sample_rate, duration)
+        print(f"Combined {len(segment_files)} audio segments into {duration:.2f}s narration track")
+def _retry_delay(error: Exception, attempt: int, max_retries: int):
+    # Seconds to wait before retrying a failed TTS request, or None if it shouldn't be:
+    # only rate limits, timeouts and server errors are retried, with exponential
+    # backoff, and never sooner than the response asks. Up to 20% jitter keeps
+    # concurrent requests that were limited together from retrying together.
+    status = getattr(error, "status_code", None)
+    if attempt >= max_retries or status is None or (status < 500 and status not in (408, 429)):
+        return None
+    headers = getattr(error, "headers", None) or {}
+    delay = 0.5 * 2 ** attempt
+    try:
+        if headers.get("retry-after-ms"):
+            delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+        elif headers.get("retry-after"):
+            delay = max(delay, float(headers["retry-after"]))
+    except ValueError:
+        pass
+    return min(delay, 60.0) * (1 + 0.2 * random.random())
+class SpeculativeSynthesis:
+    # Synthesizes narration segments as they stream out of the narrative completion,
+    # before the final script is known. finish() (or collect(), which leaves the
+    # clips unmixed) checks the final segments against the ones already submitted:
+    # a clip whose text still matches is kept (and moved to the final timing if that
+    # changed); any other clip is discarded and its segment synthesized again.
+    def __init__(self, generator: AudioGenerator, temp_dir: str):
+        self.generator = generator
+        self.temp_dir = temp_dir
+        self.submitted = []  # (segment, future)
+        self.cache_stats = {"hits": 0, "misses": 0}  # for the final segments only
+        self._executor = ThreadPoolExecutor(max_workers=max(1, generator.max_concurrency))
+    def submit(self, segment: NarrativeSegment) -> None:
+        index = len(self.submitted)
+        self.submitted.append((segment, self._executor.submit(
+            contextvars.copy_context().run, self.generator._synthesize_segment, index, segment, self.temp_dir
+        )))
+    def cancel(self) -> None:
+        # Drops all pending work, e.g. when the narrative could not be generated.
+        self._executor.shutdown(wait=True, cancel_futures=True)
+    def finish(self, narrative_segments: List[NarrativeSegment]) -> str:
+        segment_files = self.collect(narrative_segments)
+        output_path = os.path.join(self.temp_dir, "narration.wav")
+        self.generator._combine_audio_segments(segment_files, output_path)
+        return output_path
+    def collect(self, narrative_segments: List[NarrativeSegment], on_clip=None) -> List[Dict[str, Any]]:
+        # Waits for a clip of every final segment, without mixing them into a track:
+        # each clip's dict has its "path" plus the segment's fields. on_clip, if given,
+        # is called with each clip in order as soon as it and every clip before it
+        # are final.
+        try:
+            jobs = []
+            invalidated = 0
+            for i, segment in enumerate(narrative_segments):
+                if i < len(self.submitted) and normalize_text(self.submitted[i][0].text) == normalize_text(segment.text):
+                    jobs.append(self.submitted[i][1])
+                    continue
+                name = None
+                if i < len(self.submitted):
+                    # The stale clip may still be downloading, so the new one gets its own file.
+                    self.submitted[i][1].cancel()
+                    invalidated += 1
+                    name = f"segment_{i}_final"
+                jobs.append(self._executor.submit(
+                    contextvars.copy_context().run, self.generator._synthesize_segment, i, segment, self.temp_dir, name
+                ))
+            for _, future in self.submitted[len(narrative_segments):]:
+                future.cancel()
+                invalidated += 1
+            if self.submitted:
+                print(f"Speculative TTS: {len(self.submitted) - invalidated} of {len(self.submitted)} segments kept, {invalidated} invalidated")
+            # Segments are reassembled by start time; any segment that fails is
+            # reported instead of being left out of the track.
+            segment_files = []
+            failures = []
+            for i, (segment, future) in enumerate(zip(narrative_segments, jobs)):
+                try:
+                    segment_file = future.result()
+                except Exception as e:
+                    print(f"Error generating audio for segment {i}: {str(e)}")
+                    failures.append({"index": i, "start_time": segment.start_time, "error": str(e)})
+                    continue
+                self.cache_stats["hits" if segment_file["cached"] else "misses"] += 1
+                segment_files.append(dict(segment_file, **segment.model_dump()))
+                if on_clip and not failures:
+                    on_clip(segment_files[-1])
+        finally:
+            self.cancel()
+        if self.generator.tts_cache:
+            stats = self.generator.tts_cache.stats()
+            print(f"TTS cache: {stats['hits']} hits, {stats['misses']} misses")
+        if failures:
+            raise SegmentSynthesisError(failures)
+        return segment_files
+def write_timeline(
+    track_path: str,
+    segment_files: List[Dict[str, Any]],
+    sample_rate: int,
+    duration: float,
+    source_video: str = None
+) -> None:
+    fields = list(NarrativeSegment.model_fields) + ["clip_seconds"]
+    timeline = {
+        "sample_rate": sample_rate,
+        "duration": duration,
+        "source_video": source_video,
+        "clips": [{field: segment[field] for field in fields} for segment in segment_files]
+    }
+    with open(timeline_path(track_path), "w") as f:
+        json.dump(timeline, f, indent=2)
@@ -0,0 +1,199 @@
+import os
+import wave
+import struct
+import subprocess
+from typing import List, Dict, Any, Optional, Tuple, Callable
+import numpy as np
+
+import instrumentation
+
+def timeline_path(track_path: str) -> str:
+    # Where the clip placements of a mixed track are recorded.
+    return os.path.splitext(track_path)[0] + "_timeline.json"
+
+class TimelineMixer:
+    # Places each narration clip at its segment start on a silent timeline and writes
+    # the result as a 16-bit PCM WAV. The timeline is produced block by block, so
+    # memory use is one block plus the clips that overlap it, whatever the length.
+
+    def __init__(
+        self,
+        ffmpeg_path: str = "ffmpeg",
+        sample_rate: int = 44100,
+        channels: int = 1,
+        block_seconds: float = 30.0
+    ):
+
+        self.ffmpeg_path = ffmpeg_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = max(1, int(block_seconds * sample_rate))
+
+    def decode(self, path: str) -> np.ndarray:
+        # Returns the clip as int16 samples shaped (frames, channels).
+
+        with instrumentation.request("ffmpeg.decode"):
+            result = subprocess.run(
+                [
+                    self.ffmpeg_path, "-v", "error",
+                    "-i", path,
+                    "-f", "s16le",
+                    "-acodec", "pcm_s16le",
+                    "-ac", str(self.channels),
+                    "-ar", str(self.sample_rate),
+                    "-"
+                ],
+                capture_output=True
+            )
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to decode audio clip {path}: {result.stderr.decode(errors='replace').strip()}")
+        return np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, self.channels)
+
+    def mix(self, clips: List[Dict[str, Any]], output_path: str, min_duration: Optional[float] = None) -> float:
+        # clips are dicts with "path" and "start_time". The track lasts until the end
+        # of the last clip, or min_duration if that is longer. Returns the duration.
+        # Each clip's decoded length is recorded in it as "clip_seconds".
+
+        clips = sorted(clips, key=lambda clip: clip["start_time"])
+        min_frames = int(round((min_duration or 0.0) * self.sample_rate))
+
+        next_clip = 0
+        active = []  # (start_frame, samples) of decoded clips not yet fully written
+        block = np.zeros((self.block_frames, self.channels), dtype=np.int32)
+        written = 0
+
+        with wave.open(output_path, "wb") as output:
+            output.setnchannels(self.channels)
+            output.setsampwidth(2)
+            output.setframerate(self.sample_rate)
+
+            while True:
+                block_end = written + self.block_frames
+                while next_clip < len(clips) and clips[next_clip]["start_time"] * self.sample_rate < block_end:
+                    start_frame = max(0, int(round(clips[next_clip]["start_time"] * self.sample_rate)))
+                    samples = self.decode(clips[next_clip]["path"])
+                    clips[next_clip]["clip_seconds"] = len(samples) / self.sample_rate
+                    active.append((start_frame, samples))
+                    next_clip += 1
+
+                end_frame = max([min_frames] + [start + len(samples) for start, samples in active])
+                if next_clip >= len(clips) and written >= end_frame:
+                    break
+                if next_clip >= len(clips):
+                    block_end = min(block_end, end_frame)
+
+                block[:] = 0
+                for start, samples in active:
+                    lo = max(start, written)
+                    hi = min(start + len(samples), block_end)
+                    if lo < hi:
+                        block[lo - written:hi - written] += samples[lo - start:hi - start]
+
+                frames = block_end - written
+                output.writeframes(np.clip(block[:frames], -32768, 32767).astype("<i2").tobytes())
+                written = block_end
+                active = [(start, samples) for start, samples in active if start + len(samples) > written]
+
+        return written / self.sample_rate
+
+    def splice(
+        self,
+        track_path: str,
+        clips: List[Dict[str, Any]],
+        windows: List[Tuple[float, float]],
+        duration: float
+    ) -> None:
+        # Re-renders the (start, end) windows, in seconds, of a track written by mix(),
+        # in place, from the clips that overlap them, and resizes the track to
+        # duration. Outside the windows the track is left as it is, so the windows
+        # must cover every clip added or removed since it was mixed; clips that only
+        # partly overlap a window must be passed in too.
+
+        frame_bytes = 2 * self.channels
+        total_frames = int(round(duration * self.sample_rate))
+
+        with open(track_path, "r+b") as f:
+            data_offset, data_size = _find_data_chunk(f)
+            old_frames = data_size // frame_bytes
+            if total_frames != old_frames:
+                f.seek(data_offset + min(old_frames, total_frames) * frame_bytes)
+                f.truncate()
+                silence = bytes(self.block_frames * frame_bytes)
+                for start in range(old_frames, total_frames, self.block_frames):
+                    f.write(silence[:(min(start + self.block_frames, total_frames) - start) * frame_bytes])
+                data_size = total_frames * frame_bytes
+                f.seek(4)
+                f.write(struct.pack("<I", data_offset - 8 + data_size))
+                f.seek(data_offset - 4)
+                f.write(struct.pack("<I", data_size))
+
+            placed = []
+            for clip in clips:
+                samples = self.decode(clip["path"])
+                clip["clip_seconds"] = len(samples) / self.sample_rate
+                placed.append((max(0, int(round(clip["start_time"] * self.sample_rate))), samples))
+
+            for window_start, window_end in windows:
+                lo = max(0, int(round(window_start * self.sample_rate)))
+                hi = min(total_frames, int(round(window_end * self.sample_rate)))
+                for block_start in range(lo, hi, self.block_frames):
+                    block_end = min(block_start + self.block_frames, hi)
+                    block = np.zeros((block_end - block_start, self.channels), dtype=np.int32)
+                    for start, samples in placed:
+                        a = max(start, block_start)
+                        b = min(start + len(samples), block_end)
+                        if a < b:
+                            block[a - block_start:b - block_start] += samples[a - start:b - start]
+                    f.seek(data_offset + block_start * frame_bytes)
+                    f.write(np.clip(block, -32768, 32767).astype("<i2").tobytes())
+
+class StreamingMix:
+    # Builds the same track as TimelineMixer.mix() from clips that arrive one at a
+    # time, and hands it to write() as raw 16-bit PCM, in order, as far as it is
+    # final. Only the clips still overlapping what is left to write are kept.
+
+    def __init__(self, mixer: TimelineMixer, write: Callable[[bytes], None]):
+
+        self.mixer = mixer
+        self.write = write
+        self.written = 0
+        self.active = []  # (start_frame, samples)
+
+    def add(self, clip: Dict[str, Any]) -> None:
+
+        samples = self.mixer.decode(clip["path"])
+        clip["clip_seconds"] = len(samples) / self.mixer.sample_rate
+        self.active.append((max(0, int(round(clip["start_time"] * self.mixer.sample_rate))), samples))
+
+    def advance(self, seconds: float) -> None:
+        # Writes the track up to seconds. Every clip that starts before then must
+        # have been added.
+
+        end_frame = int(round(seconds * self.mixer.sample_rate))
+        while self.written < end_frame:
+            block_end = min(self.written + self.mixer.block_frames, end_frame)
+            block = np.zeros((block_end - self.written, self.mixer.channels), dtype=np.int32)
+            for start, samples in self.active:
+                lo = max(start, self.written)
+                hi = min(start + len(samples), block_end)
+                if lo < hi:
+                    block[lo - self.written:hi - self.written] += samples[lo - start:hi - start]
+            self.write(np.clip(block, -32768, 32767).astype("<i2").tobytes())
+            self.written = block_end
+            self.active = [(start, samples) for start, samples in self.active if start + len(samples) > self.written]
+
+def _find_data_chunk(f) -> Tuple[int, int]:
+    # Returns the offset and size of the sample data in a RIFF/WAVE file.
+
+    f.seek(0)
+    header = f.read(12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"data":
+            return f.tell(), size
+        f.seek(size + (size & 1), os.SEEK_CUR)
@@ -0,0 +1,166 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional, Dict
+
+def perceptual_hash(image_data: bytes) -> Optional[int]:
+    # 64-bit DCT hash: the sign of the lowest 8x8 frequencies of a 32x32 grayscale
+    # thumbnail relative to their median. Re-encoded or slightly altered copies of an
+    # image land within a few bits of each other.
+
+    # Imported here so that loading the cache doesn't load OpenCV.
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+
+    thumbnail = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(thumbnail)[:8, :8].flatten()
+    bits = low_frequencies > np.median(low_frequencies)
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    # SQLite integers are signed 64-bit.
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+# The hash is indexed in BANDS bands of 8 bits. Two hashes within d < BANDS bits of
+# each other agree exactly on at least one of any d + 1 bands, so near matches are
+# looked up by band instead of by scanning every entry.
+BANDS = 8
+
+def _bands(phash: int):
+    return [((phash & 0xFFFFFFFFFFFFFFFF) >> (8 * i)) & 0xFF for i in range(BANDS)]
+
+class DescriptionCache:
+    # Scene descriptions keyed by (model, prompt version, perceptual hash), at most
+    # one per key. The total size is tracked as entries are added and evicted, so a
+    # put doesn't sum the table; it is read from the file once, when it is opened.
+
+    def __init__(self, path: str, max_distance: int = 4, max_bytes: int = 64 * 1024 * 1024):
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_distance = max_distance
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.create_function("hamming", 2, _hamming, deterministic=True)
+        band_columns = [f"b{i}" for i in range(BANDS)]
+        with self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(descriptions)")]
+            if columns and band_columns[0] not in columns:
+                # A cache written before the bands were indexed is started afresh.
+                self._conn.execute("DROP TABLE descriptions")
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS descriptions (
+                    id INTEGER PRIMARY KEY,
+                    phash INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    {", ".join(f"{column} INTEGER NOT NULL" for column in band_columns)},
+                    UNIQUE (model, prompt_version, phash)
+                )
+            """)
+            for column in band_columns:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS descriptions_{column} ON descriptions (model, prompt_version, {column})"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS descriptions_last_used ON descriptions (last_used)"
+            )
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM descriptions").fetchone()[0]
+
+    def get(self, phash: int, model: str, prompt_version: str) -> Optional[str]:
+        # Returns the description of the closest cached image within max_distance bits.
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, description FROM descriptions WHERE model = ? AND prompt_version = ? AND phash = ?",
+                (model, prompt_version, phash)
+            ).fetchone()
+            if row is None and 0 < self.max_distance < BANDS:
+                # Within max_distance bits, one of any max_distance + 1 bands matches.
+                bands = _bands(phash)[:self.max_distance + 1]
+                candidates = self._conn.execute(
+                    " UNION ".join(
+                        f"SELECT id, description, phash FROM descriptions WHERE model = ? AND prompt_version = ? AND b{i} = ?"
+                        for i in range(len(bands))
+                    ),
+                    [value for i, band in enumerate(bands) for value in (model, prompt_version, band)]
+                ).fetchall()
+                distance, row = min(
+                    ((_hamming(phash, candidate[2]), candidate[:2]) for candidate in candidates),
+                    default=(None, None)
+                )
+                if distance is not None and distance > self.max_distance:
+                    row = None
+            elif row is None and self.max_distance >= BANDS:
+                row = self._conn.execute(
+                    "SELECT id, description FROM descriptions "
+                    "WHERE model = ? AND prompt_version = ? AND hamming(phash, ?) <= ? "
+                    "ORDER BY hamming(phash, ?) LIMIT 1",
+                    (model, prompt_version, phash, self.max_distance, phash)
+                ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            with self._conn:
+                self._conn.execute("UPDATE descriptions SET last_used = ? WHERE id = ?", (time.time(), row[0]))
+            self.hits += 1
+            return row[1]
+
+    def put(self, phash: int, model: str, prompt_version: str, description: str) -> None:
+
+        size = len(description.encode("utf-8"))
+        with self._lock:
+            with self._conn:
+                replaced = self._conn.execute(
+                    "SELECT size FROM descriptions WHERE model = ? AND prompt_version = ? AND phash = ?",
+                    (model, prompt_version, phash)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO descriptions "
+                    f"(phash, model, prompt_version, description, size, last_used, {', '.join(f'b{i}' for i in range(BANDS))}) "
+                    f"VALUES ({', '.join('?' * (6 + BANDS))})",
+                    (phash, model, prompt_version, description, size, time.time(), *_bands(phash))
+                )
+                self._total += size - (replaced[0] if replaced else 0)
+                self._evict()
+
+    def _evict(self) -> None:
+        # Drops least recently used entries until the cache fits in max_bytes.
+
+        if self._total <= self.max_bytes:
+            return
+
+        expired = []
+        for entry_id, size in self._conn.execute("SELECT id, size FROM descriptions ORDER BY last_used"):
+            if self._total <= self.max_bytes:
+                break
+            expired.append((entry_id,))
+            self._total -= size
+        self._conn.executemany("DELETE FROM descriptions WHERE id = ?", expired)
+
+    def stats(self) -> Dict[str, int]:
+
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._total}
@@ -0,0 +1,475 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import contextvars
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+class Download:
+    # A fetch into the download cache that may still be in progress. Readers can wait
+    # for a byte offset to arrive, so the file can be read while it downloads.
+
+    def __init__(self, url: str, key: str, path: str):
+
+        self.url = url
+        self.key = key
+        self.path = path
+        self.partial_path = path + ".part"
+        self.size: Optional[int] = None  # None until known, or if the server doesn't say
+        self.received = 0
+        self.from_cache = False
+        self.resumed = False
+        self.validator: Optional[str] = None  # the ETag, or else Last-Modified, of the content
+        self.error: Optional[Exception] = None
+        self._started = False
+        self._done = False
+        self._condition = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def wait_started(self, timeout: Optional[float] = None) -> None:
+        # Blocks until the response headers are in (or the cached copy was confirmed),
+        # raising if the request failed.
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._started or self._done, timeout):
+                raise TimeoutError(f"No response for {self.url}")
+        if self.error is not None:
+            raise self.error
+
+    def wait(self, timeout: Optional[float] = None) -> str:
+        # Blocks until the whole file is in the cache and returns its path.
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._done, timeout):
+                raise TimeoutError(f"Download of {self.url} did not finish")
+        if self.error is not None:
+            raise self.error
+        return self.path
+
+    def wait_for_bytes(self, offset: int) -> bool:
+        # Blocks until the first `offset` bytes are on disk or the download has ended.
+        # Returns whether they are available.
+
+        with self._condition:
+            self._condition.wait_for(lambda: self.received >= offset or self._done)
+            return self.received >= offset
+
+    def open(self):
+        # The handle stays valid after the partial file is renamed into place.
+
+        with self._condition:
+            return open(self.path if self._done else self.partial_path, "rb")
+
+    def _begin(self, size: Optional[int], offset: int) -> None:
+
+        with self._condition:
+            self.size = size
+            self.received = offset
+            self._started = True
+            self._condition.notify_all()
+
+    def _advance(self, length: int) -> None:
+
+        with self._condition:
+            self.received += length
+            self._condition.notify_all()
+
+    def _finish(self, error: Optional[Exception] = None) -> None:
+
+        with self._condition:
+            if error is None:
+                if os.path.exists(self.partial_path):
+                    os.replace(self.partial_path, self.path)
+                self.size = self.received = os.path.getsize(self.path)
+            self.error = error
+            self._done = True
+            self._condition.notify_all()
+
+class DownloadCache:
+    # Local copies of remote videos, keyed by URL. A cached copy is revalidated with
+    # its ETag/Last-Modified, so fetching an unchanged source again costs one
+    # conditional request. Interrupted transfers resume with range requests, both
+    # within a fetch and from a partial file left by an earlier run. While a file is
+    # downloading, stream_url() serves it over loopback HTTP with range support, so
+    # OpenCV and scenedetect can read what has arrived and wait for the rest.
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 10 * 1024 * 1024 * 1024,
+        chunk_size: int = 1024 * 1024,
+        retries: int = 3,
+        timeout: float = 30.0,
+        session: Optional[requests.Session] = None
+    ):
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.session = session or _make_session(retries)
+        self.hits = 0
+        self.misses = 0
+        self.resumes = 0
+        self._lock = threading.Lock()
+        self._active: Dict[str, Download] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, url: str) -> str:
+
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if not re.fullmatch(r"\.[a-z0-9]{1,5}", extension):
+            extension = ".mp4"
+        return os.path.join(self.directory, key[:2], f"{key}{extension}")
+
+    def start(self, url: str) -> Download:
+        # Starts fetching url in the background. A fetch of the same URL that is
+        # already running is shared rather than started twice.
+
+        key = self.key(url)
+        with self._lock:
+            download = self._active.get(key)
+            if download is not None:
+                return download
+            download = Download(url, key, self._path(key, url))
+            self._active[key] = download
+
+        # The fetch is profiled as part of the run that started it.
+        thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run, download), name="download", daemon=True
+        )
+        thread.start()
+        return download
+
+    def fetch(self, url: str) -> str:
+        return self.start(url).wait()
+
+    def _run(self, download: Download) -> None:
+
+        try:
+            with instrumentation.request("download"):
+                self._fetch(download)
+            if not download.from_cache:
+                # Room is made before the new file lands, so the cache never overshoots.
+                self._evict(keep=download.path, incoming=download.received)
+            error = None
+        except Exception as e:
+            error = e
+        download._finish(error)
+        # Once finished, the download is forgotten; the stream serves the file from the
+        # cache directory instead.
+        with self._lock:
+            self._active.pop(download.key, None)
+            if error is None and download.from_cache:
+                self.hits += 1
+            elif error is None:
+                self.misses += 1
+        if error is None:
+            instrumentation.count("download_cache.hits" if download.from_cache else "download_cache.misses")
+
+    def _fetch(self, download: Download) -> None:
+
+        os.makedirs(os.path.dirname(download.path), exist_ok=True)
+        meta = _read_meta(download.path)
+        validator = meta.get("etag") or meta.get("last_modified")
+        headers = {"Accept-Encoding": "identity"}
+        offset = 0
+
+        if meta.get("complete") and os.path.exists(download.path):
+            # Revalidate the cached copy; without validators it can't be trusted.
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        elif validator and os.path.exists(download.partial_path):
+            offset = os.path.getsize(download.partial_path)
+
+        attempts = 0
+        while True:
+            request_headers = dict(headers)
+            if offset:
+                request_headers["Range"] = f"bytes={offset}-"
+                if validator:
+                    request_headers["If-Range"] = validator
+            try:
+                with self.session.get(
+                    download.url, headers=request_headers, stream=True, timeout=self.timeout
+                ) as response:
+                    if response.status_code == 304:
+                        os.utime(download.path)
+                        download.from_cache = True
+                        download.validator = validator
+                        return
+                    if response.status_code == 416 and offset:
+                        # The partial file is no use; start over.
+                        os.remove(download.partial_path)
+                        offset = 0
+                        continue
+                    response.raise_for_status()
+                    self._receive(download, response, offset)
+                    return
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                # Resume from what is already on disk if the server supports ranges.
+                attempts += 1
+                resumable = download.received > 0 and (validator or download.size is not None)
+                if attempts > self.retries or not resumable:
+                    raise
+                print(f"Download of {download.url} interrupted at {download.received} bytes, resuming: {str(e)}")
+                instrumentation.count("download.retries")
+                offset = download.received
+                meta = _read_meta(download.path)
+                validator = meta.get("etag") or meta.get("last_modified")
+                headers.pop("If-None-Match", None)
+                headers.pop("If-Modified-Since", None)
+
+    def _receive(self, download: Download, response: requests.Response, offset: int) -> None:
+
+        if response.status_code == 206 and offset:
+            match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != offset:
+                raise requests.ConnectionError(f"Unexpected Content-Range for {download.url}")
+            size = int(match.group(2)) if match.group(2) != "*" else None
+            mode = "ab"
+            download.resumed = True
+            meta = _read_meta(download.path)
+            download.validator = meta.get("etag") or meta.get("last_modified")
+            with self._lock:
+                self.resumes += 1
+        else:
+            # A full response, either a fresh fetch or because the source changed since
+            # the partial file was written.
+            length = response.headers.get("Content-Length")
+            size = int(length) if length and length.isdigit() else None
+            offset = 0
+            mode = "wb"
+            download.validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            _write_meta(download.path, {
+                "url": download.url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "size": size,
+                "complete": False
+            })
+
+        with open(download.partial_path, mode, buffering=self.chunk_size) as f:
+            download._begin(size, offset)
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                f.write(chunk)
+                f.flush()
+                download._advance(len(chunk))
+                instrumentation.count("download.bytes_received", len(chunk))
+
+        if size is not None and download.received < size:
+            raise requests.ConnectionError(
+                f"Connection closed after {download.received} of {size} bytes"
+            )
+
+        meta = _read_meta(download.path)
+        meta.update({"size": download.received, "complete": True})
+        _write_meta(download.path, meta)
+
+    def stream_url(self, download: Download) -> str:
+        # A loopback URL that serves the download while it is still arriving.
+
+        with self._lock:
+            if self._server is None:
+                self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_stream_handler(self))
+                self._server.daemon_threads = True
+                thread = threading.Thread(
+                    target=self._server.serve_forever, name="download-stream", daemon=True
+                )
+                thread.start()
+            port = self._server.server_address[1]
+        return f"http://127.0.0.1:{port}/{os.path.basename(download.path)}"
+
+    def _streamed(self, name: str) -> Optional[Download]:
+        # The download behind a stream URL's file name: the one in progress, or else a
+        # finished one for the file already in the cache.
+
+        key = os.path.splitext(name)[0]
+        with self._lock:
+            download = self._active.get(key)
+        if download is not None:
+            return download
+        path = os.path.join(self.directory, key[:2], name)
+        if not re.fullmatch(r"[0-9a-f]{64}\.[a-z0-9]{1,5}", name) or not os.path.exists(path):
+            return None
+        download = Download(None, key, path)
+        download._finish()
+        return download
+
+    def close(self) -> None:
+
+        with self._lock:
+            server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def _entries(self):
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith((".json", ".part")):
+                    yield os.path.join(root, name)
+
+    def _evict(self, keep: str, incoming: int = 0) -> None:
+        # Removes least recently used videos until the cache, plus `incoming` bytes,
+        # fits in max_bytes. Videos still being downloaded are kept.
+
+        with self._lock:
+            busy = {download.path for download in self._active.values()}
+
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = incoming + sum(size for _, size, path in entries if path != keep)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path in busy:
+                continue
+            for stale in (path, _meta_path(path)):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "resumes": self.resumes}
+
+def _make_session(retries: int) -> requests.Session:
+    # One pooled session for all downloads. Connection failures and gateway errors
+    # before the body starts are retried here; interrupted bodies are resumed by
+    # DownloadCache.
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=retries,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"])
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+def _read_meta(path: str) -> Dict[str, Any]:
+
+    try:
+        with open(_meta_path(path), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+
+    partial_path = _meta_path(path) + ".part"
+    with open(partial_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(partial_path, _meta_path(path))
+
+def _make_stream_handler(cache: DownloadCache):
+
+    class DownloadStreamHandler(BaseHTTPRequestHandler):
+        # Serves GET/HEAD with single byte ranges. Bytes that haven't arrived yet are
+        # waited for rather than reported missing.
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def _serve(self, send_body: bool):
+
+            try:
+                download = cache._streamed(os.path.basename(self.path.split("?")[0]))
+            except FileNotFoundError:
+                download = None
+            if download is None:
+                return self.send_error(404)
+            try:
+                download.wait_started()
+                if download.size is None:
+                    # Without a length there is nothing to seek against, so wait for it all.
+                    download.wait()
+            except Exception as e:
+                return self.send_error(502, str(e))
+
+            size = download.size
+            start, end = 0, size - 1
+            match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start = max(0, size - int(match.group(2)))
+                if start >= size or start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            if not send_body:
+                return
+
+            try:
+                with download.open() as f:
+                    f.seek(start)
+                    position = start
+                    while position <= end:
+                        wanted = min(position + cache.chunk_size, end + 1)
+                        if not download.wait_for_bytes(wanted):
+                            return  # the download failed; the reader sees a short body
+                        data = f.read(wanted - position)
+                        if not data:
+                            return
+                        self.wfile.write(data)
+                        position += len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Readers drop the connection when they seek elsewhere.
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return DownloadStreamHandler
@@ -0,0 +1,240 @@
+import os
+import math
+import subprocess
+from typing import List, Dict, Any, Tuple
+
+from narrative_generator import NarrativeSegment
+from audio_mixer import TimelineMixer, StreamingMix
+from output_renderer import format_vtt_time
+from toolchain import find_ffmpeg
+import instrumentation
+
+MASTER_PLAYLIST = "master.m3u8"
+VIDEO_PLAYLIST = "video.m3u8"
+AUDIO_PLAYLIST = "audio.m3u8"
+SUBTITLE_PLAYLIST = "subtitles.m3u8"
+
+# Bit rate the master playlist declares for the narration audio rendition.
+AUDIO_BANDWIDTH = 192000
+
+def _write_atomically(path: str, text: str) -> None:
+    # Players poll the playlists, so they must never see one half written.
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+class HLSPackage:
+    # An HLS presentation of the narrated video: fMP4 segments of the video stream,
+    # copied; an audio rendition of the narration mixed over the ducked soundtrack;
+    # and WebVTT subtitle segments of the narrative. The video is segmented up front,
+    # at its keyframes. The narration is mixed as its clips arrive and piped to one
+    # ffmpeg encoder, which writes the audio playlist as each segment is encoded.
+    # Video and subtitle segments are published, in playlists of type EVENT, once
+    # the narration up to their end is final, so players can start before the last
+    # clips are synthesized.
+
+    def __init__(
+        self,
+        renderer,
+        narrative: List[NarrativeSegment],
+        video_path: str,
+        duration: float,
+        package_dir: str,
+        has_audio: bool = True
+    ):
+
+        self.renderer = renderer
+        self.narrative = narrative
+        self.video_path = video_path
+        self.duration = duration
+        self.package_dir = package_dir
+        self.has_audio = has_audio
+        self.segments: List[Tuple[float, float, str]] = []  # (start, end, file name) of each video segment
+        self.published = 0
+        self.received = 0
+        self.outputs: Dict[str, str] = {}
+        self._encoder = None
+        self._mix = None
+
+    def start(self) -> None:
+
+        os.makedirs(self.package_dir, exist_ok=True)
+        self._segment_video()
+        self._write_master_playlist()
+
+        # The narration arrives as mono 16-bit PCM on stdin, as far as it is final.
+        ffmpeg_cmd = [find_ffmpeg(), "-y", "-v", "error"]
+        if self.has_audio:
+            ffmpeg_cmd += ["-i", self.video_path]
+        ffmpeg_cmd += [
+            # Without probing, the encoder starts on the first samples written.
+            "-probesize", "32", "-analyzeduration", "0",
+            "-f", "s16le", "-ar", str(self.renderer.sample_rate), "-ac", "1", "-i", "pipe:0"
+        ]
+        narration = f"[{int(self.has_audio)}:a]{self.renderer._audio_format()}"
+        if self.has_audio:
+            # Outlasts the soundtrack, which decides where the mix ends.
+            narration += ",apad"
+        ffmpeg_cmd += [
+            "-filter_complex", self.renderer._ducking_filtergraph([], narration, self.has_audio, 1),
+            "-map", "[out0]",
+            "-c:a", self.renderer.audio_codec,
+            "-avoid_negative_ts", "make_zero",
+            "-f", "hls",
+            "-hls_time", str(self.renderer.hls_segment_seconds),
+            "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "audio_init.mp4",
+            "-hls_segment_filename", os.path.join(self.package_dir, "audio_%03d.m4s"),
+            os.path.join(self.package_dir, AUDIO_PLAYLIST)
+        ]
+        self._encoder = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        mixer = TimelineMixer(ffmpeg_path=find_ffmpeg(), sample_rate=self.renderer.sample_rate)
+        self._mix = StreamingMix(mixer, self._write_narration)
+        # Whatever comes before the first narration is final already.
+        self._advance()
+
+    def add_clip(self, clip: Dict[str, Any]) -> None:
+        # Takes the clips of the narrative's segments in order, and publishes
+        # whatever they complete.
+
+        self._mix.add(clip)
+        self.received += 1
+        self._advance()
+
+    def finish(self) -> Dict[str, str]:
+        # Returns the paths written: the script, the master playlist and the package
+        # directory.
+
+        with instrumentation.stage("render"):
+            self.received = len(self.narrative)
+            self._mix.advance(self.duration)
+            with instrumentation.request("ffmpeg.encode"):
+                _, stderr = self._encoder.communicate()
+            if self._encoder.returncode != 0:
+                raise RuntimeError(f"Failed to encode the narration audio: {stderr.decode(errors='replace').strip()}")
+            self._publish(complete=True)
+            self.outputs.update({
+                "playlist": os.path.join(self.package_dir, MASTER_PLAYLIST),
+                "hls_dir": self.package_dir
+            })
+            return self.outputs
+
+    def abort(self) -> None:
+
+        if self._encoder and self._encoder.poll() is None:
+            self._encoder.kill()
+            self._encoder.wait()
+
+    def _advance(self) -> None:
+        # The track is final up to where the next clip still to come starts.
+
+        final = min([segment.start_time for segment in self.narrative[self.received:]] + [self.duration])
+        self._mix.advance(max(0.0, final))
+        self._publish()
+
+    def _write_narration(self, data: bytes) -> None:
+
+        try:
+            self._encoder.stdin.write(data)
+            self._encoder.stdin.flush()
+        except BrokenPipeError:
+            self._encoder.wait()
+            raise RuntimeError(f"The narration audio encoder stopped: {self._encoder.stderr.read().decode(errors='replace').strip()}")
+
+    def _segment_video(self) -> None:
+        # Cuts the video stream into fMP4 segments, listed in a playlist that is only
+        # read for their durations.
+
+        staging = os.path.join(self.package_dir, ".video_segments.m3u8")
+        ffmpeg_cmd = [
+            find_ffmpeg(), "-y", "-v", "error",
+            "-i", self.video_path,
+            "-map", "0:v:0",
+            "-c:v", "copy",
+            # Sources that don't start at 0 are shifted to, so the segments' media
+            # time lines up with the narrative's times and the subtitles' timestamp map.
+            "-avoid_negative_ts", "make_zero",
+            "-f", "hls",
+            "-hls_time", str(self.renderer.hls_segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "video_init.mp4",
+            "-hls_segment_filename", os.path.join(self.package_dir, "video_%03d.m4s"),
+            staging
+        ]
+        with instrumentation.request("ffmpeg.segment"):
+            result = subprocess.run(ffmpeg_cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to segment {self.video_path}: {result.stderr.decode(errors='replace').strip()}")
+
+        start = 0.0
+        with open(staging, "r") as f:
+            lines = [line.strip() for line in f]
+        for i, line in enumerate(lines):
+            if line.startswith("#EXTINF:"):
+                end = start + float(line[len("#EXTINF:"):].split(",")[0])
+                self.segments.append((start, end, lines[i + 1]))
+                start = end
+        os.remove(staging)
+        if not self.segments:
+            raise RuntimeError(f"Segmenting {self.video_path} produced no video segments")
+
+    def _write_master_playlist(self) -> None:
+
+        # Peak bit rate of any video segment, plus the audio's.
+        bandwidth = AUDIO_BANDWIDTH + max(
+            os.path.getsize(os.path.join(self.package_dir, name)) * 8 / max(end - start, 0.001)
+            for start, end, name in self.segments
+        )
+        _write_atomically(os.path.join(self.package_dir, MASTER_PLAYLIST), "\n".join([
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="narration",NAME="Narration",DEFAULT=YES,AUTOSELECT=YES,URI="{AUDIO_PLAYLIST}"',
+            f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subtitles",NAME="Narration",DEFAULT=NO,AUTOSELECT=YES,URI="{SUBTITLE_PLAYLIST}"',
+            f'#EXT-X-STREAM-INF:BANDWIDTH={int(bandwidth)},AUDIO="narration",SUBTITLES="subtitles"',
+            VIDEO_PLAYLIST
+        ]) + "\n")
+
+    def _publish(self, complete: bool = False) -> None:
+        # Writes the subtitle segments the narration now covers, then lists them and
+        # their video segments.
+
+        written = self._mix.written / self.renderer.sample_rate if self._mix else 0.0
+        while self.published < len(self.segments) and (complete or self.segments[self.published][1] <= written + 1e-6):
+            self._write_subtitle_segment(self.published)
+            self.published += 1
+
+        target = math.ceil(max([end - start for start, end, _ in self.segments] + [1.0]))
+        for playlist, name_of in (
+            (VIDEO_PLAYLIST, lambda i: self.segments[i][2]),
+            (SUBTITLE_PLAYLIST, lambda i: f"subtitles_{i:03d}.vtt")
+        ):
+            lines = [
+                "#EXTM3U",
+                "#EXT-X-VERSION:7",
+                f"#EXT-X-TARGETDURATION:{target}",
+                "#EXT-X-MEDIA-SEQUENCE:0",
+                "#EXT-X-PLAYLIST-TYPE:EVENT"
+            ]
+            if playlist == VIDEO_PLAYLIST:
+                lines.append('#EXT-X-MAP:URI="video_init.mp4"')
+            for i in range(self.published):
+                start, end, _ = self.segments[i]
+                lines += [f"#EXTINF:{end - start:.6f},", name_of(i)]
+            if complete:
+                lines.append("#EXT-X-ENDLIST")
+            _write_atomically(os.path.join(self.package_dir, playlist), "\n".join(lines) + "\n")
+
+    def _write_subtitle_segment(self, index: int) -> None:
+        # Cues are repeated in every segment they overlap. The video and audio
+        # segments are written with their media time starting at 0, as the cue times
+        # do, whatever the source's start time.
+
+        start, end, _ = self.segments[index]
+        lines = ["WEBVTT", "X-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000", ""]
+        for segment in self.narrative:
+            if segment.start_time < end and segment.end_time > start:
+                lines += [f"{format_vtt_time(segment.start_time)} --> {format_vtt_time(segment.end_time)}", segment.text, ""]
+        with open(os.path.join(self.package_dir, f"subtitles_{index:03d}.vtt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
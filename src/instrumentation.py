@@ -0,0 +1,188 @@
+import re
+import time
+import bisect
+import threading
+import contextlib
+import contextvars
+from typing import List, Dict, Any, Optional, Iterator
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# The RunProfile of the run being processed in this context, if it is profiled.
+_current: contextvars.ContextVar[Optional["RunProfile"]] = contextvars.ContextVar("run_profile", default=None)
+
+class RunProfile:
+    # What one run spent its time on: wall and CPU time per stage, a latency
+    # histogram per kind of external request (OpenAI, ElevenLabs, ffmpeg, downloads),
+    # and counters for bytes, retries and cache hits. Stages of a pipelined run
+    # overlap, and CPU time is the whole process's while the stage ran, so neither
+    # adds up to the run's total.
+
+    def __init__(self):
+
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, wall_seconds: float, cpu_seconds: float) -> None:
+
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            stage["count"] += 1
+            stage["wall_seconds"] += wall_seconds
+            stage["cpu_seconds"] += cpu_seconds
+
+    def observe(self, name: str, seconds: float, error: bool = False) -> None:
+
+        with self._lock:
+            request = self.requests.setdefault(name, {
+                "count": 0, "errors": 0, "sum_seconds": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)
+            })
+            request["count"] += 1
+            request["errors"] += int(error)
+            request["sum_seconds"] += seconds
+            request["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def count(self, name: str, value: float = 1) -> None:
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> Dict[str, Any]:
+        # A JSON-ready copy. Each request's histogram maps bucket upper bounds to the
+        # number of requests that took at most that long, as Prometheus counts them.
+
+        with self._lock:
+            requests = {}
+            for name, request in self.requests.items():
+                cumulative = 0
+                histogram = {}
+                for bound, n in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], request["buckets"]):
+                    cumulative += n
+                    histogram[bound] = cumulative
+                requests[name] = {
+                    "count": request["count"],
+                    "errors": request["errors"],
+                    "sum_seconds": round(request["sum_seconds"], 6),
+                    "mean_seconds": round(request["sum_seconds"] / request["count"], 6),
+                    "buckets": histogram
+                }
+            return {
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "requests": requests,
+                "counters": dict(self.counters)
+            }
+
+def current() -> Optional[RunProfile]:
+    return _current.get()
+
+@contextlib.contextmanager
+def profiling(profile: Optional[RunProfile] = None) -> Iterator[RunProfile]:
+    # Yields a RunProfile (profile, or a new one) that records everything measured in
+    # this context. Work handed to other threads is included if it runs in a copy
+    # of this context (contextvars.copy_context().run).
+
+    profile = profile if profile is not None else RunProfile()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+@contextlib.contextmanager
+def request(name: str) -> Iterator[None]:
+    # Times one external request; one that raises is counted as an error.
+
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        profile.observe(name, time.perf_counter() - started, error)
+
+def count(name: str, value: float = 1) -> None:
+
+    profile = _current.get()
+    if profile is not None:
+        profile.count(name, value)
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Sums the reports of several runs, e.g. every job of a batch.
+
+    merged = {"stages": {}, "requests": {}, "counters": {}}
+    for report in reports:
+        for name, stage in report["stages"].items():
+            total = merged["stages"].setdefault(name, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            for key in total:
+                total[key] += stage[key]
+        for name, request in report["requests"].items():
+            total = merged["requests"].setdefault(name, {
+                "count": 0, "errors": 0, "sum_seconds": 0.0, "buckets": dict.fromkeys(request["buckets"], 0)
+            })
+            for key in ("count", "errors", "sum_seconds"):
+                total[key] += request[key]
+            for bound, n in request["buckets"].items():
+                total["buckets"][bound] += n
+            total["mean_seconds"] = total["sum_seconds"] / total["count"]
+        for name, value in report["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+    return merged
+
+def _metric_name(name: str) -> str:
+    return "narration_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def to_prometheus(report: Dict[str, Any]) -> str:
+    # Renders a report in the Prometheus text exposition format.
+
+    lines = [
+        "# HELP narration_stage_wall_seconds Wall time spent in each pipeline stage.",
+        "# TYPE narration_stage_wall_seconds counter"
+    ]
+    lines += [f'narration_stage_wall_seconds{{stage="{name}"}} {stage["wall_seconds"]}' for name, stage in report["stages"].items()]
+    lines += [
+        "# HELP narration_stage_cpu_seconds Process CPU time while each pipeline stage ran.",
+        "# TYPE narration_stage_cpu_seconds counter"
+    ]
+    lines += [f'narration_stage_cpu_seconds{{stage="{name}"}} {stage["cpu_seconds"]}' for name, stage in report["stages"].items()]
+
+    lines += [
+        "# HELP narration_request_seconds Latency of external requests.",
+        "# TYPE narration_request_seconds histogram"
+    ]
+    for name, request in report["requests"].items():
+        for bound, n in request["buckets"].items():
+            lines.append(f'narration_request_seconds_bucket{{request="{name}",le="{bound}"}} {n}')
+        lines.append(f'narration_request_seconds_sum{{request="{name}"}} {request["sum_seconds"]}')
+        lines.append(f'narration_request_seconds_count{{request="{name}"}} {request["count"]}')
+    lines += [
+        "# HELP narration_request_errors_total External requests that failed.",
+        "# TYPE narration_request_errors_total counter"
+    ]
+    lines += [f'narration_request_errors_total{{request="{name}"}} {request["errors"]}' for name, request in report["requests"].items()]
+
+    for name, value in sorted(report["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
@@ -6,85 +6,495 @@ import tempfile
 import time
 import shutil
 from pathlib import Path
-from typing import Dict, Optional, Union, List
+from typing import Callable, Dict, Optional, Union, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from video_handler import VideoInputHandler
-from scene_analyzer import SceneAnalyzer
-from narrative_generator import VisualNarrativeGenerator
-from audio_generator import AudioGenerator
-from output_renderer import OutputRenderer, OutputFormat
+from output_renderer import OutputFormat, MUX_CONTAINERS
+from prompt_budget import TokenUsage
+import instrumentation
 
-load_dotenv()
+# Built on first use by load_components, so importing this module and --help don't
+# load OpenCV, scenedetect or the API clients. Any of them can be replaced beforehand.
+input_handler = None
+scene_analyzer = None
+narrative_generator = None
+audio_generator = None
+output_renderer = None
+artifact_store = None
+_components_lock = threading.Lock()
+_workspace_lock = threading.Lock()
 
-input_handler = VideoInputHandler()
-scene_analyzer = SceneAnalyzer()
-narrative_generator = VisualNarrativeGenerator()
-audio_generator = AudioGenerator()
-output_renderer = OutputRenderer()
+def _setting(value: Optional[float], env_var: str, default: float, cast=int, minimum: float = 0):
+    # An explicit value, or else the environment's, validated the same way either way.
+
+    if value is None:
+        raw = os.environ.get(env_var, "").strip()
+        try:
+            value = cast(raw) if raw else default
+        except ValueError:
+            raise ValueError(f"{env_var} must be a number, not {raw!r}")
+    if value < minimum:
+        raise ValueError(f"{env_var} must be at least {minimum}, not {value}")
+    return value
+
+def load_components(
+    frame_skip: Optional[int] = None,
+    detect_width: Optional[int] = None,
+    scene_workers: Optional[int] = None,
+    scene_threshold: Optional[float] = None
+) -> None:
+    # The scene analyzer settings default to SCENE_FRAME_SKIP, SCENE_DETECT_WIDTH
+    # (0: automatic), SCENE_WORKERS and SCENE_THRESHOLD. They only apply when the
+    # analyzer is built, on the first call.
+    global input_handler, scene_analyzer, narrative_generator, audio_generator, output_renderer, artifact_store
+    
+    with _components_lock:
+        load_dotenv()
+        if input_handler is None:
+            from video_handler import VideoInputHandler
+            input_handler = VideoInputHandler()
+        if scene_analyzer is None:
+            from scene_analyzer import SceneAnalyzer
+            scene_analyzer = SceneAnalyzer(
+                threshold=_setting(scene_threshold, "SCENE_THRESHOLD", 27.0, float),
+                frame_skip=_setting(frame_skip, "SCENE_FRAME_SKIP", 0),
+                detect_width=_setting(detect_width, "SCENE_DETECT_WIDTH", 0) or None,
+                workers=_setting(scene_workers, "SCENE_WORKERS", 1, minimum=1)
+            )
+        if narrative_generator is None:
+            from narrative_generator import VisualNarrativeGenerator
+            narrative_generator = VisualNarrativeGenerator()
+        if audio_generator is None:
+            from audio_generator import AudioGenerator
+            audio_generator = AudioGenerator()
+        if output_renderer is None:
+            from output_renderer import OutputRenderer
+            output_renderer = OutputRenderer()
+        cache_dir = os.environ.get("NARRATION_CACHE_DIR", "cache")
+        if artifact_store is None and cache_dir:
+            from artifact_store import ArtifactStore
+            artifact_store = ArtifactStore(
+                os.path.join(cache_dir, "artifacts"),
+                max_bytes=_setting(None, "ARTIFACT_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+            )
+
+class _RunCheckpoints:
+    # One run's view of the artifact store. A stage's key hashes everything its output
+    # depends on: the video's identity and the analyzer settings for scenes, and the
+    # previous stage's key plus the stage's own settings after that. Only complete
+    # results are saved; a placeholder for a failed API call is never reused. stages
+    # records, for the run summary, whether each stage was a hit, a miss (computed)
+    # or skipped.
+
+    def __init__(self, store, resume: bool, video_id: Callable[[], Optional[str]], video_metadata):
+
+        self.store = store
+        self.resume = resume and store is not None
+        self.stages = {"scenes": "skipped", "descriptions": "skipped", "narrative": "skipped"}
+        self.video_id = video_id
+        self.video_metadata = video_metadata
+        self._keys = {}
+
+    def key(self, stage: str) -> str:
+        # Computed when a checkpoint is first loaded or saved, so identifying the
+        # video, which for some URLs means waiting for the download, never holds up
+        # the start of a run that does not resume.
+
+        if not self._keys:
+            self._keys["scenes"] = self.store.key("scenes", {
+                "video": self.video_id(),
+                "analyzer": scene_analyzer.artifact_params()
+            })
+            self._keys["descriptions"] = self.store.key("descriptions", {
+                "scenes": self._keys["scenes"],
+                "vision": narrative_generator.vision_params()
+            })
+            self._keys["narrative"] = self.store.key("narrative", {
+                "descriptions": self._keys["descriptions"],
+                "narrator": narrative_generator.narrative_params(),
+                "duration": self.video_metadata.duration
+            })
+        return self._keys[stage]
+
+    def load(self, stage: str):
+
+        if not self.resume:
+            return None
+        value = self.store.get_json(stage, self.key(stage))
+        if stage == "scenes" and value is not None and not all(
+            self.store.has_blob(record["keyframe_sha256"]) for record in value if record.get("keyframe_sha256")
+        ):
+            # Some of its keyframes were evicted, so the scenes are detected again.
+            value = None
+        if value is not None:
+            self.stages[stage] = "hit"
+        return value
+
+    def computed(self, stage: str, value, complete: bool = True) -> None:
+
+        self.stages[stage] = "miss"
+        if self.store is not None and complete:
+            self.store.put_json(stage, self.key(stage), value)
+
+    def scene_record(self, scene) -> Dict:
+        # The scene without its keyframe, which is stored as a blob of its own.
+
+        record = scene.model_dump(exclude={"keyframe"})
+        record["keyframe_sha256"] = (
+            self.store.put_blob(scene.keyframe) if self.store is not None and scene.keyframe else None
+        )
+        return record
+
+    def scenes_from_records(self, records: List[Dict]) -> List:
+
+        from scene_analyzer import VideoScene
+        scenes = []
+        for record in records:
+            record = dict(record)
+            digest = record.pop("keyframe_sha256", None)
+            keyframe = self.store.get_blob(digest) if digest else None
+            scenes.append(VideoScene(**record, keyframe=keyframe or b""))
+        return scenes
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v"}
+
+def _make_unique_dir(parent: str, name: str) -> str:
+    # Jobs for videos with the same name can start within the same second.
+    Path(parent).mkdir(exist_ok=True, parents=True)
+    path = os.path.join(parent, name)
+    suffix = 1
+    while True:
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            suffix += 1
+            path = os.path.join(parent, f"{name}_{suffix}")
 
 def process_video(
     video_path: str,
     output_dir: str = "output",
     output_format: OutputFormat = OutputFormat.JSON,
-    mux_video: bool = False
+    mux_video: bool = False,
+    pipelined: bool = True,
+    resume: bool = False,
+    profile: bool = False,
+    single_pass: bool = False,
+    containers: Optional[List[str]] = None
 ) -> Dict:
+    # With profile, the result gets a "profile" report of where the run spent its
+    # time (see instrumentation.RunProfile), also written to profile.json in the
+    # run's output directory.
+    # With single_pass, the narration clips are mixed, ducked under the original
+    # soundtrack and muxed into the video in one ffmpeg run, once per container in
+    # containers (default mp4). No narration.wav is written, so the result can't be
+    # edited with renarrate. The HLS output format works the same way, writing an
+    # HLS package instead (see OutputRenderer.start_hls); mux_video, single_pass and
+    # containers don't apply to it.
+    
+    options = (output_format, mux_video, pipelined, resume, single_pass, containers)
+    if not profile:
+        return _process_video(video_path, output_dir, *options)
+    
+    with instrumentation.profiling() as run_profile:
+        with instrumentation.stage("run"):
+            result = _process_video(video_path, output_dir, *options)
+    result["profile"] = run_profile.report()
+    profile_path = os.path.join(result["output_dir"], "profile.json")
+    with open(profile_path, "w") as f:
+        json.dump(result["profile"], f, indent=2)
+    result["outputs"]["profile"] = profile_path
+    return result
+
+def _process_video(
+    video_path: str,
+    output_dir: str,
+    output_format: OutputFormat,
+    mux_video: bool,
+    pipelined: bool,
+    resume: bool,
+    single_pass: bool = False,
+    containers: Optional[List[str]] = None
+) -> Dict:
+    load_components()
+    
     video_name = os.path.splitext(os.path.basename(video_path))[0]
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    unique_output_dir = os.path.join(output_dir, f"{video_name}_{timestamp}")
-    Path(unique_output_dir).mkdir(exist_ok=True, parents=True)
+    unique_output_dir = _make_unique_dir(output_dir, f"{video_name}_{timestamp}")
     
-    temp_dir = os.path.join("temp_audio", f"{video_name}_{timestamp}")
-    os.makedirs(temp_dir, exist_ok=True)
+    # Each job gets its own workspace, so concurrent jobs never share temp files.
+    with _workspace_lock:
+        os.makedirs("temp_audio", exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=f"{video_name}_{timestamp}_", dir="temp_audio")
     
     try:
         print(f"Processing video: {video_path}")
         print(f"Output directory: {unique_output_dir}")
         print(f"Temp directory: {temp_dir}")
         
+        # Probed once; later stages take their timing from it rather than reopening the
+        # container. For URLs the path is the cached download, or a local stream of it
+        # while it is still arriving.
         video_metadata = input_handler.handle_input(video_path)
+        source_path = video_metadata.path
         
-        print("Detecting scenes...")
-        scenes = scene_analyzer.detect_scenes(video_path)
+        # Each stage is checkpointed in the artifact store. With resume, the latest stage
+        # already saved for these inputs is loaded and the stages before it are skipped.
+        checkpoints = _RunCheckpoints(
+            artifact_store,
+            resume,
+            lambda: input_handler.source_id(video_path),
+            video_metadata
+        )
+        narrative_record = checkpoints.load("narrative")
+        scene_descriptions = checkpoints.load("descriptions") if narrative_record is None else None
+        scene_records = (
+            checkpoints.load("scenes") if narrative_record is None and scene_descriptions is None else None
+        )
         
-        print("Generating narrative...")
-        narrative = narrative_generator.generate_narrative(scenes, video_metadata)
+        detected = {"scenes": 0}
+        # Tokens used by this video's OpenAI requests, apart from other jobs'.
+        token_usage = TokenUsage()
+        if narrative_record is not None:
+            print("Reusing checkpointed narrative...")
+            from narrative_generator import NarrativeSegment
+            narrative = [NarrativeSegment(**segment) for segment in narrative_record["segments"]]
+            detected["scenes"] = narrative_record["scenes"]
+            synthesis = audio_generator.start_synthesis(temp_dir)
+        else:
+            described_complete = True
+            if scene_descriptions is not None:
+                print("Reusing checkpointed scene descriptions...")
+                detected["scenes"] = len(scene_descriptions)
+            else:
+                if scene_records is not None:
+                    print("Reusing checkpointed scenes...")
+                    scenes = checkpoints.scenes_from_records(scene_records)
+                    detected["scenes"] = len(scenes)
+                elif pipelined:
+                    # Keyframes go to vision analysis as soon as each scene closes, so
+                    # decoding and API latency overlap.
+                    print("Detecting scenes and analyzing keyframes...")
+                    
+                    def scene_stream():
+                        records = []
+                        for scene in scene_analyzer.iter_scenes(source_path, video_metadata=video_metadata):
+                            detected["scenes"] += 1
+                            records.append(checkpoints.scene_record(scene))
+                            yield scene
+                        checkpoints.computed("scenes", records)
+                    
+                    scenes = scene_stream()
+                else:
+                    print("Detecting scenes...")
+                    scenes = scene_analyzer.detect_scenes(source_path, video_metadata)
+                    detected["scenes"] = len(scenes)
+                    checkpoints.computed("scenes", [checkpoints.scene_record(scene) for scene in scenes])
+                    print("Analyzing keyframes...")
+                
+                with narrative_generator.track_usage(token_usage):
+                    scene_descriptions, described_complete = narrative_generator.describe_scenes(scenes)
+                checkpoints.computed("descriptions", scene_descriptions, described_complete)
+            
+            print("Generating narrative...")
+            # When pipelined, narration segments go to TTS as soon as each one has
+            # streamed in; any that the final script changes are synthesized again.
+            synthesis = audio_generator.start_synthesis(temp_dir)
+            try:
+                with narrative_generator.track_usage(token_usage):
+                    narrative, complete = narrative_generator.narrate(
+                        scene_descriptions, video_metadata, on_segment=synthesis.submit if pipelined else None
+                    )
+            except Exception:
+                synthesis.cancel()
+                raise
+            checkpoints.computed(
+                "narrative",
+                {"scenes": detected["scenes"], "segments": [segment.model_dump() for segment in narrative]},
+                # A narrative told from placeholder descriptions isn't kept either.
+                complete and described_complete
+            )
         
-        print("Generating audio...")
-        audio_path = audio_generator.generate_audio(narrative, temp_dir)
-        
-        print("Rendering outputs...")
-        output_paths = output_renderer.generate_outputs(
-            narrative, 
-            audio_path, 
-            video_path if mux_video else None,
-            unique_output_dir,
-            output_format
-        )
+        if output_format == OutputFormat.HLS:
+            # Segments are published as the clips come in, so players can start while
+            # later ones are still being synthesized.
+            source_path = input_handler.local_path(video_path)
+            print(f"Publishing HLS package to {os.path.join(unique_output_dir, 'hls')}...")
+            try:
+                package = output_renderer.start_hls(
+                    narrative,
+                    source_path,
+                    video_metadata.duration,
+                    unique_output_dir,
+                    video_metadata.has_audio
+                )
+            except Exception:
+                synthesis.cancel()
+                raise
+            try:
+                with instrumentation.stage("audio"):
+                    synthesis.collect(narrative, on_clip=package.add_clip)
+                checkpoints.stages["audio"] = synthesis.cache_stats
+                output_paths = package.finish()
+            except Exception:
+                package.abort()
+                raise
+        else:
+            print("Generating audio...")
+            with instrumentation.stage("audio"):
+                if single_pass:
+                    clips = synthesis.collect(narrative)
+                else:
+                    audio_path = synthesis.finish(narrative)
+            checkpoints.stages["audio"] = synthesis.cache_stats
+            
+            # Also surfaces a download that failed after detection had read what it needed.
+            source_path = input_handler.local_path(video_path)
+            
+            print("Rendering outputs...")
+            if single_pass:
+                output_paths = output_renderer.render_single_pass(
+                    narrative,
+                    clips,
+                    source_path,
+                    video_metadata.duration,
+                    unique_output_dir,
+                    output_format,
+                    containers or ["mp4"],
+                    video_metadata.has_audio
+                )
+            else:
+                output_paths = output_renderer.generate_outputs(
+                    narrative, 
+                    audio_path, 
+                    source_path if mux_video else None,
+                    unique_output_dir,
+                    output_format
+                )
         
         result = {
             "metadata": video_metadata.model_dump(),
-            "scenes": len(scenes),
+            "scenes": detected["scenes"],
             "narrative_segments": len(narrative),
             "outputs": output_paths,
-            "output_dir": unique_output_dir
+            "output_dir": unique_output_dir,
+            "checkpoints": checkpoints.stages,
+            "token_usage": token_usage.summary(video_metadata.duration)
         }
         
         return result
         
     finally:
         try:
-            if os.path.exists("temp_audio"):
-                shutil.rmtree("temp_audio")
-                print("Cleaned up temp_audio directory")
+            shutil.rmtree(temp_dir)
+            print(f"Cleaned up {temp_dir}")
+        except Exception as e:
+            print(f"Warning: Failed to clean up {temp_dir}: {e}")
+        with _workspace_lock:
+            try:
+                # Removed only once no other job is using it.
+                os.rmdir("temp_audio")
+            except OSError:
+                pass
+
+def collect_videos(source: str) -> List[str]:
+    # A directory yields the video files directly inside it. Any other file is read as
+    # a manifest with one video path or URL per line; blank lines and # comments are
+    # skipped, and relative paths are resolved against the manifest's directory.
+    
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+        )
+    
+    videos = []
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r") as f:
+        for line in f:
+            entry = line.strip()
+            if not entry or entry.startswith("#"):
+                continue
+            if not entry.startswith(("http://", "https://")) and not os.path.isabs(entry):
+                entry = os.path.join(base_dir, entry)
+            videos.append(entry)
+    return videos
+
+def process_batch(
+    video_paths: List[str],
+    output_dir: str = "output",
+    output_format: OutputFormat = OutputFormat.JSON,
+    mux_video: bool = False,
+    pipelined: bool = True,
+    jobs: int = 2,
+    resume: bool = False,
+    profile: bool = False,
+    single_pass: bool = False,
+    containers: Optional[List[str]] = None
+) -> Dict:
+    # Runs up to `jobs` videos at once. All jobs share the module's clients and caches,
+    # and with them the OpenAI and ElevenLabs concurrency caps. A failed job is recorded
+    # in the summary without stopping the others. The summary is also written to
+    # output_dir/batch_summary_<timestamp>.json.
+    
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    started = time.perf_counter()
+    
+    def run(video_path: str) -> Dict:
+        job_started = time.perf_counter()
+        try:
+            result = process_video(
+                video_path, output_dir, output_format, mux_video, pipelined, resume, profile, single_pass, containers
+            )
+            return {
+                "video": video_path,
+                "status": "succeeded",
+                "seconds": time.perf_counter() - job_started,
+                "result": result
+            }
         except Exception as e:
-            print(f"Warning: Failed to clean up temp_audio directory: {e}")
+            print(f"Error processing {video_path}: {str(e)}")
+            return {
+                "video": video_path,
+                "status": "failed",
+                "seconds": time.perf_counter() - job_started,
+                "error": str(e)
+            }
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        job_results = list(executor.map(run, video_paths))
+    
+    succeeded = sum(1 for job in job_results if job["status"] == "succeeded")
+    summary = {
+        "videos": len(job_results),
+        "succeeded": succeeded,
+        "failed": len(job_results) - succeeded,
+        "seconds": time.perf_counter() - started,
+        "jobs": job_results
+    }
+    if profile:
+        # Summed over the videos that succeeded.
+        summary["profile"] = instrumentation.merge_reports(
+            [job["result"]["profile"] for job in job_results if job["status"] == "succeeded"]
+        )
+    
+    Path(output_dir).mkdir(exist_ok=True, parents=True)
+    summary_path = os.path.join(output_dir, f"batch_summary_{timestamp}.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    summary["summary_path"] = summary_path
+    
+    return summary
 
 def main():
+    load_dotenv()
+    
     parser = argparse.ArgumentParser(description="Video Narration Service")
     parser.add_argument(
         "video_path", 
-        help="Path to video file"
+        help="Path to video file (with --batch: a directory of videos or a manifest file)"
     )
     parser.add_argument(
         "--output-dir", 
@@ -93,30 +503,121 @@ def main():
     )
     parser.add_argument(
         "--format", 
-        choices=["json", "srt", "vtt"], 
+        choices=["json", "srt", "vtt", "hls"], 
         default="json",
-        help="Format for narration script"
+        help="Format for narration script (hls: a VTT script plus an HLS package of the narrated video)"
     )
     parser.add_argument(
         "--mux", 
         action="store_true", 
         help="Mux narration with original video"
     )
+    parser.add_argument(
+        "--single-pass", 
+        action="store_true", 
+        help="Mix, duck the original soundtrack and mux in one ffmpeg run, without writing narration.wav (implies --mux)"
+    )
+    parser.add_argument(
+        "--container", 
+        action="append",
+        choices=list(MUX_CONTAINERS),
+        help="With --single-pass, a container to write the narrated video to (repeatable; default: mp4)"
+    )
+    parser.add_argument(
+        "--no-pipeline", 
+        action="store_true", 
+        help="Run each stage to completion before starting the next"
+    )
+    parser.add_argument(
+        "--frame-skip", 
+        type=int, 
+        help="Fast scene detection: frames skipped between analyzed frames, with each cut then placed on its exact frame (default: SCENE_FRAME_SKIP or 0)"
+    )
+    parser.add_argument(
+        "--detect-width", 
+        type=int, 
+        help="Fast scene detection: approximate frame width the detector sees (default: SCENE_DETECT_WIDTH or 0, automatic)"
+    )
+    parser.add_argument(
+        "--scene-workers", 
+        type=int, 
+        help="Processes detecting scenes in separate time ranges of long videos (default: SCENE_WORKERS or 1)"
+    )
+    parser.add_argument(
+        "--resume", 
+        action="store_true", 
+        default=os.environ.get("NARRATION_RESUME", "0") == "1",
+        help="Reuse checkpointed scenes, descriptions and narrative from earlier runs on the same input"
+    )
+    parser.add_argument(
+        "--batch", 
+        action="store_true", 
+        help="Process every video in a directory or manifest"
+    )
+    parser.add_argument(
+        "--jobs", 
+        type=int, 
+        default=int(os.environ.get("NARRATION_BATCH_JOBS", "2")),
+        help="Number of videos processed at once in batch mode"
+    )
+    parser.add_argument(
+        "--profile", 
+        action="store_true", 
+        help="Report time per stage, request latencies, bytes transferred and cache hits (also saved as profile.json)"
+    )
+    parser.add_argument(
+        "--prometheus", 
+        metavar="PATH",
+        help="With --profile, also write the report in Prometheus text format to PATH"
+    )
     
     args = parser.parse_args()
     
+    try:
+        load_components(
+            frame_skip=args.frame_skip,
+            detect_width=args.detect_width,
+            scene_workers=args.scene_workers
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    
     output_format = {
         "json": OutputFormat.JSON,
         "srt": OutputFormat.SRT,
-        "vtt": OutputFormat.VTT
+        "vtt": OutputFormat.VTT,
+        "hls": OutputFormat.HLS
     }[args.format]
     
-    result = process_video(
-        args.video_path,
-        args.output_dir,
-        output_format,
-        args.mux
-    )
+    if args.batch:
+        result = process_batch(
+            collect_videos(args.video_path),
+            args.output_dir,
+            output_format,
+            args.mux,
+            not args.no_pipeline,
+            args.jobs,
+            args.resume,
+            args.profile,
+            args.single_pass,
+            args.container
+        )
+    else:
+        result = process_video(
+            args.video_path,
+            args.output_dir,
+            output_format,
+            args.mux,
+            not args.no_pipeline,
+            args.resume,
+            args.profile,
+            args.single_pass,
+            args.container
+        )
+    
+    if args.profile and args.prometheus and "profile" in result:
+        with open(args.prometheus, "w") as f:
+            f.write(instrumentation.to_prometheus(result["profile"]))
     
     print(json.dumps(result, indent=2))
 
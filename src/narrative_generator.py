@@ -1,15 +1,45 @@
 import os
 import base64
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Callable, TYPE_CHECKING
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
+import re
 import json
-import cv2
-import numpy as np
-from openai import OpenAI
+import contextlib
+import contextvars
 
-from scene_analyzer import VideoScene
-from video_handler import VideoMetadata
+if TYPE_CHECKING:
+    # Only needed for annotations; importing them would load OpenCV and scenedetect.
+    from scene_analyzer import VideoScene
+    from video_handler import VideoMetadata
+
+import instrumentation
+from description_cache import DescriptionCache, perceptual_hash
+from prompt_budget import SCENE_ENCODING_LEGEND, TokenUsage, encode_scenes, fit_descriptions, image_tokens
+
+# Bump whenever the keyframe analysis prompt changes, so cached descriptions
+# written with the old prompt are no longer used.
+VISION_PROMPT_VERSION = "1"
+
+# Bump whenever the storytelling prompt changes, so checkpointed narratives written
+# with the old prompt are no longer reused.
+NARRATIVE_PROMPT_VERSION = "3"
+
+# The TokenUsage of the run being processed in this context, if it is tracked.
+_run_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("run_usage", default=None)
+
+# Earlier windows whose summaries are given to each window of a windowed narrative,
+# so its prompt stays the same size however long the video is.
+SUMMARY_CONTEXT_WINDOWS = 3
+
+# Completion tokens allowed for each window's summary in an outline request, and
+# the windows outlined per request, which keeps its max_tokens at 4000.
+OUTLINE_TOKENS_PER_PART = 100
+OUTLINE_MAX_PARTS = 40
+
+VISION_SYSTEM_PROMPT = "You are a highly skilled filmmaker and storyteller. Describe what's happening in this image in detail, focusing on elements that would be important for creating a compelling narrative. Consider characters, actions, emotions, setting, and mood."
 
 class NarrativeSegment(BaseModel):
     start_time: float
@@ -18,26 +48,131 @@ class NarrativeSegment(BaseModel):
     text: str
     scene_idx: int
 
+class SegmentStreamParser:
+    # Picks complete objects out of the "segments" array of a JSON response that is
+    # still streaming in. feed() returns the objects completed by the new text.
+
+    def __init__(self):
+
+        self.buffer = ""
+        self.position = None  # just past the last complete segment, once the array is found
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+
+        self.buffer += text
+        if self.position is None:
+            match = re.search(r'"segments"\s*:\s*\[', self.buffer)
+            if not match:
+                return []
+            self.position = match.end()
+
+        completed = []
+        while True:
+            start = self.position
+            while start < len(self.buffer) and self.buffer[start] in " \t\r\n,":
+                start += 1
+            if start >= len(self.buffer) or self.buffer[start] != "{" or "}" not in self.buffer[start:]:
+                return completed
+            try:
+                segment, end = self._decoder.raw_decode(self.buffer, start)
+            except json.JSONDecodeError:
+                # The object is still incomplete.
+                return completed
+            completed.append(segment)
+            self.position = end
+
 class VisualNarrativeGenerator:
    
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        description_cache: Optional[DescriptionCache] = None,
+        image_detail: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        window_seconds: Optional[float] = None
+    ):
 
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
+        self.api_key = os.environ.get("OPENAI_API_KEY")
+        if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
         
-        self.client = OpenAI(api_key=api_key)
+        # The SDK is imported and the client built on first use.
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model = "gpt-4o"  
+        self.narrative_model = "gpt-4-turbo"
+        self.max_concurrency = max_concurrency or int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8"))
+        # Caps concurrent OpenAI requests across every job sharing this generator.
+        self._request_slots = threading.BoundedSemaphore(max(1, self.max_concurrency))
+        # "low", "high" or "auto": how many vision tokens each keyframe may use.
+        self.image_detail = image_detail or os.environ.get("OPENAI_IMAGE_DETAIL", "auto")
+        # Number of keyframes sent per vision request; 1 disables batching.
+        self.batch_size = batch_size or int(os.environ.get("OPENAI_VISION_BATCH_SIZE", "1"))
+        # Videos longer than this are narrated in windows of about this many seconds,
+        # generated concurrently; 0 always narrates the whole video in one request.
+        self.window_seconds = float(
+            window_seconds if window_seconds is not None else os.environ.get("NARRATIVE_WINDOW_SECONDS", "300")
+        )
+        # Scene descriptions in a narrative request are trimmed to fit this many tokens.
+        self.prompt_max_tokens = int(os.environ.get("NARRATIVE_PROMPT_MAX_TOKENS", "8000"))
+        # Tokens used by every request made through this generator.
+        self.token_usage = TokenUsage()
+        
+        cache_dir = os.environ.get("NARRATION_CACHE_DIR", "cache")
+        if description_cache is None and cache_dir:
+            description_cache = DescriptionCache(
+                os.path.join(cache_dir, "descriptions.sqlite"),
+                max_distance=int(os.environ.get("DESCRIPTION_CACHE_MAX_DISTANCE", "4"))
+            )
+        self.description_cache = description_cache
+    
+    @property
+    def client(self):
+
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key)
+            return self._client
     
-    def generate_narrative(self, scenes: List[VideoScene], video_metadata: VideoMetadata) -> List[NarrativeSegment]:
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+    
+    def generate_narrative(
+        self,
+        scenes: Iterable["VideoScene"],
+        video_metadata: "VideoMetadata",
+        on_segment: Optional[Callable[[NarrativeSegment], None]] = None
+    ) -> List[NarrativeSegment]:
+        
+        # scenes may be a generator such as SceneAnalyzer.iter_scenes; keyframes are
+        # analyzed as they arrive, while detection is still running. If on_segment is
+        # given, the narrative is streamed and each segment is passed to it as soon as
+        # it is complete. Those segments are provisional: the returned list is final.
+        scene_descriptions, _ = self.describe_scenes(scenes)
+        segments, _ = self.narrate(scene_descriptions, video_metadata, on_segment)
+        return segments
+    
+    def describe_scenes(self, scenes: Iterable["VideoScene"]) -> Tuple[List[Dict[str, Any]], bool]:
+        # Returns the scene descriptions the storytelling prompt is built from, and
+        # whether every keyframe was analyzed; a placeholder stands in for any that
+        # could not be.
+        
+        with instrumentation.stage("vision"):
+            described = self._describe_scenes(scenes)
+        
+        if self.description_cache:
+            stats = self.description_cache.stats()
+            print(f"Description cache: {stats['hits']} hits, {stats['misses']} misses")
         
         scene_descriptions = []
-        for i, scene in enumerate(scenes):
-            if not os.path.exists(scene.keyframe_path):
-                description = f"Scene {i+1} (unknown content)"
-            else:
-                description = self._analyze_frame(scene.keyframe_path, i)
-            
+        complete = True
+        for i, (scene, description) in enumerate(described):
+            if description is None:
+                complete = False
+                description = f"Scene {i+1} (analysis failed)"
             scene_descriptions.append({
                 "scene_idx": i,
                 "start_time": scene.start_time,
@@ -47,54 +182,256 @@ class VisualNarrativeGenerator:
                 "scene_type": scene.scene_type,
             })
         
-        return self._generate_storytelling_narrative(scene_descriptions, video_metadata)
+        return scene_descriptions, complete
+    
+    def narrate(
+        self,
+        scene_descriptions: List[Dict[str, Any]],
+        video_metadata: "VideoMetadata",
+        on_segment: Optional[Callable[[NarrativeSegment], None]] = None
+    ) -> Tuple[List[NarrativeSegment], bool]:
+        # Returns the narrative, and whether it is the model's rather than the
+        # scene-by-scene fallback used when the request fails.
+        windows = self._narrative_windows(scene_descriptions)
+        with instrumentation.stage("narrative"):
+            if len(windows) > 1:
+                return self._generate_windowed_narrative(windows, video_metadata, on_segment)
+            return self._generate_storytelling_narrative(scene_descriptions, video_metadata, on_segment)
+    
+    def vision_params(self) -> Dict[str, Any]:
+        # Everything besides the keyframes that describe_scenes' output depends on.
+        return {"model": self.model, "prompt_version": self._cache_prompt_version(), "batch_size": self.batch_size}
+    
+    def narrative_params(self) -> Dict[str, Any]:
+        # Everything besides the scene descriptions that narrate's output depends on.
+        return {
+            "model": self.narrative_model,
+            "prompt_version": NARRATIVE_PROMPT_VERSION,
+            "window_seconds": self.window_seconds,
+            "prompt_max_tokens": self.prompt_max_tokens
+        }
+    
+    @contextlib.contextmanager
+    def track_usage(self, usage: Optional[TokenUsage] = None):
+        # Yields a TokenUsage (usage, or a new one) that counts the requests made in
+        # this context, including those made on worker threads on its behalf, e.g.
+        # for one video of a batch.
+        
+        usage = usage if usage is not None else TokenUsage()
+        token = _run_usage.set(usage)
+        try:
+            yield usage
+        finally:
+            _run_usage.reset(token)
+    
+    def _describe_scenes(self, scenes: Iterable["VideoScene"]) -> List[Tuple["VideoScene", str]]:
+        
+        # Keyframes are analyzed concurrently; results are kept in scene order. At most
+        # twice max_concurrency requests are queued or running, so when the API falls
+        # behind, scenes stop being pulled from the input (and a streaming detector
+        # pauses) instead of piling up in memory. Keyframe bytes are dropped from the
+        # returned scenes once they have been submitted.
+        workers = max(1, self.max_concurrency)
+        in_flight = threading.BoundedSemaphore(2 * workers)
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            
+            def submit(fn, *args):
+                in_flight.acquire()
+                future = executor.submit(contextvars.copy_context().run, fn, *args)
+                future.add_done_callback(lambda _: in_flight.release())
+                return future
+            
+            described = []
+            # Each slot is a description, a future for one, or (future, position) for
+            # a keyframe sent as part of a batch.
+            slots = []
+            # Batched mode: cache misses from consecutive scenes share one request.
+            batch = []
+            
+            def flush_batch():
+                future = submit(self._analyze_frame_batch, list(batch))
+                for position, (scene_idx, _, _) in enumerate(batch):
+                    slots[scene_idx] = (future, position)
+                batch.clear()
+            
+            for i, scene in enumerate(scenes):
+                described.append(scene.model_copy(update={"keyframe": b""}))
+                if self.batch_size <= 1:
+                    slots.append(submit(self._describe_scene, i, scene))
+                    continue
+                
+                image_bytes = self._keyframe_bytes(scene)
+                if not image_bytes:
+                    slots.append(f"Scene {i+1} (unknown content)")
+                    continue
+                image_hash, cached = self._cached_description(image_bytes)
+                slots.append(cached)
+                if cached is None:
+                    batch.append((i, image_bytes, image_hash))
+                    if len(batch) >= self.batch_size:
+                        flush_batch()
+            
+            if batch:
+                flush_batch()
+            
+            descriptions = []
+            for slot in slots:
+                if isinstance(slot, tuple):
+                    descriptions.append(slot[0].result()[slot[1]])
+                elif isinstance(slot, str):
+                    descriptions.append(slot)
+                else:
+                    descriptions.append(slot.result())
+            return list(zip(described, descriptions))
+    
+    def _describe_scene(self, scene_idx: int, scene: "VideoScene") -> str:
+
+        image_bytes = self._keyframe_bytes(scene)
+        if not image_bytes:
+            return f"Scene {scene_idx+1} (unknown content)"
+        return self._analyze_frame(image_bytes, scene_idx)
+    
+    def _keyframe_bytes(self, scene: "VideoScene") -> bytes:
+
+        if scene.keyframe:
+            return scene.keyframe
+        if scene.keyframe_path and os.path.exists(scene.keyframe_path):
+            with open(scene.keyframe_path, "rb") as image_file:
+                return image_file.read()
+        return b""
     
-    def _analyze_frame(self, image_path: str, scene_idx: int) -> str:
+    def _cached_description(self, image_bytes: bytes) -> Tuple[Optional[int], Optional[str]]:
+
+        if not self.description_cache:
+            return None, None
+        image_hash = perceptual_hash(image_bytes)
+        if image_hash is None:
+            return None, None
+        description = self.description_cache.get(image_hash, self.model, self._cache_prompt_version())
+        instrumentation.count("description_cache.misses" if description is None else "description_cache.hits")
+        return image_hash, description
+    
+    def _cache_prompt_version(self) -> str:
+        # The detail level changes what the model sees, so it is part of the cache key.
+        return f"{VISION_PROMPT_VERSION}-{self.image_detail}"
+    
+    def _image_part(self, image_bytes: bytes) -> Dict[str, Any]:
+
+        image_data = base64.b64encode(image_bytes).decode('utf-8')
+        return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}", "detail": self.image_detail}}
+    
+    def _analyze_frame(self, image_bytes: bytes, scene_idx: int) -> str:
+
+        image_hash, cached = self._cached_description(image_bytes)
+        if cached is not None:
+            return cached
+        return self._request_description(image_bytes, scene_idx, image_hash)
+    
+    def _request_description(self, image_bytes: bytes, scene_idx: int, image_hash: Optional[int]) -> Optional[str]:
        
         try:
 
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
+                "openai.vision",
                 model=self.model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are a highly skilled filmmaker and storyteller. Describe what's happening in this image in detail, focusing on elements that would be important for creating a compelling narrative. Consider characters, actions, emotions, setting, and mood."
+                        "content": VISION_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
                         "content": [
                             {"type": "text", "text": f"This is a key frame from scene {scene_idx+1} of a video. Describe what you see in rich, descriptive detail."},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
+                            self._image_part(image_bytes)
                         ]
                     }
                 ],
-                max_tokens=300
+                max_tokens=300,
+                image_tokens=image_tokens(image_bytes, self.image_detail)
             )
             
-            return response.choices[0].message.content
+            description = response.choices[0].message.content
+            if image_hash is not None and description:
+                self.description_cache.put(image_hash, self.model, self._cache_prompt_version(), description)
+            
+            return description
         
         except Exception as e:
             print(f"Error analyzing frame: {str(e)}")
-            return f"Scene {scene_idx+1} (analysis failed)"
+            return None
+    
+    def _analyze_frame_batch(self, batch: List[Tuple[int, bytes, Optional[int]]]) -> List[str]:
+        # Describes several keyframes in one request. The model answers with a JSON
+        # array keyed by scene number; if it can't be matched back to every scene in
+        # the batch, each keyframe is requested on its own instead.
+
+        if len(batch) == 1:
+            scene_idx, image_bytes, image_hash = batch[0]
+            return [self._request_description(image_bytes, scene_idx, image_hash)]
+
+        try:
+
+            content = [{
+                "type": "text",
+                "text": f"These are key frames from {len(batch)} consecutive scenes of a video, each labelled with its scene number. "
+                        "Describe what you see in each one in rich, descriptive detail. "
+                        'Respond with a JSON object of the form {"descriptions": [{"scene": <scene number>, "description": <text>}]}, '
+                        "with one entry per key frame."
+            }]
+            for scene_idx, image_bytes, _ in batch:
+                content.append({"type": "text", "text": f"Scene {scene_idx+1}:"})
+                content.append(self._image_part(image_bytes))
+
+            response = self._create_completion(
+                "openai.vision",
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": VISION_SYSTEM_PROMPT},
+                    {"role": "user", "content": content}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=300 * len(batch),
+                image_tokens=sum(image_tokens(image_bytes, self.image_detail) for _, image_bytes, _ in batch)
+            )
+
+            result = json.loads(response.choices[0].message.content)
+            by_scene = {int(entry["scene"]): entry["description"] for entry in result.get("descriptions", [])}
+            descriptions = [by_scene[scene_idx + 1] for scene_idx, _, _ in batch]
+            if not all(isinstance(description, str) and description for description in descriptions):
+                raise ValueError("empty description in batch response")
+
+        except Exception as e:
+            print(f"Error analyzing frame batch, retrying frames one by one: {str(e)}")
+            instrumentation.count("openai.retries", len(batch))
+            return [
+                self._request_description(image_bytes, scene_idx, image_hash)
+                for scene_idx, image_bytes, image_hash in batch
+            ]
+
+        if self.description_cache:
+            for (_, _, image_hash), description in zip(batch, descriptions):
+                if image_hash is not None:
+                    self.description_cache.put(image_hash, self.model, self._cache_prompt_version(), description)
+        return descriptions
     
     def _generate_storytelling_narrative(
         self, 
         scene_descriptions: List[Dict[str, Any]],
-        video_metadata: VideoMetadata
-    ) -> List[NarrativeSegment]:
+        video_metadata: "VideoMetadata",
+        on_segment: Optional[Callable[[NarrativeSegment], None]] = None
+    ) -> Tuple[List[NarrativeSegment], bool]:
        
         try:
 
-            scenes_json = json.dumps(scene_descriptions, indent=2)
+            scenes = encode_scenes(fit_descriptions(scene_descriptions, self.prompt_max_tokens))
             
             prompt = f"""
-            You are a master storyteller creating a compelling narrative for a {video_metadata.duration} second video.
+            You are a master storyteller creating a compelling narrative for a {round(video_metadata.duration, 2)} second video.
             
-            Here are the scenes in the video with their descriptions:
-            {scenes_json}
+            Here are the scenes in the video with their descriptions. {SCENE_ENCODING_LEGEND}
+            {scenes}
             
             Create a cohesive, engaging narration script that tells a story based on these scenes. 
             The narration should:
@@ -117,28 +454,30 @@ class VisualNarrativeGenerator:
             
             Make sure narration covers the entire video duration with no large gaps
             """
+            # The indentation above would cost tokens on every request.
+            prompt = "\n".join(line.strip() for line in prompt.strip().splitlines())
             
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a master storyteller and filmmaker creating narration for videos."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=2000
-            )
+            messages = [
+                {"role": "system", "content": "You are a master storyteller and filmmaker creating narration for videos."},
+                {"role": "user", "content": prompt}
+            ]
             
-            result = json.loads(response.choices[0].message.content)
+            if on_segment:
+                content = self._stream_narrative(messages, on_segment)
+            else:
+                response = self._create_completion(
+                    "openai.narrative",
+                    model=self.narrative_model,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    max_tokens=2000
+                )
+                content = response.choices[0].message.content
             
-            segments = []
-            for segment in result.get("segments", []):
-                segments.append(NarrativeSegment(
-                    start_time=segment["start_time"],
-                    end_time=segment["end_time"],
-                    duration=segment["end_time"] - segment["start_time"],
-                    text=segment["text"],
-                    scene_idx=segment["scene_idx"]
-                ))
+            result = json.loads(content)
+            
+            segments = [self._segment_from_dict(segment) for segment in result.get("segments", [])]
+            complete = bool(segments)
             
             if not segments and scene_descriptions:
                 segments.append(NarrativeSegment(
@@ -149,7 +488,7 @@ class VisualNarrativeGenerator:
                     scene_idx=0
                 ))
             
-            return segments
+            return segments, complete
             
         except Exception as e:
             print(f"Error generating narrative: {str(e)}")
@@ -164,4 +503,278 @@ class VisualNarrativeGenerator:
                     scene_idx=scene["scene_idx"]
                 ))
             
-            return segments
\ No newline at end of file
+            return segments, False
+    
+    def _narrative_windows(self, scene_descriptions: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        # Splits the scenes into consecutive windows of about window_seconds each; a
+        # scene is never split, so a long one makes up a window of its own.
+        
+        if self.window_seconds <= 0 or not scene_descriptions:
+            return [scene_descriptions]
+        
+        windows = [[]]
+        for scene in scene_descriptions:
+            if windows[-1] and scene["start_time"] >= windows[-1][0]["start_time"] + self.window_seconds:
+                windows.append([])
+            windows[-1].append(scene)
+        return windows
+    
+    def _generate_windowed_narrative(
+        self,
+        windows: List[List[Dict[str, Any]]],
+        video_metadata: "VideoMetadata",
+        on_segment: Optional[Callable[[NarrativeSegment], None]] = None
+    ) -> Tuple[List[NarrativeSegment], bool]:
+        
+        # A short outline of the whole video is requested first; then every window is
+        # narrated concurrently, given the summaries of the windows around it so the
+        # story carries across. Each window's segments go to on_segment once every
+        # earlier window is done, so they arrive in timeline order.
+        summaries = self._outline_windows(windows, video_metadata)
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(len(windows), self.max_concurrency))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._narrate_window, k, windows, summaries, video_metadata)
+                for k in range(len(windows))
+            ]
+            segments = []
+            complete = True
+            for future in futures:
+                window_segments, window_complete = future.result()
+                complete = complete and window_complete
+                segments.extend(window_segments)
+                if on_segment:
+                    for segment in window_segments:
+                        on_segment(segment)
+        
+        return self._stitch_segments(segments, video_metadata.duration), complete
+    
+    def _outline_windows(self, windows: List[List[Dict[str, Any]]], video_metadata: "VideoMetadata") -> List[str]:
+        # Returns a one- or two-sentence summary of each window. Long videos are
+        # outlined in groups of OUTLINE_MAX_PARTS windows, requested concurrently, so
+        # no request asks for more summaries than its max_tokens can hold.
+        
+        groups = [
+            range(start, min(start + OUTLINE_MAX_PARTS, len(windows)))
+            for start in range(0, len(windows), OUTLINE_MAX_PARTS)
+        ]
+        if len(groups) == 1:
+            return self._outline_parts(windows, groups[0], video_metadata)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(groups), self.max_concurrency))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._outline_parts, windows, parts, video_metadata)
+                for parts in groups
+            ]
+            return [summary for future in futures for summary in future.result()]
+    
+    def _outline_parts(
+        self,
+        windows: List[List[Dict[str, Any]]],
+        parts: range,
+        video_metadata: "VideoMetadata"
+    ) -> List[str]:
+        # Returns the summaries of the windows in parts, or empty summaries if the
+        # outline can't be generated. Only the first sentence of each scene
+        # description goes into the request, trimmed further if they would take more
+        # than prompt_max_tokens.
+        
+        try:
+            
+            first_sentences = iter(fit_descriptions([
+                dict(scene, description=re.split(r"(?<=[.!?])\s", scene["description"].strip(), maxsplit=1)[0][:200])
+                for k in parts for scene in windows[k]
+            ], self.prompt_max_tokens))
+            outline = []
+            for k in parts:
+                window = windows[k]
+                outline.append(f"Part {k+1} ({window[0]['start_time']:.1f}s - {window[-1]['end_time']:.1f}s):")
+                for _ in window:
+                    outline.append(f"- {next(first_sentences)['description']}")
+            
+            scope = (
+                f"A {round(video_metadata.duration, 2)} second video is split into {len(windows)} parts, outlined below scene by scene.\n"
+                if len(parts) == len(windows) else
+                f"A {round(video_metadata.duration, 2)} second video is split into {len(windows)} parts. Parts {parts[0]+1} to {parts[-1]+1} are outlined below scene by scene.\n"
+            )
+            response = self._create_completion(
+                "openai.narrative",
+                model=self.narrative_model,
+                messages=[
+                    {"role": "system", "content": "You are a master storyteller and filmmaker creating narration for videos."},
+                    {"role": "user", "content": (
+                        scope
+                        + "\n".join(outline) + "\n\n"
+                        "Summarize the story of each part in one or two sentences, so the narration of each part can follow on from the ones before it. "
+                        'Respond with a JSON object of the form {"parts": [{"part": <part number>, "summary": <text>}]}.'
+                    )}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=OUTLINE_TOKENS_PER_PART * len(parts)
+            )
+            
+            by_part = {int(part["part"]): str(part["summary"]) for part in json.loads(response.choices[0].message.content).get("parts", [])}
+            return [by_part.get(k + 1, "") for k in parts]
+        
+        except Exception as e:
+            print(f"Error outlining narrative, narrating windows without summaries: {str(e)}")
+            return [""] * len(parts)
+    
+    def _narrate_window(
+        self,
+        k: int,
+        windows: List[List[Dict[str, Any]]],
+        summaries: List[str],
+        video_metadata: "VideoMetadata"
+    ) -> Tuple[List[NarrativeSegment], bool]:
+        # Returns the segments of window k, clamped to its time span, and whether they
+        # are the model's rather than the scene-by-scene fallback.
+        
+        window = windows[k]
+        window_start = window[0]["start_time"]
+        window_end = video_metadata.duration if k == len(windows) - 1 else windows[k + 1][0]["start_time"]
+        
+        try:
+            
+            context = []
+            earlier = [summary for summary in summaries[max(0, k - SUMMARY_CONTEXT_WINDOWS):k] if summary]
+            if earlier:
+                context.append("The story so far: " + " ".join(earlier))
+            if k + 1 < len(windows) and summaries[k + 1]:
+                context.append("What comes next: " + summaries[k + 1])
+            
+            prompt = (
+                f"You are narrating part {k+1} of {len(windows)} of a {round(video_metadata.duration, 2)} second video, "
+                f"from {window_start:.2f}s to {window_end:.2f}s.\n"
+                + "".join(line + "\n" for line in context) +
+                f"Here are the scenes in this part with their descriptions. {SCENE_ENCODING_LEGEND}\n"
+                f"{encode_scenes(fit_descriptions(window, self.prompt_max_tokens))}\n\n"
+                "Continue the narration as one cohesive, engaging story told like an audiobook, not a caption track. "
+                + ("Open the story. " if k == 0 else "Pick up where the story left off; don't reintroduce it. ")
+                + ("Bring the story to its end. " if k == len(windows) - 1 else "Don't wrap the story up; it goes on in the next part. ") +
+                f"Fill this part from {window_start:.2f}s to {window_end:.2f}s with no large gaps, keeping the words in sync with what's on screen.\n\n"
+                "Format your response as a JSON object with a \"segments\" array, each segment with:\n"
+                "- scene_idx: the scene index\n"
+                "- start_time: time in seconds when narration starts\n"
+                "- end_time: time in seconds when narration ends\n"
+                "- text: the narration text"
+            )
+            
+            response = self._create_completion(
+                "openai.narrative",
+                model=self.narrative_model,
+                messages=[
+                    {"role": "system", "content": "You are a master storyteller and filmmaker creating narration for videos."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=2000
+            )
+            
+            segments = []
+            for segment in json.loads(response.choices[0].message.content).get("segments", []):
+                segment = self._segment_from_dict(segment)
+                start_time = min(max(segment.start_time, window_start), window_end)
+                end_time = min(max(segment.end_time, start_time), window_end)
+                segments.append(segment.model_copy(update={
+                    "start_time": start_time, "end_time": end_time, "duration": end_time - start_time
+                }))
+            if not segments:
+                raise ValueError("no segments in response")
+            return sorted(segments, key=lambda segment: segment.start_time), True
+        
+        except Exception as e:
+            print(f"Error generating narrative for part {k+1}: {str(e)}")
+            return [
+                NarrativeSegment(
+                    start_time=scene["start_time"],
+                    end_time=scene["end_time"],
+                    duration=scene["duration"],
+                    text=f"In this scene, {scene['description']}",
+                    scene_idx=scene["scene_idx"]
+                )
+                for scene in window
+            ], False
+    
+    def _stitch_segments(self, segments: List[NarrativeSegment], duration: float) -> List[NarrativeSegment]:
+        # Joins the windows' segments into one timeline: each segment runs on until
+        # the next one starts, and the last until the end of the video. Start times
+        # are left alone, since that is where each clip is placed in the track, except
+        # that the first segment is moved back to 0 so the timeline has no gap there.
+        
+        if segments and segments[0].start_time > 0:
+            segments = [segments[0].model_copy(update={"start_time": 0.0})] + segments[1:]
+        stitched = []
+        for i, segment in enumerate(segments):
+            end_time = segments[i + 1].start_time if i + 1 < len(segments) else duration
+            end_time = max(segment.end_time, end_time)
+            stitched.append(segment.model_copy(update={"end_time": end_time, "duration": end_time - segment.start_time}))
+        return stitched
+    
+    def _stream_narrative(self, messages: List[Dict[str, Any]], on_segment: Callable[[NarrativeSegment], None]) -> str:
+        # Returns the full response text, passing each segment to on_segment as soon as
+        # its JSON object is complete.
+        
+        parser = SegmentStreamParser()
+        parts = []
+        usage = None
+        # The request slot is held until the whole response has streamed in.
+        with self._request_slots, instrumentation.request("openai.narrative"):
+            stream = self.client.chat.completions.create(
+                model=self.narrative_model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                max_tokens=2000,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                # The last chunk carries the usage of the whole request, and no choices.
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parts.append(chunk.choices[0].delta.content)
+                for segment in parser.feed(parts[-1]):
+                    try:
+                        narrative_segment = self._segment_from_dict(segment)
+                    except Exception:
+                        # Malformed segments are left to the final parse.
+                        continue
+                    on_segment(narrative_segment)
+        self._record_usage(self.narrative_model, usage)
+        content = "".join(parts)
+        self._count_bytes(messages, content)
+        return content
+    
+    def _create_completion(self, request: str, image_tokens: int = 0, **kwargs):
+        # request names the call in the run profile; image_tokens is the estimated
+        # vision cost of the images in the request.
+        
+        with self._request_slots, instrumentation.request(request):
+            response = self.client.chat.completions.create(**kwargs)
+        self._record_usage(kwargs["model"], getattr(response, "usage", None), image_tokens)
+        self._count_bytes(kwargs["messages"], response.choices[0].message.content)
+        return response
+    
+    def _count_bytes(self, messages: List[Dict[str, Any]], content: Optional[str]) -> None:
+        # Approximates the request and response bodies by their messages and content.
+        
+        if instrumentation.current() is not None:
+            instrumentation.count("openai.bytes_sent", len(json.dumps(messages)))
+            instrumentation.count("openai.bytes_received", len((content or "").encode("utf-8")))
+    
+    def _record_usage(self, model: str, usage: Any, image_tokens: int = 0) -> None:
+        
+        self.token_usage.add(model, usage, image_tokens)
+        run_usage = _run_usage.get()
+        if run_usage is not None:
+            run_usage.add(model, usage, image_tokens)
+    
+    def _segment_from_dict(self, segment: Dict[str, Any]) -> NarrativeSegment:
+        
+        return NarrativeSegment(
+            start_time=segment["start_time"],
+            end_time=segment["end_time"],
+            duration=segment["end_time"] - segment["start_time"],
+            text=segment["text"],
+            scene_idx=segment["scene_idx"]
+        )
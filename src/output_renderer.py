@@ -2,20 +2,48 @@ import os
 import json
 import enum
 import subprocess
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 from pathlib import Path
 import shutil
-from pydub import AudioSegment
 
 from narrative_generator import NarrativeSegment
+from toolchain import find_ffmpeg
+import instrumentation
+
+if TYPE_CHECKING:
+    # hls_package imports this module, so it is only imported where it is used.
+    from hls_package import HLSPackage
 
 class OutputFormat(enum.Enum):
     JSON = "json"
     SRT = "srt"
     VTT = "vtt"
+    # A VTT script, plus an HLS package published while the narration is synthesized;
+    # see OutputRenderer.start_hls.
+    HLS = "hls"
+
+# Containers the single-pass render can write. The video stream is copied, so
+# only containers that take any codec a source is likely to have are offered.
+MUX_CONTAINERS = ("mp4", "mkv", "mov")
+
+def format_vtt_time(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
 
 class OutputRenderer:
     
+    def __init__(self):
+        
+        self.sample_rate = int(os.environ.get("NARRATION_SAMPLE_RATE", "44100"))
+        # How far the original soundtrack is turned down while narration plays: the
+        # compression ratio, and the narration level (0-1) at which ducking starts.
+        self.duck_ratio = float(os.environ.get("NARRATION_DUCK_RATIO", "8"))
+        self.duck_threshold = float(os.environ.get("NARRATION_DUCK_THRESHOLD", "0.02"))
+        self.audio_codec = os.environ.get("NARRATION_AUDIO_CODEC", "aac")
+        self.hls_segment_seconds = float(os.environ.get("NARRATION_HLS_SEGMENT_SECONDS", "6"))
+    
     def generate_outputs(
         self,
         narrative: List[NarrativeSegment],
@@ -25,23 +53,36 @@ class OutputRenderer:
         output_format: OutputFormat = OutputFormat.JSON
     ) -> Dict[str, str]:
 
+        with instrumentation.stage("render"):
+            return self._generate_outputs(narrative, audio_path, video_path, output_dir, output_format)
+    
+    def _generate_outputs(
+        self,
+        narrative: List[NarrativeSegment],
+        audio_path: str,
+        video_path: Optional[str],
+        output_dir: str,
+        output_format: OutputFormat
+    ) -> Dict[str, str]:
+
         Path(output_dir).mkdir(exist_ok=True, parents=True)
         
-        if output_format == OutputFormat.JSON:
-            script_path = self._generate_json_script(narrative, output_dir)
-        elif output_format == OutputFormat.SRT:
-            script_path = self._generate_srt_script(narrative, output_dir)
-        elif output_format == OutputFormat.VTT:
-            script_path = self._generate_vtt_script(narrative, output_dir)
-        else:
-            script_path = self._generate_json_script(narrative, output_dir)
+        script_path = self.render_script(narrative, output_dir, output_format)
         
         audio_output_path = os.path.join(output_dir, "narration.wav")
         shutil.copy(audio_path, audio_output_path)
+        from audio_mixer import timeline_path
+        if os.path.exists(timeline_path(audio_path)):
+            # Kept with the track so edited segments can be spliced in later.
+            with open(timeline_path(audio_path), "r") as f:
+                timeline = json.load(f)
+            timeline["source_video"] = os.path.abspath(video_path) if video_path else None
+            with open(timeline_path(audio_output_path), "w") as f:
+                json.dump(timeline, f, indent=2)
         
         muxed_video_path = None
         if video_path:
-            muxed_video_path = self._mux_audio_with_video(video_path, audio_output_path, output_dir)
+            muxed_video_path = self.mux_audio(video_path, audio_output_path, output_dir)
         
         result = {
             "script": script_path,
@@ -53,6 +94,142 @@ class OutputRenderer:
         
         return result
     
+    def render_single_pass(
+        self,
+        narrative: List[NarrativeSegment],
+        clips: List[Dict[str, Any]],
+        video_path: str,
+        duration: float,
+        output_dir: str = "output",
+        output_format: OutputFormat = OutputFormat.JSON,
+        containers: List[str] = ("mp4",),
+        has_audio: bool = True
+    ) -> Dict[str, str]:
+        # Writes the script and the narrated video without a narration track in
+        # between: one ffmpeg run places each clip (see SpeculativeSynthesis.collect)
+        # at its start time, ducks the original soundtrack under it, and encodes the
+        # mix into every container asked for.
+        
+        with instrumentation.stage("render"):
+            Path(output_dir).mkdir(exist_ok=True, parents=True)
+            script_path = self.render_script(narrative, output_dir, output_format)
+            video_paths = self.mux_narration(video_path, clips, duration, output_dir, containers, has_audio)
+            return {
+                "script": script_path,
+                "muxed_video": video_paths[containers[0]],
+                "muxed_videos": video_paths
+            }
+    
+    def start_hls(
+        self,
+        narrative: List[NarrativeSegment],
+        video_path: str,
+        duration: float,
+        output_dir: str = "output",
+        has_audio: bool = True
+    ) -> "HLSPackage":
+        # Writes the script and starts an HLS package of the narrated video in
+        # output_dir/hls. Pass it each clip as soon as it is final (see
+        # SpeculativeSynthesis.collect's on_clip), then call finish(); every segment
+        # whose narration is final is published in the meantime.
+        
+        from hls_package import HLSPackage
+        with instrumentation.stage("render"):
+            Path(output_dir).mkdir(exist_ok=True, parents=True)
+            script_path = self.render_script(narrative, output_dir, OutputFormat.HLS)
+            package = HLSPackage(self, narrative, video_path, duration, os.path.join(output_dir, "hls"), has_audio)
+            package.outputs["script"] = script_path
+            package.start()
+            return package
+    
+    def mux_narration(
+        self,
+        video_path: str,
+        clips: List[Dict[str, Any]],
+        duration: float,
+        output_dir: str,
+        containers: List[str] = ("mp4",),
+        has_audio: bool = True
+    ) -> Dict[str, str]:
+        # duration is the video's, in seconds. Returns the path written for each container.
+        
+        if not clips:
+            raise ValueError("No audio segments to mux")
+        unknown = [container for container in containers if container not in MUX_CONTAINERS]
+        if unknown or not containers:
+            raise ValueError(f"Unsupported containers {unknown}; choose from {', '.join(MUX_CONTAINERS)}")
+        
+        output_paths = {container: os.path.join(output_dir, f"narrated_video.{container}") for container in containers}
+        ffmpeg_cmd = [find_ffmpeg(), "-y", "-v", "error", "-i", video_path]
+        for clip in clips:
+            ffmpeg_cmd += ["-i", clip["path"]]
+        ffmpeg_cmd += ["-filter_complex", self._narration_filtergraph(clips, duration, has_audio, len(containers))]
+        for i, container in enumerate(containers):
+            ffmpeg_cmd += [
+                "-map", "0:v:0",
+                "-map", f"[out{i}]",
+                "-c:v", "copy",
+                "-c:a", self.audio_codec,
+                output_paths[container]
+            ]
+        
+        with instrumentation.request("ffmpeg.mux"):
+            result = subprocess.run(ffmpeg_cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to mux narration into {video_path}: {result.stderr.decode(errors='replace').strip()}")
+        return output_paths
+    
+    def _narration_filtergraph(self, clips: List[Dict[str, Any]], duration: float, has_audio: bool, outputs: int) -> str:
+        # Input 0 is the video and input i + 1 is clip i.
+        
+        chains = [
+            f"[{i + 1}:a]{self._audio_format()},adelay=delays={round(clip['start_time'] * self.sample_rate)}S:all=1[clip{i}]"
+            for i, clip in enumerate(clips)
+        ]
+        # Padded with silence to the video's length, so the narration never ends before
+        # the video does. The mix isn't cut with -shortest, -t or atrim: with the video
+        # copied, any of them can end it early.
+        narration = "".join(f"[clip{i}]" for i in range(len(clips)))
+        narration += f"amix=inputs={len(clips)}:duration=longest:normalize=0,apad=whole_dur={duration:.3f}"
+        return self._ducking_filtergraph(chains, narration, has_audio, outputs)
+    
+    def _audio_format(self) -> str:
+        # Every stream is brought to one rate and layout, so no conversions are left to
+        # ffmpeg's negotiation (which would pick mono for the whole mix).
+        return f"aresample={self.sample_rate},aformat=sample_fmts=fltp:channel_layouts=stereo"
+    
+    def _ducking_filtergraph(self, chains: List[str], narration: str, has_audio: bool, outputs: int) -> str:
+        # Adds to chains the narration filter chain (without an output label), mixed
+        # over the video's soundtrack (input 0) turned down while it plays, and split
+        # into [out0] to [out<outputs - 1>]. With a soundtrack, the mix lasts as long as
+        # it does.
+        
+        if has_audio:
+            chains.append(f"{narration},asplit=2[key][narration]")
+            chains.append(f"[0:a]{self._audio_format()}[original]")
+            chains.append(
+                f"[original][key]sidechaincompress=threshold={self.duck_threshold}:ratio={self.duck_ratio}"
+                ":attack=20:release=300[ducked]"
+            )
+            mix = "[ducked][narration]amix=inputs=2:duration=first:normalize=0"
+        else:
+            mix = narration
+        chains.append(f"{mix},asplit={outputs}" + "".join(f"[out{i}]" for i in range(outputs)))
+        return ";".join(chains)
+    
+    def render_script(
+        self,
+        narrative: List[NarrativeSegment],
+        output_dir: str,
+        output_format: OutputFormat = OutputFormat.JSON
+    ) -> str:
+
+        if output_format == OutputFormat.SRT:
+            return self._generate_srt_script(narrative, output_dir)
+        if output_format in (OutputFormat.VTT, OutputFormat.HLS):
+            return self._generate_vtt_script(narrative, output_dir)
+        return self._generate_json_script(narrative, output_dir)
+    
     def _generate_json_script(self, narrative: List[NarrativeSegment], output_dir: str) -> str:
        
         script_path = os.path.join(output_dir, "narration_script.json")
@@ -86,30 +263,22 @@ class OutputRenderer:
       
         script_path = os.path.join(output_dir, "narration_script.vtt")
         
-        def format_time(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            seconds = seconds % 60
-            return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
-        
         with open(script_path, "w") as f:
             f.write("WEBVTT\n\n")
             
             for i, segment in enumerate(narrative):
                 f.write(f"{i+1}\n")
-                f.write(f"{format_time(segment.start_time)} --> {format_time(segment.end_time)}\n")
+                f.write(f"{format_vtt_time(segment.start_time)} --> {format_vtt_time(segment.end_time)}\n")
                 f.write(f"{segment.text}\n\n")
         
         return script_path
     
-    def _mux_audio_with_video(self, video_path: str, audio_path: str, output_dir: str) -> str:
-        print(video_path)
-        print(audio_path)
+    def mux_audio(self, video_path: str, audio_path: str, output_dir: str) -> str:
         try:
             output_path = os.path.join(output_dir, "narrated_video.mp4")
-            ffmpeg_path = AudioSegment.converter
+            ffmpeg_path = find_ffmpeg()
             ffmpeg_cmd = [
-                ffmpeg_path, "-y",
+                ffmpeg_path, "-y", "-v", "error",
                 "-i", video_path,
                 "-i", audio_path,
                 "-map", "0:v:0",  
@@ -119,7 +288,10 @@ class OutputRenderer:
                 output_path
             ]
             
-            subprocess.run(ffmpeg_cmd, check=True)
+            with instrumentation.request("ffmpeg.mux"):
+                result = subprocess.run(ffmpeg_cmd, capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.decode(errors="replace").strip())
             
             return output_path
         
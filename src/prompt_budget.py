@@ -0,0 +1,162 @@
+import re
+import json
+import math
+import struct
+import threading
+import functools
+from typing import List, Dict, Any, Optional, Tuple
+
+# Printed above encoded scenes so the model can read the short keys.
+SCENE_ENCODING_LEGEND = "One scene per line: i = scene index, s = start and e = end in seconds, k = shot type, d = description."
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken is optional; without it, token counts are estimated from length.
+
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # English text averages about four characters per token.
+    return math.ceil(len(text) / 4)
+
+def encode_scene(scene: Dict[str, Any]) -> str:
+
+    return json.dumps({
+        "i": scene["scene_idx"],
+        "s": round(scene["start_time"], 2),
+        "e": round(scene["end_time"], 2),
+        "k": scene.get("scene_type", ""),
+        "d": scene["description"]
+    }, separators=(",", ":"), ensure_ascii=False)
+
+def encode_scenes(scene_descriptions: List[Dict[str, Any]]) -> str:
+    # Compact form of scene descriptions for prompts: one JSON object per line with
+    # short keys and times rounded to centiseconds (see SCENE_ENCODING_LEGEND).
+    return "\n".join(encode_scene(scene) for scene in scene_descriptions)
+
+def _trim(text: str, max_tokens: int) -> str:
+    # Keeps as many whole sentences as fit; a first sentence that doesn't fit on its
+    # own is cut at a word boundary.
+
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        candidate = f"{kept} {sentence}".strip()
+        if count_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    if kept:
+        return kept
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + "...") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + "..."
+
+def fit_descriptions(scene_descriptions: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    # Returns the scene descriptions with the longest ones trimmed, so that
+    # encode_scenes() of the result takes about max_tokens at most. Every description
+    # is cut to the same token cap, chosen as high as the budget allows, so short
+    # descriptions are never touched before long ones.
+
+    if max_tokens <= 0 or count_tokens(encode_scenes(scene_descriptions)) <= max_tokens:
+        return scene_descriptions
+
+    # What each line costs besides its description, and each description's length.
+    overheads = [count_tokens(encode_scene(dict(scene, description=""))) + 1 for scene in scene_descriptions]
+    lengths = [count_tokens(scene["description"]) for scene in scene_descriptions]
+    available = max_tokens - sum(overheads)
+
+    lo, hi = 0, max(lengths)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if sum(min(length, mid) for length in lengths) <= available:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return [
+        dict(scene, description=_trim(scene["description"], max(lo, 1))) if length > lo else scene
+        for scene, length in zip(scene_descriptions, lengths)
+    ]
+
+def _jpeg_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    # Reads (width, height) from the frame header of a JPEG.
+
+    position = 2
+    while position + 9 < len(image_bytes):
+        if image_bytes[position] != 0xFF:
+            return None
+        marker = image_bytes[position + 1]
+        length = struct.unpack(">H", image_bytes[position + 2:position + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", image_bytes[position + 5:position + 9])
+            return width, height
+        position += 2 + length
+    return None
+
+def image_tokens(image_bytes: bytes, detail: str) -> int:
+    # Vision tokens an image costs at the given detail level, following OpenAI's
+    # published formula: 85 at low detail; otherwise the image is scaled to fit
+    # 2048x2048 and then to a shortest side of 768, and each 512px tile costs 170
+    # more. "auto" is counted as high, its upper bound.
+
+    if detail == "low":
+        return 85
+    size = _jpeg_size(image_bytes)
+    if size is None:
+        return 85
+    width, height = size
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+class TokenUsage:
+    # Running totals of the tokens OpenAI requests used, per model. Prompt and
+    # completion tokens come from each response's usage; image tokens are estimated
+    # from the keyframes sent, and are already included in the prompt tokens.
+
+    def __init__(self):
+
+        self.models: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, usage: Any = None, image_tokens: int = 0) -> None:
+
+        with self._lock:
+            totals = self.models.setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "image_tokens": 0})
+            totals["requests"] += 1
+            totals["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            totals["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            totals["image_tokens"] += image_tokens
+
+    def summary(self, video_seconds: Optional[float] = None) -> Dict[str, Any]:
+        # Totals over all models, each model's totals, and, given the video's length,
+        # the totals per minute of video.
+
+        with self._lock:
+            models = {model: dict(totals) for model, totals in self.models.items()}
+        keys = ("requests", "prompt_tokens", "completion_tokens", "image_tokens")
+        summary = {key: sum(totals[key] for totals in models.values()) for key in keys}
+        summary["models"] = models
+        if video_seconds:
+            summary["per_video_minute"] = {key: round(summary[key] * 60 / video_seconds, 1) for key in keys}
+        return summary
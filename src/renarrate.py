@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import os
+import glob
+import json
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Tuple, Optional
+from dotenv import load_dotenv
+
+from narrative_generator import NarrativeSegment
+from output_renderer import OutputFormat
+from tts_cache import normalize_text
+
+# Re-rendered windows reach slightly past each clip, so rounding to sample frames
+# never leaves a sliver of a removed clip behind.
+WINDOW_PADDING = 0.01
+
+def load_script(path: str) -> List[NarrativeSegment]:
+    # Reads a narration_script.json; duration may be left out of edited segments.
+
+    with open(path, "r") as f:
+        script = json.load(f)
+    segments = []
+    for i, segment in enumerate(script.get("segments", [])):
+        segment = dict(segment)
+        segment.setdefault("duration", segment["end_time"] - segment["start_time"])
+        segment.setdefault("scene_idx", i)
+        segments.append(NarrativeSegment(**segment))
+    return segments
+
+def diff_timeline(
+    clips: List[Dict[str, Any]],
+    segments: List[NarrativeSegment]
+) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[int], List[Dict[str, Any]]]:
+    # Matches the edited segments against the clips in the track. A clip only depends
+    # on its text and where it starts, so a segment whose end time alone changed
+    # keeps its clip. Returns (kept (segment index, clip) pairs, indices of segments
+    # that need a new clip, clips no longer in the script).
+
+    def clip_key(text: str, start_time: float) -> Tuple[str, float]:
+        return normalize_text(text), round(start_time, 3)
+
+    unmatched: Dict[Tuple[str, float], List[Dict[str, Any]]] = {}
+    for clip in clips:
+        unmatched.setdefault(clip_key(clip["text"], clip["start_time"]), []).append(clip)
+
+    kept, added = [], []
+    for i, segment in enumerate(segments):
+        candidates = unmatched.get(clip_key(segment.text, segment.start_time))
+        if candidates:
+            kept.append((i, candidates.pop(0)))
+        else:
+            added.append(i)
+    removed = [clip for candidates in unmatched.values() for clip in candidates]
+    return kept, added, removed
+
+def _merge_windows(windows: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _cut_from_track(
+    track_path: str,
+    clip: Dict[str, Any],
+    timeline_clips: List[Dict[str, Any]],
+    destination: str
+) -> bool:
+    # Writes the samples of a clip in the track to destination, as a WAV. The track
+    # holds the sum of the clips, so this is only possible where no other clip
+    # overlapped it; returns False otherwise.
+
+    clip_end = clip["start_time"] + clip["clip_seconds"]
+    if any(
+        other is not clip and other["start_time"] < clip_end and other["start_time"] + other["clip_seconds"] > clip["start_time"]
+        for other in timeline_clips
+    ):
+        return False
+    with wave.open(track_path, "rb") as track:
+        start = max(0, int(round(clip["start_time"] * track.getframerate())))
+        track.setpos(min(start, track.getnframes()))
+        frames = track.readframes(int(round(clip["clip_seconds"] * track.getframerate())))
+        with wave.open(destination, "wb") as output:
+            output.setparams(track.getparams())
+            output.writeframes(frames)
+    return True
+
+def _unchanged_clip(audio_generator, index: int, segment: NarrativeSegment, temp_dir: str) -> str:
+    # An unchanged clip from the TTS cache, without going back to ElevenLabs.
+
+    path = os.path.join(temp_dir, f"unchanged_{index}.mp3")
+    cache = audio_generator.tts_cache
+    if cache is None or not cache.get(cache.key(
+        segment.text, audio_generator.voice_id, audio_generator.model_id,
+        audio_generator.stability, audio_generator.similarity_boost
+    ), path):
+        raise ValueError(
+            f"Segment {index+1} overlaps an edit, but its clip overlaps another in the track and is "
+            "no longer in the TTS cache; run the full narration again"
+        )
+    return path
+
+def renarrate(
+    output_dir: str,
+    script_path: Optional[str] = None,
+    audio_generator=None,
+    output_renderer=None
+) -> Dict:
+    # Applies an edited script to a finished run in output_dir. Only segments whose
+    # text or start time changed are synthesized; the track is re-rendered in place
+    # just around them, and the narrated video is muxed again only if the track
+    # changed. Clips of unchanged segments that overlap an edit are cut from the
+    # existing track, or taken from the TTS cache where they overlap another clip;
+    # they are never synthesized again.
+
+    started = time.perf_counter()
+    script_path = script_path or os.path.join(output_dir, "narration_script.json")
+    track_path = os.path.join(output_dir, "narration.wav")
+
+    from audio_mixer import TimelineMixer, timeline_path
+    from audio_generator import write_timeline
+    from toolchain import find_ffmpeg
+    if audio_generator is None:
+        from audio_generator import AudioGenerator
+        audio_generator = AudioGenerator()
+    if output_renderer is None:
+        from output_renderer import OutputRenderer
+        output_renderer = OutputRenderer()
+
+    try:
+        with open(timeline_path(track_path), "r") as f:
+            timeline = json.load(f)
+    except FileNotFoundError:
+        # HLS and single-pass runs never write narration.wav, so they have no track to splice.
+        if os.path.isdir(os.path.join(output_dir, "hls")):
+            raise ValueError(f"{output_dir} holds an HLS package; re-narration isn't supported for HLS outputs")
+        if not os.path.exists(track_path):
+            if glob.glob(os.path.join(output_dir, "narrated_video.*")):
+                raise ValueError(f"{output_dir} was rendered with --single-pass; re-narration isn't supported for single-pass outputs")
+            raise ValueError(f"No narration track in {output_dir}")
+        raise ValueError(f"No narration timeline in {output_dir}; it was written before edits were supported")
+
+    segments = load_script(script_path)
+    if not segments:
+        raise ValueError(f"No segments in {script_path}")
+    kept, added, removed = diff_timeline(timeline["clips"], segments)
+    print(f"Edited script: {len(added)} segments to synthesize, {len(removed)} clips removed, {len(kept)} kept")
+
+    temp_dir = tempfile.mkdtemp(prefix="renarrate_")
+    try:
+        # New clips are synthesized concurrently, within the generator's request cap.
+        with ThreadPoolExecutor(max_workers=max(1, audio_generator.max_concurrency)) as executor:
+            futures = {
+                i: executor.submit(audio_generator._synthesize_segment, i, segments[i], temp_dir)
+                for i in added
+            }
+            new_clips = {i: dict(future.result(), **segments[i].model_dump()) for i, future in futures.items()}
+
+        mixer = TimelineMixer(
+            ffmpeg_path=find_ffmpeg(),
+            sample_rate=timeline["sample_rate"],
+            block_seconds=audio_generator.mix_block_seconds
+        )
+        for clip in new_clips.values():
+            clip["clip_seconds"] = len(mixer.decode(clip["path"])) / mixer.sample_rate
+
+        windows = _merge_windows([
+            (clip["start_time"] - WINDOW_PADDING, clip["start_time"] + clip["clip_seconds"] + WINDOW_PADDING)
+            for clip in removed + list(new_clips.values())
+        ])
+
+        kept_clips = dict(kept)
+        clips_by_segment = {i: dict(clip, **segments[i].model_dump()) for i, clip in kept}
+        clips_by_segment.update(new_clips)
+        clips = [clips_by_segment[i] for i in range(len(segments))]
+        duration = max(
+            [segment.end_time for segment in segments] +
+            [clip["start_time"] + clip["clip_seconds"] for clip in clips]
+        )
+
+        audio_changed = bool(windows) or abs(duration - timeline["duration"]) > 1 / mixer.sample_rate
+        if audio_changed:
+            # Unchanged clips that reach into an edited window are mixed into it again.
+            overlapping = []
+            for i, clip in enumerate(clips):
+                clip_end = clip["start_time"] + clip["clip_seconds"]
+                if i in new_clips:
+                    overlapping.append(clip)
+                elif any(clip["start_time"] < end and clip_end > start for start, end in windows):
+                    path = os.path.join(temp_dir, f"unchanged_{i}.wav")
+                    if not _cut_from_track(track_path, kept_clips[i], timeline["clips"], path):
+                        path = _unchanged_clip(audio_generator, i, segments[i], temp_dir)
+                    overlapping.append(dict(clip, path=path))
+            mixer.splice(track_path, overlapping, windows, duration)
+
+        write_timeline(track_path, clips, timeline["sample_rate"], duration, timeline.get("source_video"))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    # Every script format the run produced is rewritten from the edited segments.
+    outputs = {"scripts": [], "audio": track_path}
+    for output_format in OutputFormat:
+        if os.path.exists(os.path.join(output_dir, f"narration_script.{output_format.value}")):
+            outputs["scripts"].append(output_renderer.render_script(segments, output_dir, output_format))
+
+    muxed_path = os.path.join(output_dir, "narrated_video.mp4")
+    remuxed = False
+    if audio_changed and os.path.exists(muxed_path) and timeline.get("source_video"):
+        outputs["muxed_video"] = output_renderer.mux_audio(timeline["source_video"], track_path, output_dir)
+        remuxed = outputs["muxed_video"] is not None
+
+    return {
+        "segments": len(segments),
+        "synthesized": len(added),
+        "removed": len(removed),
+        "windows": windows,
+        "remuxed": remuxed,
+        "outputs": outputs,
+        "seconds": time.perf_counter() - started
+    }
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Apply an edited narration script to a finished run")
+    parser.add_argument(
+        "output_dir",
+        help="Output directory of the run to update"
+    )
+    parser.add_argument(
+        "--script",
+        help="Edited script (default: narration_script.json in output_dir)"
+    )
+
+    args = parser.parse_args()
+
+    result = renarrate(args.output_dir, args.script)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,576 @@
-
-import os
+import time
+import json
+import argparse
+import queue
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-from typing import List, Dict, Any, Tuple
-from pathlib import Path
-import tempfile
-from pydantic import BaseModel
-from scenedetect import detect, ContentDetector
-from scenedetect.scene_manager import save_images
+from typing import List, Dict, Any, Tuple, Callable, Optional, Iterator, TYPE_CHECKING
+from pydantic import BaseModel, Field
+from scenedetect import open_video, ContentDetector, SceneManager
+
+import instrumentation
+
+if TYPE_CHECKING:
+    from video_handler import VideoMetadata
 
 class VideoScene(BaseModel):
     start_time: float  # in seconds
     end_time: float  # in seconds
     duration: float  # in seconds
-    keyframe_path: str  # path to keyframe image
+    keyframe_path: str = ""  # path to keyframe image, if it was written to disk
     scene_type: str  # e.g., "wide-shot", "close-up", etc.
+    keyframe: bytes = Field(default=b"", repr=False)  # JPEG-encoded keyframe
+    keyframe_time: Optional[float] = None  # in seconds
+
+class DetectionReport(BaseModel):
+    video_path: str
+    reference_cuts: int
+    candidate_cuts: int
+    matched_cuts: int
+    precision: float
+    recall: float
+    mean_offset_frames: float
+    reference_seconds: float
+    candidate_seconds: float
+    speedup: float
+
+class _KeyframeTracker:
+    # Keeps a bounded, evenly spaced set of candidate frames for the scene that is
+    # still open. Whenever the set overflows the spacing doubles, so the middle frame
+    # of a scene of any length is known to within a few candidates once it closes.
+    # Frames outside [own_start, own_end) are decoded only to warm up the detector.
+
+    def __init__(self, max_candidates: int, own_start: int = 0, own_end: Optional[int] = None):
+
+        self.max_candidates = max(2, max_candidates)
+        self.own_start = own_start
+        self.own_end = own_end
+        self.lock = threading.Lock()
+        self.scene_start: Optional[int] = None
+        self.last_frame: Optional[int] = None
+        self.stride = 1
+        self.candidates: List[Tuple[int, np.ndarray]] = []
+
+    def add_frame(self, frame_num: int, frame: np.ndarray) -> None:
+
+        if frame_num < self.own_start or (self.own_end is not None and frame_num >= self.own_end):
+            return
+
+        with self.lock:
+            if self.scene_start is None:
+                self.scene_start = frame_num
+            self.last_frame = frame_num
+            if (frame_num - self.scene_start) % self.stride:
+                return
+            self.candidates.append((frame_num, frame))
+            if len(self.candidates) > self.max_candidates:
+                self.stride *= 2
+                self.candidates = [
+                    c for c in self.candidates if (c[0] - self.scene_start) % self.stride == 0
+                ]
+
+    def close_scene(self, end_frame: int) -> Tuple[int, int, List[Tuple[int, np.ndarray]]]:
+        # Closes the open scene at end_frame (inclusive) and returns its start, end and
+        # candidates. Candidates past the boundary were decoded ahead of the detector
+        # and seed the next scene.
+
+        with self.lock:
+            start_frame = self.scene_start if self.scene_start is not None else self.own_start
+            owned = [c for c in self.candidates if c[0] <= end_frame]
+            self.candidates = [c for c in self.candidates if c[0] > end_frame]
+            self.scene_start = end_frame + 1
+            self.stride = 1
+            return start_frame, end_frame, owned
+
+def _closest_to_middle(candidates: List[Tuple], start_frame: int, end_frame: int) -> Optional[Tuple]:
+
+    mid_frame = start_frame + ((end_frame - start_frame) // 2)
+    return min(candidates, key=lambda c: abs(c[0] - mid_frame), default=None)
+
+class _RecordingVideoStream:
+    # Hands every full-resolution frame to the keyframe tracker as the scene manager
+    # decodes it, before it is downscaled for the detector.
+
+    def __init__(self, video, tracker: _KeyframeTracker):
+
+        self._video = video
+        self._tracker = tracker
+
+    def read(self, decode: bool = True):
+
+        frame = self._video.read(decode)
+        if decode and frame is not False:
+            self._tracker.add_frame(self._video.position.frame_num, frame)
+        return frame
+
+    def __getattr__(self, name):
+        return getattr(self._video, name)
+
+class _CutNotifyingContentDetector(ContentDetector):
+
+    def __init__(self, on_cut: Callable[[int], None], **kwargs):
+
+        super().__init__(**kwargs)
+        self._on_cut = on_cut
+
+    def process_frame(self, timecode, frame_img):
+
+        cuts = super().process_frame(timecode, frame_img)
+        for cut in cuts:
+            self._on_cut(cut.frame_num)
+        return cuts
+
+    def post_process(self, timecode):
+
+        cuts = super().post_process(timecode)
+        for cut in cuts:
+            self._on_cut(cut.frame_num)
+        return cuts
+
+class _DetectionStopped(Exception):
+    pass
 
 class SceneAnalyzer:
 
-    def __init__(self, threshold: float = 27.0, min_scene_len: int = 15):
-       
+    def __init__(
+        self,
+        threshold: float = 27.0,
+        min_scene_len: int = 15,
+        keyframe_candidates: int = 8,
+        frame_skip: int = 0,
+        detect_width: Optional[int] = None,
+        workers: int = 1,
+        min_chunk_seconds: float = 60.0,
+        chunk_overlap: float = 2.0,
+        keyframe_max_width: int = 1024,
+        keyframe_max_height: int = 1024,
+        keyframe_quality: int = 85
+    ):
+        # frame_skip > 0 and/or detect_width select the fast detection mode: only every
+        # (frame_skip + 1)th frame is decoded, at roughly detect_width pixels wide, and
+        # each coarse cut is then refined to the exact frame around its boundary.
+        # workers > 1 splits videos longer than min_chunk_seconds into time ranges that
+        # are detected in a process pool, each range overlapping its neighbours by
+        # chunk_overlap seconds. Keyframes are kept in memory as JPEG buffers, scaled
+        # down to fit keyframe_max_width x keyframe_max_height.
+
         self.threshold = threshold
         self.min_scene_len = min_scene_len
-    
-    def detect_scenes(self, video_path: str) -> List[VideoScene]:
-       
-        temp_dir = tempfile.mkdtemp()
-        
-        scene_list = detect(video_path, ContentDetector(
+        self.keyframe_candidates = keyframe_candidates
+        self.frame_skip = frame_skip
+        self.detect_width = detect_width
+        self.workers = workers
+        self.min_chunk_seconds = min_chunk_seconds
+        self.chunk_overlap = chunk_overlap
+        self.keyframe_max_width = keyframe_max_width
+        self.keyframe_max_height = keyframe_max_height
+        self.keyframe_quality = keyframe_quality
+
+    def detect_scenes(self, video_path: str, video_metadata: "VideoMetadata" = None) -> List[VideoScene]:
+        # Scene detection and keyframe extraction share a single decode of the video:
+        # candidate keyframes are kept while the content detector sees the frames, and
+        # each scene's keyframe is picked as soon as the cut that closes it is reported.
+
+        fps, total_frames = self._video_timing(video_path, video_metadata)
+
+        # CPU time of worker processes isn't counted in the stage.
+        with instrumentation.stage("scene_detection"):
+            ranges = self._plan_ranges(total_frames, fps)
+            if len(ranges) > 1:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges))) as executor:
+                    futures = [
+                        executor.submit(self._scan_range, video_path, own_start, own_end)
+                        for own_start, own_end in ranges
+                    ]
+                    results = [future.result() for future in futures]
+            else:
+                results = [self._scan_range(video_path, 0, None)]
+
+            cuts = sorted(cut for result in results for cut in result["cuts"])
+            scenes = self._assemble_scenes(results, bool(cuts), fps)
+
+            if self.frame_skip > 0 and cuts:
+                scenes = self._refine_cuts(video_path, scenes, cuts, fps)
+
+        return scenes
+
+    def artifact_params(self) -> Dict[str, Any]:
+        # The settings that change the detected scenes or their keyframes; workers and
+        # chunking don't.
+        return {
+            "threshold": self.threshold,
+            "min_scene_len": self.min_scene_len,
+            "keyframe_candidates": self.keyframe_candidates,
+            "frame_skip": self.frame_skip,
+            "detect_width": self.detect_width,
+            "keyframe_max_width": self.keyframe_max_width,
+            "keyframe_max_height": self.keyframe_max_height,
+            "keyframe_quality": self.keyframe_quality
+        }
+
+    def _video_timing(self, video_path: str, video_metadata: "VideoMetadata" = None) -> Tuple[float, int]:
+        # Frame rate and frame count from the probed metadata, so the container isn't
+        # opened again just to read them.
+
+        if video_metadata is not None:
+            return video_metadata.fps, video_metadata.frame_count
+        video = open_video(video_path)
+        total_frames = video.duration.frame_num if video.duration is not None else 0
+        return float(video.frame_rate), total_frames
+
+    def _plan_ranges(self, total_frames: int, fps: float) -> List[Tuple[int, Optional[int]]]:
+        # Splits [0, total_frames) into equal ranges of at least min_chunk_seconds. The
+        # last range is left open-ended, as container frame counts can be inexact.
+
+        if self.workers <= 1 or total_frames <= 0:
+            return [(0, None)]
+
+        min_chunk_frames = max(1, round(self.min_chunk_seconds * fps))
+        num_ranges = max(1, min(self.workers, total_frames // min_chunk_frames))
+        bounds = [i * total_frames // num_ranges for i in range(num_ranges)]
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def _scan_range(
+        self,
+        video_path: str,
+        own_start: int,
+        own_end: Optional[int],
+        on_piece: Optional[Callable[[Dict[str, Any], bool], None]] = None
+    ) -> Dict[str, Any]:
+        # Detects the cuts in [own_start, own_end) and returns them along with the scene
+        # pieces between them. Decoding starts chunk_overlap seconds early so the
+        # detector's state matches a serial run by own_start, and runs on past own_end
+        # so cuts that the detector reports late are still caught. Pieces that touch
+        # the range edges keep all their candidates, because the rest of their scene
+        # lives in a neighbouring range; every other piece keeps only its keyframe.
+        # on_piece, if given, is called with each piece as soon as it closes.
+
+        video = open_video(video_path)
+        fps = float(video.frame_rate)
+        overlap = max(2 * self.min_scene_len, round(self.chunk_overlap * fps))
+        scan_start = max(0, own_start - overlap)
+        if scan_start > 0:
+            video.seek(scan_start)
+
+        tracker = _KeyframeTracker(self.keyframe_candidates, own_start, own_end)
+        pieces = []
+        cuts = []
+        starts_at_cut = own_start == 0
+
+        def close_piece(end_frame: int, at_range_end: bool) -> None:
+            start_frame, end_frame, candidates = tracker.close_scene(end_frame)
+            on_edge = (not pieces and own_start > 0) or (at_range_end and own_end is not None)
+            if not on_edge:
+                keyframe = _closest_to_middle(candidates, start_frame, end_frame)
+                candidates = [keyframe] if keyframe is not None else []
+            pieces.append({
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+                "starts_at_cut": starts_at_cut or bool(pieces),
+                "ends_at_cut": not at_range_end,
+                "candidates": [
+                    (frame_num, self._encode_keyframe(frame), self._detect_scene_type(frame))
+                    for frame_num, frame in candidates
+                ]
+            })
+            if on_piece:
+                on_piece(pieces[-1], at_range_end)
+
+        def on_cut(cut_frame: int) -> None:
+            nonlocal starts_at_cut
+            if cut_frame < own_start or (own_end is not None and cut_frame >= own_end):
+                return
+            if cut_frame == own_start:
+                # The range begins exactly on a cut found by the warmed-up detector.
+                cuts.append(cut_frame)
+                starts_at_cut = True
+            elif tracker.scene_start is not None and cut_frame > tracker.scene_start:
+                cuts.append(cut_frame)
+                close_piece(cut_frame - 1, False)
+
+        scene_manager = SceneManager()
+        if self.detect_width:
+            scene_manager.auto_downscale = False
+            scene_manager.downscale = max(1, video.frame_size[0] // self.detect_width)
+        scene_manager.add_detector(_CutNotifyingContentDetector(
+            on_cut,
             threshold=self.threshold,
             min_scene_len=self.min_scene_len
         ))
-        
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        
-        scenes = []
-        for i, scene in enumerate(scene_list):
-            start_frame = scene[0].get_frames()
-            end_frame = scene[1].get_frames() - 1
-            
-            start_time = start_frame / fps
-            end_time = end_frame / fps
-            duration = end_time - start_time
-            
-            mid_frame = start_frame + ((end_frame - start_frame) // 2)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, mid_frame)
-            ret, frame = cap.read()
-            
-            keyframe_path = os.path.join(temp_dir, f"scene_{i}_frame_{mid_frame}.jpg")
-            if ret:
-                cv2.imwrite(keyframe_path, frame)
-            else:
-                keyframe_path = ""
-            
-            scene_type = self._detect_scene_type(frame) if ret else "unknown"
-            
-            scenes.append(VideoScene(
-                start_time=start_time,
-                end_time=end_time,
-                duration=duration,
-                keyframe_path=keyframe_path,
-                scene_type=scene_type
-            ))
-        cap.release()
-        
-        if not scenes:
-            cap = cv2.VideoCapture(video_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            duration = total_frames / fps
-            
-            mid_frame = total_frames // 2
-            cap.set(cv2.CAP_PROP_POS_FRAMES, mid_frame)
-            ret, frame = cap.read()
-            
-            keyframe_path = os.path.join(temp_dir, f"scene_0_frame_{mid_frame}.jpg")
-            if ret:
-                cv2.imwrite(keyframe_path, frame)
-                scene_type = self._detect_scene_type(frame)
-            else:
-                keyframe_path = ""
-                scene_type = "unknown"
-            
-            scenes.append(VideoScene(
-                start_time=0.0,
-                end_time=duration,
-                duration=duration,
-                keyframe_path=keyframe_path,
-                scene_type=scene_type
-            ))
-            
-            cap.release()
+        scene_manager.detect_scenes(
+            video=_RecordingVideoStream(video, tracker),
+            end_time=own_end + overlap if own_end is not None else None,
+            frame_skip=self.frame_skip
+        )
+
+        if tracker.last_frame is not None:
+            close_piece(tracker.last_frame, True)
+
+        return {"cuts": cuts, "pieces": pieces}
+
+    def _assemble_scenes(
+        self,
+        results: List[Dict[str, Any]],
+        has_cuts: bool,
+        fps: float
+    ) -> List[VideoScene]:
+        # Joins the pieces of consecutive ranges into scenes: a piece continues the
+        # previous scene unless it starts on a cut. Each scene keeps the candidate
+        # closest to its middle.
+
+        groups = []
+        for result in results:
+            for piece in result["pieces"]:
+                if groups and not piece["starts_at_cut"]:
+                    groups[-1]["end_frame"] = piece["end_frame"]
+                    groups[-1]["candidates"] += piece["candidates"]
+                else:
+                    groups.append(dict(piece, candidates=list(piece["candidates"])))
+
+        if groups and not has_cuts:
+            # No cuts: the whole video is a single scene.
+            groups[-1]["end_frame"] += 1
+
+        return [self._scene_from_piece(group, fps) for group in groups]
+
+    def _scene_from_piece(self, piece: Dict[str, Any], fps: float) -> VideoScene:
+
+        start_time = piece["start_frame"] / fps
+        end_time = piece["end_frame"] / fps
+
+        keyframe = _closest_to_middle(piece["candidates"], piece["start_frame"], piece["end_frame"])
+        if keyframe is not None and keyframe[1]:
+            keyframe_time, keyframe_data, scene_type = keyframe[0] / fps, keyframe[1], keyframe[2]
+        else:
+            keyframe_time, keyframe_data, scene_type = None, b"", "unknown"
+
+        return VideoScene(
+            start_time=start_time,
+            end_time=end_time,
+            duration=end_time - start_time,
+            scene_type=scene_type,
+            keyframe=keyframe_data,
+            keyframe_time=keyframe_time
+        )
+
+    def _encode_keyframe(self, frame: np.ndarray) -> bytes:
+
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.keyframe_max_width / width, self.keyframe_max_height / height)
+        if scale < 1.0:
+            frame = cv2.resize(
+                frame,
+                (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.keyframe_quality])
+        return buffer.tobytes() if ok else b""
+
+    def _refine_cuts(
+        self,
+        video_path: str,
+        scenes: List[VideoScene],
+        cuts: List[int],
+        fps: float
+    ) -> List[VideoScene]:
+        # A cut reported at sampled frame c happened somewhere after the previous
+        # sample, c - (frame_skip + 1). Only that window is decoded again, at the
+        # detector's default resolution, to place the cut on the exact frame.
+
+        video = open_video(video_path)
+        refined = [self._refine_cut(video, cut) for cut in cuts]
+
+        for i, cut in enumerate(refined):
+            end_time = (cut - 1) / fps
+            scenes[i] = scenes[i].model_copy(update={
+                "end_time": end_time,
+                "duration": end_time - scenes[i].start_time
+            })
+            start_time = cut / fps
+            scenes[i + 1] = scenes[i + 1].model_copy(update={
+                "start_time": start_time,
+                "duration": scenes[i + 1].end_time - start_time
+            })
         return scenes
-    
+
+    def _refine_cut(self, video, cut: int) -> int:
+
+        step = self.frame_skip + 1
+        scene_manager = SceneManager()
+        scene_manager.add_detector(ContentDetector(threshold=self.threshold, min_scene_len=1))
+        try:
+            video.seek(max(0, cut - step))
+            scene_manager.detect_scenes(video=video, end_time=cut + 1)
+            window_cuts = [start.frame_num for start, _ in scene_manager.get_scene_list()[1:]]
+        except Exception as e:
+            print(f"Error refining cut at frame {cut}: {str(e)}")
+            window_cuts = []
+        return window_cuts[-1] if window_cuts else cut
+
+    def iter_scenes(
+        self,
+        video_path: str,
+        max_pending: int = 4,
+        video_metadata: "VideoMetadata" = None
+    ) -> Iterator[VideoScene]:
+        # Yields scenes in order while detection is still running, so each one can be
+        # processed as soon as the cut that closes it is found. Detection runs on a
+        # background thread and stops once max_pending pieces are waiting to be
+        # consumed, so memory stays bounded however long the video is. With workers > 1
+        # the ranges are detected in a process pool as in detect_scenes, and each
+        # range's pieces are passed on, in order, as soon as it and every range before
+        # it have finished.
+
+        fps, total_frames = self._video_timing(video_path, video_metadata)
+
+        pending = queue.Queue(maxsize=max(1, max_pending))
+        stopped = threading.Event()
+
+        def put(item) -> None:
+            while not stopped.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+            raise _DetectionStopped()
+
+        def detect() -> None:
+            try:
+                # Includes the time spent waiting for the consumer to catch up.
+                with instrumentation.stage("scene_detection"):
+                    ranges = self._plan_ranges(total_frames, fps)
+                    if len(ranges) > 1:
+                        executor = ProcessPoolExecutor(max_workers=min(self.workers, len(ranges)))
+                        try:
+                            futures = [
+                                executor.submit(self._scan_range, video_path, own_start, own_end)
+                                for own_start, own_end in ranges
+                            ]
+                            for future in futures:
+                                for piece in future.result()["pieces"]:
+                                    put(("piece", piece))
+                        finally:
+                            executor.shutdown(wait=True, cancel_futures=True)
+                    else:
+                        self._scan_range(video_path, 0, None, on_piece=lambda piece, last: put(("piece", piece)))
+                put(("done", None))
+            except _DetectionStopped:
+                pass
+            except Exception as e:
+                try:
+                    put(("error", e))
+                except _DetectionStopped:
+                    pass
+
+        thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(detect,), name="scene-detection", daemon=True
+        )
+        thread.start()
+
+        refine_video = open_video(video_path) if self.frame_skip > 0 else None
+
+        def close(group: Dict[str, Any], cut: Optional[int]) -> Tuple[VideoScene, Optional[int]]:
+            # Ends group at cut, placed on the exact frame in fast mode, and returns
+            # where the next scene starts.
+            if cut is not None and refine_video is not None:
+                cut = self._refine_cut(refine_video, cut)
+                group = dict(group, end_frame=cut - 1)
+            return self._scene_from_piece(group, fps), cut
+
+        group = None
+        start_frame = None
+        first = True
+        try:
+            while True:
+                kind, piece = pending.get()
+                if kind == "error":
+                    raise piece
+                if kind == "done":
+                    break
+
+                if group is not None and not piece["starts_at_cut"]:
+                    # The rest of a scene that crosses into the next range.
+                    group["end_frame"] = piece["end_frame"]
+                    group["candidates"] += piece["candidates"]
+                else:
+                    if group is not None:
+                        # The previous range ended exactly on this cut.
+                        scene, start_frame = close(group, piece["start_frame"])
+                        first = False
+                        yield scene
+                    group = dict(piece, candidates=list(piece["candidates"]))
+                    if start_frame is not None:
+                        group["start_frame"] = start_frame
+                    start_frame = None
+
+                if piece["ends_at_cut"]:
+                    scene, start_frame = close(group, group["end_frame"] + 1)
+                    group = None
+                    first = False
+                    yield scene
+
+            if group is not None:
+                if first:
+                    # No cuts: the whole video is a single scene.
+                    group["end_frame"] += 1
+                yield self._scene_from_piece(group, fps)
+        finally:
+            stopped.set()
+            thread.join()
+
+    def compare_with_reference(self, video_path: str, tolerance_frames: int = 1) -> DetectionReport:
+        # Runs the default full-resolution detector and this analyzer on the same video
+        # and reports how closely this analyzer's cuts match, and how much faster it is.
+        # The video is probed once, and both runs and the comparison take its timing
+        # from that.
+
+        from video_handler import probe_video
+        video_metadata = probe_video(video_path)
+        reference = SceneAnalyzer(
+            threshold=self.threshold,
+            min_scene_len=self.min_scene_len,
+            keyframe_candidates=self.keyframe_candidates
+        )
+
+        started = time.perf_counter()
+        reference_scenes = reference.detect_scenes(video_path, video_metadata)
+        reference_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        candidate_scenes = self.detect_scenes(video_path, video_metadata)
+        candidate_seconds = time.perf_counter() - started
+
+        fps = video_metadata.fps
+        reference_cuts = [round(scene.start_time * fps) for scene in reference_scenes[1:]]
+        candidate_cuts = [round(scene.start_time * fps) for scene in candidate_scenes[1:]]
+
+        unmatched = list(reference_cuts)
+        offsets = []
+        for cut in candidate_cuts:
+            nearest = min(unmatched, key=lambda c: abs(c - cut), default=None)
+            if nearest is not None and abs(nearest - cut) <= tolerance_frames:
+                unmatched.remove(nearest)
+                offsets.append(abs(nearest - cut))
+
+        matched = len(offsets)
+        return DetectionReport(
+            video_path=video_path,
+            reference_cuts=len(reference_cuts),
+            candidate_cuts=len(candidate_cuts),
+            matched_cuts=matched,
+            precision=matched / len(candidate_cuts) if candidate_cuts else 1.0,
+            recall=matched / len(reference_cuts) if reference_cuts else 1.0,
+            mean_offset_frames=sum(offsets) / matched if matched else 0.0,
+            reference_seconds=reference_seconds,
+            candidate_seconds=candidate_seconds,
+            speedup=reference_seconds / candidate_seconds if candidate_seconds > 0 else 0.0
+        )
+
     def _detect_scene_type(self, frame: np.ndarray) -> str:
         
         if frame is None:
@@ -109,4 +586,45 @@ class SceneAnalyzer:
         elif edge_density > 0.05:
             return "medium-shot"
         else:
-            return "wide-shot"
\ No newline at end of file
+            return "wide-shot"
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare fast scene detection settings against full detection"
+    )
+    parser.add_argument(
+        "video_paths",
+        nargs="+",
+        help="Paths to video files"
+    )
+    parser.add_argument(
+        "--frame-skip",
+        type=int,
+        default=2,
+        help="Frames to skip between analyzed frames"
+    )
+    parser.add_argument(
+        "--detect-width",
+        type=int,
+        default=None,
+        help="Approximate frame width used for detection"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=1,
+        help="Maximum cut offset, in frames, counted as a match"
+    )
+
+    args = parser.parse_args()
+
+    analyzer = SceneAnalyzer(frame_skip=args.frame_skip, detect_width=args.detect_width)
+    reports = [
+        analyzer.compare_with_reference(video_path, args.tolerance).model_dump()
+        for video_path in args.video_paths
+    ]
+
+    print(json.dumps(reports, indent=2))
+
+if __name__ == "__main__":
+    main()
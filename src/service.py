@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, Callable, List
+from pydantic import BaseModel
+
+from output_renderer import OutputFormat
+
+class NarrationJob(BaseModel):
+    id: str
+    video_path: str
+    priority: int = 0  # higher runs first
+    output_format: str = "json"
+    mux: bool = False
+    status: str = "queued"  # queued, running, succeeded or failed
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class NarrationService:
+    # Keeps one process, with its clients and caches, warm between videos. Jobs wait
+    # in a priority queue and up to `workers` of them run at once. The OpenAI and
+    # ElevenLabs caps of the shared generators still apply across all of them.
+    # With input_root, local video paths must lie inside it; relative ones are taken
+    # from it. Only the max_finished_jobs most recently finished jobs are kept.
+    # scene_options are passed to main.load_components to set up the scene analyzer.
+
+    def __init__(
+        self,
+        process: Optional[Callable[..., Dict]] = None,
+        output_dir: str = "output",
+        workers: int = 2,
+        input_root: Optional[str] = None,
+        max_finished_jobs: int = 1000,
+        scene_options: Optional[Dict[str, Any]] = None
+    ):
+
+        if process is None:
+            # The clients and heavy dependencies are loaded once, up front, and stay
+            # warm for the life of the service.
+            import main
+            main.load_components(**(scene_options or {}))
+            process = main.process_video
+
+        self.process = process
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.input_root = os.path.realpath(input_root) if input_root is not None else None
+        self.max_finished_jobs = max(0, max_finished_jobs)
+        self.jobs: Dict[str, NarrationJob] = {}
+        self._queue = queue.PriorityQueue()
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"narration-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        # Lets running jobs finish; queued jobs stay queued.
+
+        for _ in self._threads:
+            self._queue.put((float("-inf"), -1, None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, video_path: str, priority: int = 0, output_format: str = "json", mux: bool = False) -> NarrationJob:
+
+        OutputFormat(output_format)
+        video_path = self._resolve_input(video_path)
+        job = NarrationJob(
+            id=uuid.uuid4().hex,
+            video_path=video_path,
+            priority=priority,
+            output_format=output_format,
+            mux=mux,
+            submitted_at=time.time()
+        )
+        with self._lock:
+            self.jobs[job.id] = job
+            # Equal priorities run in submission order.
+            self._sequence += 1
+            self._queue.put((-priority, self._sequence, job.id))
+        return job.model_copy()
+
+    def get(self, job_id: str) -> Optional[NarrationJob]:
+
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def list_jobs(self) -> List[NarrationJob]:
+
+        with self._lock:
+            return [job.model_copy() for job in self.jobs.values()]
+
+    def _resolve_input(self, video_path: str) -> str:
+
+        if self.input_root is None or video_path.startswith(("http://", "https://")):
+            return video_path
+        path = os.path.realpath(os.path.join(self.input_root, video_path))
+        if os.path.commonpath([self.input_root, path]) != self.input_root:
+            raise ValueError(f"video_path is outside the input root: {video_path}")
+        return path
+
+    def _prune(self) -> None:
+        # Forgets the oldest finished jobs beyond max_finished_jobs. Called with the
+        # lock held.
+
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at
+        )
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.id]
+
+    def _work(self) -> None:
+
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+
+            with self._lock:
+                job = self.jobs[job_id]
+                job.status = "running"
+                job.started_at = time.time()
+
+            try:
+                result = self.process(job.video_path, self.output_dir, OutputFormat(job.output_format), job.mux)
+                update = {"status": "succeeded", "result": result}
+            except Exception as e:
+                print(f"Error processing job {job_id}: {str(e)}")
+                update = {"status": "failed", "error": str(e)}
+
+            with self._lock:
+                for field, value in update.items():
+                    setattr(job, field, value)
+                job.finished_at = time.time()
+                self._prune()
+
+def _make_handler(service: NarrationService):
+
+    class NarrationRequestHandler(BaseHTTPRequestHandler):
+        # POST /jobs                      submit {"video_path", "priority", "format", "mux"}
+        # GET  /jobs                      list all jobs
+        # GET  /jobs/<id>                 job status and result
+        # GET  /jobs/<id>/outputs/<name>  download an output ("script", "audio", ...)
+        # GET  /health
+
+        def do_GET(self):
+
+            parts = [part for part in self.path.split("?")[0].split("/") if part]
+            if parts == ["health"]:
+                return self._send_json(200, {"status": "ok", "jobs": len(service.jobs)})
+            if parts == ["jobs"]:
+                return self._send_json(200, {"jobs": [job.model_dump() for job in service.list_jobs()]})
+            if len(parts) >= 2 and parts[0] == "jobs":
+                job = service.get(parts[1])
+                if job is None:
+                    return self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+                if len(parts) == 2:
+                    return self._send_json(200, job.model_dump())
+                if len(parts) == 4 and parts[2] == "outputs":
+                    return self._send_output(job, parts[3])
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+
+        def do_POST(self):
+
+            if self.path.rstrip("/") != "/jobs":
+                return self._send_json(404, {"error": f"Not found: {self.path}"})
+            try:
+                length = int(self.headers.get("Content-Length", "0"))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                job = service.submit(
+                    request["video_path"],
+                    priority=int(request.get("priority", 0)),
+                    output_format=request.get("format", "json"),
+                    mux=bool(request.get("mux", False))
+                )
+            except (KeyError, ValueError, TypeError) as e:
+                return self._send_json(400, {"error": f"Invalid job request: {str(e)}"})
+            self._send_json(202, job.model_dump())
+
+        def _send_output(self, job: NarrationJob, name: str):
+
+            if job.status != "succeeded":
+                return self._send_json(409, {"error": f"Job is {job.status}"})
+            path = job.result.get("outputs", {}).get(name)
+            if not isinstance(path, str) or not os.path.exists(path):
+                return self._send_json(404, {"error": f"No output named {name}"})
+            if not os.path.isfile(path):
+                # Directories, like an HLS package, can't be sent as one download.
+                return self._send_json(400, {"error": f"Output {name} is not a file"})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+
+        def _send_json(self, status: int, body: Dict[str, Any]):
+
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return NarrationRequestHandler
+
+def create_server(service: NarrationService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    return ThreadingHTTPServer((host, port), _make_handler(service))
+
+def main():
+    parser = argparse.ArgumentParser(description="Video Narration Service (resident HTTP mode)")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to listen on"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="output",
+        help="Directory to save outputs"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("NARRATION_SERVICE_WORKERS", "2")),
+        help="Number of videos processed at once"
+    )
+    parser.add_argument(
+        "--input-root",
+        default=os.environ.get("NARRATION_INPUT_ROOT", "."),
+        help="Directory that local video paths must be inside; relative paths are taken from it"
+    )
+    parser.add_argument(
+        "--max-finished-jobs",
+        type=int,
+        default=int(os.environ.get("NARRATION_SERVICE_MAX_FINISHED_JOBS", "1000")),
+        help="Finished jobs kept for status queries; older ones are forgotten"
+    )
+
+    parser.add_argument(
+        "--frame-skip",
+        type=int,
+        help="Fast scene detection: frames skipped between analyzed frames (default: SCENE_FRAME_SKIP or 0)"
+    )
+    parser.add_argument(
+        "--detect-width",
+        type=int,
+        help="Fast scene detection: approximate frame width the detector sees (default: SCENE_DETECT_WIDTH or 0, automatic)"
+    )
+    parser.add_argument(
+        "--scene-workers",
+        type=int,
+        help="Processes detecting scenes in separate time ranges of long videos (default: SCENE_WORKERS or 1)"
+    )
+
+    args = parser.parse_args()
+
+    service = NarrationService(
+        output_dir=args.output_dir,
+        workers=args.workers,
+        input_root=args.input_root,
+        max_finished_jobs=args.max_finished_jobs,
+        scene_options={
+            "frame_skip": args.frame_skip,
+            "detect_width": args.detect_width,
+            "scene_workers": args.scene_workers
+        }
+    )
+    service.start()
+    server = create_server(service, args.host, args.port)
+    print(f"Narration service listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import functools
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _find_tool(name: str, env_var: str) -> str:
+    # Looks in the setting named by env_var, then the project's tools/ directory, then
+    # PATH. Nothing is downloaded or installed.
+
+    configured = os.environ.get(env_var)
+    if configured:
+        path = shutil.which(configured)
+        if path is None:
+            raise FileNotFoundError(f"{env_var} is set to {configured}, which is not an executable")
+        return path
+
+    tools_dir = os.path.join(PROJECT_ROOT, "tools")
+    for candidate in (name, f"{name}.exe"):
+        path = shutil.which(os.path.join(tools_dir, candidate))
+        if path:
+            return path
+
+    path = shutil.which(name)
+    if path is None:
+        raise FileNotFoundError(
+            f"{name} not found: install it on PATH, place it in {tools_dir}, or set {env_var}"
+        )
+    return path
+
+@functools.lru_cache(maxsize=None)
+def find_ffmpeg() -> str:
+    return _find_tool("ffmpeg", "FFMPEG_PATH")
+
+@functools.lru_cache(maxsize=None)
+def find_ffprobe() -> str:
+    return _find_tool("ffprobe", "FFPROBE_PATH")
@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from typing import Dict
+
+def normalize_text(text: str) -> str:
+    # Whitespace and Unicode composition differences don't change the spoken audio.
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class TTSCache:
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = sum(os.path.getsize(path) for path in self._entries())
+
+    def key(self, text: str, voice_id: str, model_id: str, stability: float, similarity_boost: float) -> str:
+
+        settings = json.dumps({
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "stability": stability,
+            "similarity_boost": similarity_boost,
+            "text_sha256": hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        }, sort_keys=True)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def _entries(self):
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".mp3"):
+                    yield os.path.join(root, name)
+
+    def get(self, key: str, destination: str) -> bool:
+        # Places the cached clip at destination, returning False on a miss.
+
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.utime(path)
+                _link_or_copy(path, destination)
+            except FileNotFoundError:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def put(self, key: str, source: str) -> None:
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Written under a temporary name and renamed, so readers never see a partial clip.
+        fd, partial_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, partial_path)
+        except Exception:
+            os.remove(partial_path)
+            raise
+
+        with self._lock:
+            # A clip already cached under this key is replaced, not added to.
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(partial_path, path)
+            self._total_bytes += os.path.getsize(path) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Removes least recently used clips until the cache fits in max_bytes.
+
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._total_bytes}
+
+def _link_or_copy(source: str, destination: str) -> None:
+
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
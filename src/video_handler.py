@@ -1,12 +1,22 @@
 
 import os
+import re
+import json
+import hashlib
 import tempfile
+import functools
+import threading
+import subprocess
+from fractions import Fraction
 from pathlib import Path
-from typing import Union, Dict, Any
-import cv2
-import requests
+from typing import Union, Dict, Optional
 from pydantic import BaseModel
 
+import instrumentation
+from download_cache import DownloadCache, Download
+from artifact_store import content_hash
+from toolchain import find_ffmpeg, find_ffprobe
+
 class VideoMetadata(BaseModel):
     path: str
     duration: float  # in seconds
@@ -16,57 +26,191 @@ class VideoMetadata(BaseModel):
     height: int
     has_audio: bool
 
+def probe_video(path: str) -> VideoMetadata:
+    # Reads the container once with ffprobe, or with ffmpeg if ffprobe isn't
+    # installed. Local files are memoized by (path, size, mtime) and their frames are
+    # counted from the packet index, which stays exact for variable frame rate
+    # sources. Anything else (such as a download still streaming in) is probed from
+    # its header alone.
+
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        metadata = _probe_file(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        return metadata.model_copy(update={"path": path})
+    return _probe(path, count_frames=False)
+
+@functools.lru_cache(maxsize=256)
+def _probe_file(path: str, size: int, mtime_ns: int) -> VideoMetadata:
+    return _probe(path, count_frames=True)
+
+def _probe(path: str, count_frames: bool) -> VideoMetadata:
+
+    try:
+        ffprobe = find_ffprobe()
+    except FileNotFoundError:
+        with instrumentation.request("ffmpeg.probe"):
+            return _probe_with_ffmpeg(find_ffmpeg(), path, count_frames)
+    with instrumentation.request("ffmpeg.probe"):
+        return _probe_with_ffprobe(ffprobe, path, count_frames)
+
+def _probe_with_ffprobe(ffprobe: str, path: str, count_frames: bool) -> VideoMetadata:
+
+    command = [ffprobe, "-v", "error", "-show_format", "-show_streams", "-of", "json"]
+    if count_frames:
+        command += ["-count_packets"]
+    result = subprocess.run(command + [path], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe failed on {path}")
+    info = json.loads(result.stdout)
+
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise RuntimeError(f"No video stream in {path}")
+
+    fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+    duration = float(info.get("format", {}).get("duration") or video.get("duration") or 0)
+    frames = video.get("nb_read_packets") or video.get("nb_frames")
+    frame_count = int(frames) if frames else round(duration * fps)
+
+    return VideoMetadata(
+        path=path,
+        duration=duration or (frame_count / fps if fps > 0 else 0),
+        fps=fps,
+        frame_count=frame_count,
+        width=int(video.get("width", 0)),
+        height=int(video.get("height", 0)),
+        has_audio=any(s.get("codec_type") == "audio" for s in streams)
+    )
+
+def _probe_with_ffmpeg(ffmpeg: str, path: str, count_frames: bool) -> VideoMetadata:
+    # ffmpeg prints the container summary to stderr. When counting, the video
+    # packets are listed one per line by the framecrc muxer, without decoding.
+
+    command = [ffmpeg, "-hide_banner", "-nostdin", "-i", path]
+    if count_frames:
+        command += ["-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    result = subprocess.run(command, capture_output=True)
+    summary = result.stderr.decode("utf-8", errors="replace")
+
+    video_line = re.search(r"Stream #\S+.*?: Video: (.*)", summary)
+    if video_line is None:
+        raise RuntimeError(summary.strip().splitlines()[-1] if summary.strip() else f"ffmpeg failed on {path}")
+    size = re.search(r"\b(\d{2,5})x(\d{2,5})\b", video_line.group(1))
+    rate = re.search(r"([\d.]+)(k?) fps", video_line.group(1)) or re.search(r"([\d.]+)(k?) tbr", video_line.group(1))
+    fps = float(rate.group(1)) * (1000 if rate.group(2) else 1) if rate else 0.0
+
+    duration = 0.0
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", summary)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    if count_frames and result.returncode == 0:
+        frame_count = sum(1 for line in result.stdout.splitlines() if line and not line.startswith(b"#"))
+    else:
+        frame_count = round(duration * fps)
+
+    return VideoMetadata(
+        path=path,
+        duration=duration or (frame_count / fps if fps > 0 else 0),
+        fps=fps,
+        frame_count=frame_count,
+        width=int(size.group(1)) if size else 0,
+        height=int(size.group(2)) if size else 0,
+        has_audio=re.search(r"Stream #\S+.*?: Audio:", summary) is not None
+    )
+
+def _parse_rate(rate: Optional[str]) -> float:
+
+    try:
+        return float(Fraction(rate))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+
 class VideoInputHandler:
 
+    def __init__(self, download_cache: DownloadCache = None, stream_urls: bool = None):
+        # http(s) sources are fetched into a URL-keyed cache. With stream_urls, the
+        # metadata probe and scene detection read the file through the cache's
+        # loopback stream while the rest of it is still arriving.
+
+        if download_cache is None:
+            cache_dir = os.environ.get("NARRATION_CACHE_DIR", "cache") or os.path.join(
+                tempfile.gettempdir(), "video-narration"
+            )
+            download_cache = DownloadCache(
+                os.path.join(cache_dir, "downloads"),
+                max_bytes=int(os.environ.get("DOWNLOAD_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+            )
+        if stream_urls is None:
+            stream_urls = os.environ.get("NARRATION_STREAM_URLS", "1").lower() not in ("0", "false", "no")
+
+        self.download_cache = download_cache
+        self.stream_urls = stream_urls
+        self._downloads: Dict[str, Download] = {}
+        self._lock = threading.Lock()
+
     def handle_input(self, source: Union[str, Path]) -> VideoMetadata:
         
         source = str(source)
         
         if source.startswith(('http://', 'https://')):
- 
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
+            # Every call revalidates; a fetch of the URL already in progress is shared.
+            download = self.download_cache.start(source)
+            with self._lock:
+                self._downloads[source] = download
             try:
-                response = requests.get(source, stream=True)
-                response.raise_for_status()
-                
-                for chunk in response.iter_content(chunk_size=8192):
-                    temp_file.write(chunk)
-                
-                temp_file.close()
-                video_path = temp_file.name
+                download.wait_started()
             except Exception as e:
-                if os.path.exists(temp_file.name):
-                    os.unlink(temp_file.name)
                 raise ValueError(f"Failed to download video from URL: {str(e)}")
+            
+            if self.stream_urls and not download.done:
+                video_path = self.download_cache.stream_url(download)
+            else:
+                video_path = self.local_path(source)
         else:
             if not os.path.exists(source):
                 raise ValueError(f"Video file not found: {source}")
             video_path = source
         
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise ValueError(f"Failed to open video: {video_path}")
-            
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            duration = frame_count / fps if fps > 0 else 0
-            
-            has_audio = True  
-            
-            cap.release()
-            
-            return VideoMetadata(
-                path=video_path,
-                duration=duration,
-                fps=fps,
-                frame_count=frame_count,
-                width=width,
-                height=height,
-                has_audio=has_audio
-            )
+            with instrumentation.stage("probe"):
+                return probe_video(video_path)
         except Exception as e:
-            raise ValueError(f"Failed to extract video metadata: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Failed to extract video metadata: {str(e)}")
+
+    def source_id(self, source: Union[str, Path]) -> str:
+        # Identifies the content of source: a local file by its real path, size and
+        # modification time, which is enough to notice it was replaced without reading
+        # it; a URL by its ETag/Last-Modified, so checkpoint keys are known before the
+        # download completes. A URL without either is hashed once it has downloaded.
+
+        source = str(source)
+        if source.startswith(('http://', 'https://')):
+            with self._lock:
+                download = self._downloads.get(source)
+            if download is not None and download.validator:
+                return hashlib.sha256(f"{source}\n{download.validator}".encode("utf-8")).hexdigest()
+            return content_hash(self.local_path(source))
+        stat = os.stat(source)
+        return hashlib.sha256(
+            f"{os.path.realpath(source)}\n{stat.st_size}\n{stat.st_mtime_ns}".encode("utf-8")
+        ).hexdigest()
+
+    def local_path(self, source: Union[str, Path]) -> str:
+        # The local file for source, waiting for its download to finish if needed.
+
+        source = str(source)
+        if not source.startswith(('http://', 'https://')):
+            return source
+        with self._lock:
+            download = self._downloads.get(source)
+            if download is None or download.error is not None:
+                download = self.download_cache.start(source)
+                self._downloads[source] = download
+        try:
+            return download.wait()
+        except Exception as e:
+            raise ValueError(f"Failed to download video from URL: {str(e)}")
+
@@ -0,0 +1,135 @@
+import re
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+def _usage(messages, content: str):
+    # A token count of about one per four characters, as a real response reports.
+    return SimpleNamespace(prompt_tokens=len(json.dumps(messages)) // 4, completion_tokens=len(content) // 4)
+
+def _completion(content: str, messages=()):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=_usage(messages, content))
+
+class FakeChatCompletions:
+    # Stands in for client.chat.completions. Vision requests are answered with
+    # "Description of scene N", where N comes from the request text, or with a JSON
+    # list of those for multi-image requests; any other request is answered with
+    # `narrative_response`, streamed in `stream_chunk_size` pieces if stream=True.
+    # narrative_response may also be a callable that builds the answer from the prompt.
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        fail_scenes=(),
+        narrative_response: str = "not json",
+        malformed_batches: bool = False,
+        stream_chunk_size: int = 16,
+        stream_latency: float = 0.0
+    ):
+
+        self.latency = latency
+        self.fail_scenes = set(fail_scenes)
+        self.narrative_response = narrative_response
+        self.malformed_batches = malformed_batches
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_latency = stream_latency
+        self.streamed_chunks = 0
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **kwargs):
+
+        with self._lock:
+            self.calls.append({"model": model, "messages": messages, **kwargs})
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            content = messages[-1]["content"]
+            if isinstance(content, list):
+                text = " ".join(part["text"] for part in content if part["type"] == "text")
+                scene_numbers = [int(n) for n in re.findall(r"[Ss]cene (\d+)", text)]
+                if any(n - 1 in self.fail_scenes for n in scene_numbers):
+                    raise RuntimeError("vision request failed")
+                if len(scene_numbers) == 1:
+                    return _completion(f"Description of scene {scene_numbers[0]}", messages)
+                if self.malformed_batches:
+                    return _completion('{"descriptions": [', messages)
+                return _completion(json.dumps({"descriptions": [
+                    {"scene": n, "description": f"Description of scene {n}"} for n in reversed(scene_numbers)
+                ]}), messages)
+            response = self.narrative_response(content) if callable(self.narrative_response) else self.narrative_response
+            if kwargs.get("stream"):
+                usage = _usage(messages, response) if kwargs.get("stream_options", {}).get("include_usage") else None
+                return self._stream(response, usage)
+            return _completion(response, messages)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _stream(self, content: str, usage=None):
+
+        for i in range(0, len(content), self.stream_chunk_size):
+            time.sleep(self.stream_latency)
+            self.streamed_chunks += 1
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + self.stream_chunk_size]))],
+                usage=None
+            )
+        if usage is not None:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+class FakeOpenAI:
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(**kwargs))
+
+class FakeApiError(Exception):
+    # Like the SDKs' API errors, with the response's status code and headers.
+
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"status_code: {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeTextToSpeech:
+    # Stands in for client.text_to_speech. convert() returns `audio` split into
+    # chunks after `latency` seconds, or raises for texts listed in `fail_texts`.
+    # The first `throttle` requests for each text are rejected with a 429.
+
+    def __init__(self, latency: float = 0.0, fail_texts=(), audio: bytes = b"fake-audio" * 100, throttle: int = 0):
+
+        self.latency = latency
+        self.fail_texts = set(fail_texts)
+        self.audio = audio
+        self.throttle = throttle
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def convert(self, voice_id, model_id, text, voice_settings=None, **kwargs):
+
+        with self._lock:
+            self.calls.append({"voice_id": voice_id, "model_id": model_id, "text": text})
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            if text in self.fail_texts:
+                raise RuntimeError("text to speech failed")
+            if sum(call["text"] == text for call in self.calls) <= self.throttle:
+                raise FakeApiError(429, {"retry-after-ms": "10"})
+        finally:
+            with self._lock:
+                self.active -= 1
+        audio = self.audio(text) if callable(self.audio) else self.audio
+        return (audio[i:i + 256] for i in range(0, len(audio), 256))
+
+class FakeElevenLabs:
+
+    def __init__(self, **kwargs):
+        self.text_to_speech = FakeTextToSpeech(**kwargs)
@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import unittest
+import wave
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from narrative_generator import NarrativeSegment
+from fake_clients import FakeElevenLabs
+from fixtures import find_ffmpeg, make_tone_mp3
+from audio_generator import AudioGenerator, SegmentSynthesisError
+
+def _segments(count: int):
+    return [
+        NarrativeSegment(
+            start_time=i * 2.0,
+            end_time=(i + 1) * 2.0,
+            duration=2.0,
+            text=f"Line {i}",
+            scene_idx=i
+        )
+        for i in range(count)
+    ]
+
+class TestAudioGenerator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        cls.clip = make_tone_mp3(find_ffmpeg(), 1.0)
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.environ["NARRATION_CACHE_DIR"] = os.path.join(self.temp_dir.name, "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_segments_synthesized_concurrently(self):
+
+        generator = AudioGenerator(max_concurrency=4)
+        generator.client = FakeElevenLabs(latency=0.2, audio=self.clip)
+
+        started = time.perf_counter()
+        generator.generate_audio(_segments(8), self.temp_dir.name)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(generator.client.text_to_speech.max_active, 4)
+        self.assertLess(elapsed, 8 * 0.2 / 2)
+        for i in range(8):
+            segment_path = os.path.join(self.temp_dir.name, f"segment_{i}.mp3")
+            with open(segment_path, "rb") as f:
+                self.assertEqual(f.read(), self.clip)
+
+    def test_failed_segments_are_reported(self):
+
+        generator = AudioGenerator()
+        generator.client = FakeElevenLabs(fail_texts={"Line 1", "Line 3"}, audio=self.clip)
+
+        with self.assertRaises(SegmentSynthesisError) as context:
+            generator.generate_audio(_segments(4), self.temp_dir.name)
+
+        self.assertEqual([f["index"] for f in context.exception.failures], [1, 3])
+
+    def test_rate_limited_requests_are_retried(self):
+
+        generator = AudioGenerator(max_concurrency=2, tts_cache=None)
+        generator.tts_cache = None
+        generator.client = FakeElevenLabs(audio=self.clip, throttle=2)
+
+        generator.generate_audio(_segments(2), self.temp_dir.name)
+        self.assertEqual(len(generator.client.text_to_speech.calls), 6)
+
+        # Past max_retries the error is reported.
+        generator.max_retries = 1
+        generator.client = FakeElevenLabs(audio=self.clip, throttle=2)
+        with self.assertRaises(SegmentSynthesisError):
+            generator.generate_audio(_segments(2), os.path.join(self.temp_dir.name, "again"))
+        self.assertEqual(len(generator.client.text_to_speech.calls), 4)
+
+    def test_cached_segments_are_reused(self):
+
+        generator = AudioGenerator()
+        generator.client = FakeElevenLabs(audio=self.clip)
+        generator.generate_audio(_segments(4), os.path.join(self.temp_dir.name, "first"))
+
+        edited = _segments(4)
+        edited[2] = edited[2].model_copy(update={"text": "A new line"})
+        rerun = AudioGenerator()
+        rerun.client = FakeElevenLabs(audio=self.clip)
+        rerun.generate_audio(edited, os.path.join(self.temp_dir.name, "second"))
+
+        self.assertEqual([call["text"] for call in rerun.client.text_to_speech.calls], ["A new line"])
+        self.assertEqual(rerun.tts_cache.stats()["hits"], 3)
+
+    def test_narration_track_follows_segment_timeline(self):
+
+        generator = AudioGenerator()
+        generator.client = FakeElevenLabs(audio=self.clip)
+        segments = _segments(3)
+        segments[2] = segments[2].model_copy(update={"start_time": 7.0, "end_time": 9.0})
+        output_path = generator.generate_audio(segments, self.temp_dir.name)
+
+        with wave.open(output_path, "rb") as track:
+            rate = track.getframerate()
+            self.assertEqual(track.getnframes(), 9 * rate)
+            frames = track.readframes(track.getnframes())
+        # Each 1s clip starts at its segment's start; the gap before 7s is silent.
+        silent = frames[int(5.5 * rate) * 2:int(6.9 * rate) * 2]
+        self.assertEqual(silent, bytes(len(silent)))
+        self.assertNotEqual(frames[int(7.2 * rate) * 2:int(7.8 * rate) * 2], bytes(int(0.6 * rate) * 2))
+
+    def test_speculative_segments_are_reconciled_with_final_narrative(self):
+
+        generator = AudioGenerator()
+        generator.client = FakeElevenLabs(latency=0.05, audio=self.clip)
+        streamed = _segments(3)
+        synthesis = generator.start_synthesis(self.temp_dir.name)
+        for segment in streamed:
+            synthesis.submit(segment)
+
+        # The final script moves segment 0, rewrites segment 1 and adds segment 3.
+        final = _segments(4)
+        final[0] = final[0].model_copy(update={"start_time": 0.5})
+        final[1] = final[1].model_copy(update={"text": "Line 1, revised"})
+        output_path = synthesis.finish(final)
+
+        texts = [call["text"] for call in generator.client.text_to_speech.calls]
+        self.assertEqual(sorted(texts), ["Line 0", "Line 1", "Line 1, revised", "Line 2", "Line 3"])
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "segment_1_final.mp3")))
+        with wave.open(output_path, "rb") as track:
+            self.assertEqual(track.getnframes(), 8 * track.getframerate())
+            frames = track.readframes(int(0.45 * track.getframerate()))
+        self.assertEqual(frames, bytes(len(frames)))
+
+if __name__ == "__main__":
+    unittest.main()
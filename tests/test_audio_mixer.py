@@ -0,0 +1,89 @@
+import os
+import sys
+import wave
+import unittest
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from audio_mixer import TimelineMixer
+from fixtures import find_ffmpeg, make_tone_mp3
+
+RATE = 16000
+
+class TestTimelineMixer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.ffmpeg = find_ffmpeg()
+        if cls.ffmpeg is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _clip(self, name: str, seconds: float, frequency: int = 440) -> str:
+
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(make_tone_mp3(self.ffmpeg, seconds, frequency, RATE))
+        return path
+
+    def _read(self, path: str) -> np.ndarray:
+
+        with wave.open(path, "rb") as track:
+            self.assertEqual(track.getframerate(), RATE)
+            self.assertEqual(track.getsampwidth(), 2)
+            return np.frombuffer(track.readframes(track.getnframes()), dtype=np.int16)
+
+    def _loud(self, samples: np.ndarray, start: float, end: float) -> bool:
+        window = samples[int(start * RATE):int(end * RATE)].astype(np.int32)
+        return len(window) > 0 and np.abs(window).mean() > 1000
+
+    def test_clips_placed_at_start_times_with_silence_between(self):
+
+        clips = [
+            {"path": self._clip("b.mp3", 1.0, 660), "start_time": 4.0},
+            {"path": self._clip("a.mp3", 1.0), "start_time": 1.5},
+        ]
+        output_path = os.path.join(self.temp_dir.name, "narration.wav")
+        # A small block size makes the track span several blocks and splits the clips.
+        mixer = TimelineMixer(self.ffmpeg, sample_rate=RATE, block_seconds=0.7)
+        duration = mixer.mix(clips, output_path, min_duration=6.0)
+
+        samples = self._read(output_path)
+        self.assertAlmostEqual(duration, 6.0, places=2)
+        self.assertEqual(len(samples), 6 * RATE)
+        self.assertFalse(np.any(samples[:int(1.45 * RATE)]))
+        self.assertTrue(self._loud(samples, 1.6, 2.4))
+        self.assertFalse(np.any(samples[int(2.7 * RATE):int(3.95 * RATE)]))
+        self.assertTrue(self._loud(samples, 4.1, 4.9))
+        self.assertFalse(np.any(samples[int(5.2 * RATE):]))
+
+    def test_track_extends_past_min_duration_for_long_clip(self):
+
+        clips = [{"path": self._clip("a.mp3", 2.0), "start_time": 0.5}]
+        output_path = os.path.join(self.temp_dir.name, "narration.wav")
+        duration = TimelineMixer(self.ffmpeg, sample_rate=RATE).mix(clips, output_path, min_duration=1.0)
+
+        self.assertGreaterEqual(duration, 2.5)
+        self.assertEqual(len(self._read(output_path)), int(round(duration * RATE)))
+
+    def test_undecodable_clip_raises(self):
+
+        path = os.path.join(self.temp_dir.name, "broken.mp3")
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+        mixer = TimelineMixer(self.ffmpeg, sample_rate=RATE)
+
+        with self.assertRaises(RuntimeError):
+            mixer.mix([{"path": path, "start_time": 0.0}], os.path.join(self.temp_dir.name, "out.wav"))
+
+if __name__ == "__main__":
+    unittest.main()
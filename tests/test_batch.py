@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from fake_clients import FakeOpenAI, FakeElevenLabs
+from narrative_generator import VisualNarrativeGenerator
+from audio_generator import AudioGenerator
+import main
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+
+class TestBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        os.environ["NARRATION_CACHE_DIR"] = os.path.join(cls.temp_dir.name, "cache")
+        cls.main = main
+        cls.clip = make_tone_mp3(find_ffmpeg(), 0.5)
+
+        videos_dir = os.path.join(cls.temp_dir.name, "videos")
+        os.makedirs(os.path.join(videos_dir, "more"))
+        cls.videos = [
+            make_test_video(os.path.join(videos_dir, "a.mp4"), num_scenes=3, frames_per_scene=20),
+            make_test_video(os.path.join(videos_dir, "b.mp4"), num_scenes=2, frames_per_scene=20, seed=1),
+            make_test_video(os.path.join(videos_dir, "more", "a.mp4"), num_scenes=2, frames_per_scene=20, seed=2),
+        ]
+        cls.videos_dir = videos_dir
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.mkdtemp(dir=self.temp_dir.name)
+        os.chdir(self.work_dir)
+        self.saved = (self.main.narrative_generator, self.main.audio_generator)
+        self.main.narrative_generator = VisualNarrativeGenerator(max_concurrency=2)
+        self.main.narrative_generator.client = FakeOpenAI(latency=0.05)
+        self.main.audio_generator = AudioGenerator(max_concurrency=2)
+        self.main.audio_generator.client = FakeElevenLabs(latency=0.05, audio=self.clip)
+
+    def tearDown(self):
+
+        self.main.narrative_generator, self.main.audio_generator = self.saved
+        os.chdir(self.cwd)
+
+    def test_collect_videos_from_directory_and_manifest(self):
+
+        self.assertEqual(self.main.collect_videos(self.videos_dir), sorted(self.videos[:2]))
+
+        manifest = os.path.join(self.videos_dir, "manifest.txt")
+        with open(manifest, "w") as f:
+            f.write("# batch\nb.mp4\n\nmore/a.mp4\nhttps://example.com/clip.mp4\n")
+        self.assertEqual(
+            self.main.collect_videos(manifest),
+            [self.videos[1], os.path.join(self.videos_dir, "more", "a.mp4"), "https://example.com/clip.mp4"]
+        )
+
+    def test_batch_runs_jobs_in_isolated_workspaces(self):
+
+        missing = os.path.join(self.videos_dir, "missing.mp4")
+        summary = self.main.process_batch(self.videos + [missing], "output", jobs=4)
+
+        self.assertEqual((summary["succeeded"], summary["failed"]), (3, 1))
+        self.assertEqual([job["video"] for job in summary["jobs"]], self.videos + [missing])
+        self.assertEqual(summary["jobs"][3]["status"], "failed")
+        self.assertTrue(os.path.exists(summary["summary_path"]))
+
+        output_dirs = [job["result"]["output_dir"] for job in summary["jobs"][:3]]
+        self.assertEqual(len(set(output_dirs)), 3)
+        for job in summary["jobs"][:3]:
+            self.assertTrue(os.path.exists(job["result"]["outputs"]["audio"]))
+        self.assertFalse(os.path.exists("temp_audio"))
+
+        # The caps hold across all jobs sharing the clients.
+        self.assertLessEqual(self.main.narrative_generator.client.chat.completions.max_active, 2)
+        self.assertLessEqual(self.main.audio_generator.client.text_to_speech.max_active, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from fixtures import find_ffmpeg
+from fake_api import EndpointBehavior
+from pipeline import Scenario, run_scenario, compare
+
+class TestPipelineBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+
+    def test_offline_run_through_the_real_clients(self):
+
+        # TTS is limited to two requests a second, so some are rejected and retried.
+        scenario = Scenario(
+            scenes=3,
+            scene_seconds=1.0,
+            elevenlabs=EndpointBehavior(rate_limit=2)
+        )
+        report = run_scenario("tiny", scenario, runs=1)
+
+        self.assertEqual(report["scenario"], "tiny")
+        self.assertEqual(report["scenes"], 3)
+        self.assertEqual(report["narrative_segments"], 3)
+        self.assertEqual(report["requests"]["openai.vision"]["count"], 3)
+        self.assertEqual(report["requests"]["openai.narrative"]["count"], 1)
+        self.assertGreater(report["requests"]["elevenlabs.tts"]["count"], 3)
+        self.assertEqual(report["server"]["openai"]["requests"], 4)
+        self.assertGreater(report["server"]["elevenlabs"]["rate_limited"], 0)
+        for stage in ("scene_detection", "vision", "narrative", "audio"):
+            self.assertIn(stage, report["stages"])
+
+        baseline = {"seconds": dict(report["seconds"]), "stages": dict(report["stages"])}
+        self.assertEqual(compare(report, baseline, tolerance=0.25, min_seconds=0.0), [])
+        baseline["stages"]["vision"] = report["stages"]["vision"] / 2
+        self.assertEqual(len(compare(report, baseline, tolerance=0.25, min_seconds=0.0)), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from fake_clients import FakeOpenAI, FakeElevenLabs
+from narrative_generator import VisualNarrativeGenerator
+from audio_generator import AudioGenerator, SegmentSynthesisError
+from artifact_store import ArtifactStore
+import main
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+
+NARRATIVE = json.dumps({"segments": [
+    {"scene_idx": 0, "start_time": 0.0, "end_time": 1.0, "text": "It begins."},
+    {"scene_idx": 1, "start_time": 1.0, "end_time": 2.0, "text": "It goes on."}
+]})
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_keys_depend_on_every_input(self):
+
+        store = ArtifactStore(self.temp_dir)
+        key = store.key("scenes", {"video": "abc", "analyzer": {"threshold": 27.0}})
+
+        self.assertEqual(key, store.key("scenes", {"analyzer": {"threshold": 27.0}, "video": "abc"}))
+        self.assertNotEqual(key, store.key("scenes", {"video": "abc", "analyzer": {"threshold": 30.0}}))
+        self.assertNotEqual(key, store.key("narrative", {"video": "abc", "analyzer": {"threshold": 27.0}}))
+
+    def test_json_and_blobs_round_trip(self):
+
+        store = ArtifactStore(self.temp_dir)
+        self.assertIsNone(store.get_json("scenes", "0" * 64))
+        store.put_json("scenes", "0" * 64, [{"start_time": 0.0}])
+        self.assertEqual(store.get_json("scenes", "0" * 64), [{"start_time": 0.0}])
+
+        digest = store.put_blob(b"jpeg bytes")
+        self.assertEqual(store.put_blob(b"jpeg bytes"), digest)
+        self.assertEqual(store.get_blob(digest), b"jpeg bytes")
+
+    def test_evicts_least_recently_used_files_past_max_bytes(self):
+
+        store = ArtifactStore(self.temp_dir, max_bytes=250)
+        first = store.put_blob(b"a" * 100)
+        second = store.put_blob(b"b" * 100)
+        os.utime(store._path("blobs", first, ""), (1, 1))
+        os.utime(store._path("blobs", second, ""), (2, 2))
+        # Reading the first blob makes the second the least recently used.
+        store.get_blob(first)
+        third = store.put_blob(b"c" * 100)
+
+        self.assertEqual(store.get_blob(first), b"a" * 100)
+        self.assertIsNone(store.get_blob(second))
+        self.assertEqual(store.get_blob(third), b"c" * 100)
+        self.assertEqual(ArtifactStore(self.temp_dir, max_bytes=250)._total_bytes, 200)
+
+    def test_local_source_id_follows_path_size_and_mtime(self):
+
+        from video_handler import VideoInputHandler
+        from download_cache import DownloadCache
+        handler = VideoInputHandler(DownloadCache(os.path.join(self.temp_dir, "downloads")))
+        path = os.path.join(self.temp_dir, "video.mp4")
+        with open(path, "wb") as f:
+            f.write(b"frames")
+        source_id = handler.source_id(path)
+
+        self.assertEqual(handler.source_id(os.path.join(self.temp_dir, ".", "video.mp4")), source_id)
+        os.utime(path, ns=(0, 0))
+        self.assertNotEqual(handler.source_id(path), source_id)
+
+class TestResume(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        cls.clip = make_tone_mp3(find_ffmpeg(), 0.5)
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.video = make_test_video(os.path.join(self.temp_dir, "video.mp4"), num_scenes=2, frames_per_scene=30)
+        main.load_components()
+        self.saved = (main.narrative_generator, main.audio_generator, main.artifact_store)
+        main.artifact_store = ArtifactStore(os.path.join(self.temp_dir, "artifacts"))
+
+    def tearDown(self):
+
+        main.narrative_generator, main.audio_generator, main.artifact_store = self.saved
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def _components(self, fail_texts=(), **openai_kwargs):
+        # The description and TTS caches are off, so every reuse comes from checkpoints.
+
+        narrative_generator = VisualNarrativeGenerator(max_concurrency=2, description_cache=None)
+        narrative_generator.description_cache = None
+        narrative_generator.client = FakeOpenAI(narrative_response=NARRATIVE, **openai_kwargs)
+        audio_generator = AudioGenerator(max_concurrency=2, tts_cache=None)
+        audio_generator.tts_cache = None
+        audio_generator.client = FakeElevenLabs(audio=self.clip, fail_texts=fail_texts)
+        main.narrative_generator, main.audio_generator = narrative_generator, audio_generator
+        return narrative_generator.client.chat.completions, audio_generator.client.text_to_speech
+
+    def test_resume_after_tts_failure_skips_vision_and_narrative(self):
+
+        self._components(fail_texts={"It goes on."})
+        with self.assertRaises(SegmentSynthesisError):
+            main.process_video(self.video, "output")
+
+        chat, tts = self._components()
+        result = main.process_video(self.video, "output", resume=True)
+
+        self.assertEqual(chat.calls, [])
+        self.assertEqual(len(tts.calls), 2)
+        self.assertEqual(result["scenes"], 2)
+        self.assertEqual(result["narrative_segments"], 2)
+        self.assertEqual(result["checkpoints"], {
+            "scenes": "skipped",
+            "descriptions": "skipped",
+            "narrative": "hit",
+            "audio": {"hits": 0, "misses": 2}
+        })
+
+    def test_changed_narrator_reuses_descriptions(self):
+
+        self._components()
+        main.process_video(self.video, "output", pipelined=False)
+
+        chat, _ = self._components()
+        main.narrative_generator.narrative_model = "another-model"
+        result = main.process_video(self.video, "output", pipelined=False, resume=True)
+
+        self.assertEqual([call["model"] for call in chat.calls], ["another-model"])
+        self.assertEqual(result["checkpoints"]["descriptions"], "hit")
+        self.assertEqual(result["checkpoints"]["narrative"], "miss")
+
+    def test_without_resume_every_stage_runs(self):
+
+        self._components()
+        main.process_video(self.video, "output")
+
+        chat, _ = self._components()
+        result = main.process_video(self.video, "output")
+
+        self.assertEqual(len(chat.calls), 3)
+        self.assertEqual(
+            [result["checkpoints"][stage] for stage in ("scenes", "descriptions", "narrative")],
+            ["miss", "miss", "miss"]
+        )
+
+    def test_failed_analysis_is_not_checkpointed(self):
+
+        self._components(fail_scenes={1})
+        main.process_video(self.video, "output")
+
+        chat, _ = self._components()
+        result = main.process_video(self.video, "output", resume=True)
+
+        # The scene list is reused, but descriptions and narrative are requested again.
+        self.assertEqual(result["checkpoints"]["scenes"], "hit")
+        self.assertEqual(result["checkpoints"]["descriptions"], "miss")
+        self.assertEqual(len(chat.calls), 3)
+
+if __name__ == '__main__':
+    unittest.main()
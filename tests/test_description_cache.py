@@ -0,0 +1,80 @@
+import os
+import sys
+import unittest
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from description_cache import DescriptionCache, perceptual_hash, _hamming
+
+def _encode(image: np.ndarray, quality: int = 95) -> bytes:
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+class TestDescriptionCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, "descriptions.sqlite")
+        rng = np.random.default_rng(0)
+        blocks = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+        self.image = cv2.resize(blocks, (320, 240), interpolation=cv2.INTER_NEAREST)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_near_identical_images_hash_close(self):
+
+        original = perceptual_hash(_encode(self.image))
+        recompressed = perceptual_hash(_encode(cv2.resize(self.image, (640, 480)), quality=60))
+        other = perceptual_hash(_encode(np.flipud(self.image).copy()))
+
+        self.assertLessEqual(_hamming(original, recompressed), 4)
+        self.assertGreater(_hamming(original, other), 10)
+        self.assertIsNone(perceptual_hash(b"not an image"))
+
+    def test_lookup_respects_model_prompt_and_distance(self):
+
+        cache = DescriptionCache(self.cache_path, max_distance=2)
+        cache.put(0b1011, "gpt-4o", "1", "A red door.")
+
+        self.assertEqual(cache.get(0b1011, "gpt-4o", "1"), "A red door.")
+        self.assertEqual(cache.get(0b1000, "gpt-4o", "1"), "A red door.")
+        self.assertIsNone(cache.get(0b0100, "gpt-4o", "1"))
+        self.assertIsNone(cache.get(0b1011, "gpt-4o", "2"))
+        self.assertIsNone(cache.get(0b1011, "gpt-4o-mini", "1"))
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_near_matches_are_found_through_any_band(self):
+
+        cache = DescriptionCache(self.cache_path, max_distance=4)
+        stored = 0x0123456789ABCDEF
+        cache.put(stored, "gpt-4o", "1", "A red door.")
+        cache.put(stored, "gpt-4o", "1", "A red front door.")
+
+        # Four bits off, one in each of the first four bands.
+        self.assertEqual(cache.get(stored ^ 0x01010101, "gpt-4o", "1"), "A red front door.")
+        self.assertIsNone(cache.get(stored ^ 0x0101010101, "gpt-4o", "1"))
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["bytes"], len("A red front door."))
+
+    def test_persists_and_evicts_least_recently_used(self):
+
+        cache = DescriptionCache(self.cache_path, max_distance=0, max_bytes=20)
+        cache.put(1, "gpt-4o", "1", "first....")
+        cache.put(2, "gpt-4o", "1", "second...")
+        self.assertEqual(cache.get(1, "gpt-4o", "1"), "first....")
+        cache.put(3, "gpt-4o", "1", "third....")
+
+        reopened = DescriptionCache(self.cache_path, max_distance=0, max_bytes=20)
+        self.assertEqual(reopened.get(1, "gpt-4o", "1"), "first....")
+        self.assertIsNone(reopened.get(2, "gpt-4o", "1"))
+        self.assertEqual(reopened.get(3, "gpt-4o", "1"), "third....")
+        self.assertEqual(reopened.stats()["entries"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
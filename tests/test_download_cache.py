@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from download_cache import DownloadCache
+from video_handler import VideoInputHandler
+from scene_analyzer import SceneAnalyzer
+from fixtures import find_ffmpeg, make_test_video
+
+class FakeOrigin:
+    # Serves one file with ETag/Last-Modified validators and byte ranges. The first
+    # `drop_after` bytes of a response can be followed by a dropped connection, and
+    # `chunk_delay` throttles the body to simulate a slow link.
+
+    def __init__(self, data: bytes, chunk_size: int = 16384):
+
+        self.data = data
+        self.etag = '"v1"'
+        self.chunk_size = chunk_size
+        self.chunk_delay = 0.0
+        self.drop_after = None
+        self.requests = []
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                origin.requests.append(dict(self.headers))
+                data = origin.data
+                if self.headers.get("If-None-Match") == origin.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", origin.etag)
+                    self.end_headers()
+                    return
+
+                start = 0
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if match and self.headers.get("If-Range", origin.etag) == origin.etag:
+                    start = int(match.group(1))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", origin.etag)
+                self.send_header("Last-Modified", "Mon, 05 Oct 2026 10:00:00 GMT")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(data) - start))
+                self.end_headers()
+
+                body = data[start:]
+                if origin.drop_after is not None:
+                    body, origin.drop_after = body[:origin.drop_after], None
+                try:
+                    for i in range(0, len(body), origin.chunk_size):
+                        self.wfile.write(body[i:i + origin.chunk_size])
+                        time.sleep(origin.chunk_delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name: str = "video.mp4") -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def close(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+class TestDownloadCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom(300 * 1024)
+        self.origin = FakeOrigin(self.data)
+        self.cache = DownloadCache(os.path.join(self.temp_dir, "downloads"), chunk_size=16384, retries=2)
+
+    def tearDown(self):
+
+        self.cache.close()
+        self.origin.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _read(self, path: str) -> bytes:
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_refetch_costs_one_conditional_request(self):
+
+        path = self.cache.fetch(self.origin.url())
+        self.assertEqual(self._read(path), self.data)
+
+        download = self.cache.start(self.origin.url())
+        self.assertEqual(download.wait(), path)
+        self.assertTrue(download.from_cache)
+        self.assertEqual(len(self.origin.requests), 2)
+        self.assertEqual(self.origin.requests[1].get("If-None-Match"), '"v1"')
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "resumes": 0})
+
+    def test_changed_source_is_downloaded_again(self):
+
+        self.cache.fetch(self.origin.url())
+        self.origin.data = os.urandom(100 * 1024)
+        self.origin.etag = '"v2"'
+
+        path = self.cache.fetch(self.origin.url())
+        self.assertEqual(self._read(path), self.origin.data)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_dropped_connection_resumes_with_range(self):
+
+        self.origin.drop_after = 100 * 1024
+        path = self.cache.fetch(self.origin.url())
+
+        self.assertEqual(self._read(path), self.data)
+        resumed_at = int(re.match(r"bytes=(\d+)-$", self.origin.requests[1]["Range"]).group(1))
+        self.assertTrue(0 < resumed_at <= 100 * 1024)
+        self.assertEqual(self.origin.requests[1].get("If-Range"), '"v1"')
+        self.assertEqual(self.cache.stats()["resumes"], 1)
+
+    def test_partial_file_from_earlier_run_is_resumed(self):
+
+        failing = DownloadCache(self.cache.directory, chunk_size=16384, retries=0)
+        self.origin.drop_after = 64 * 1024
+        with self.assertRaises(Exception):
+            failing.fetch(self.origin.url())
+
+        path = self.cache.fetch(self.origin.url())
+        self.assertEqual(self._read(path), self.data)
+        self.assertIn("Range", self.origin.requests[-1])
+
+    def test_concurrent_fetches_share_one_download(self):
+
+        self.origin.chunk_delay = 0.01
+        first = self.cache.start(self.origin.url())
+        second = self.cache.start(self.origin.url())
+
+        self.assertIs(first, second)
+        first.wait()
+        self.assertEqual(len(self.origin.requests), 1)
+
+    def test_least_recently_used_videos_are_evicted(self):
+
+        self.cache.max_bytes = 500 * 1024
+        old = self.cache.fetch(self.origin.url("old.mp4"))
+        os.utime(old, (time.time() - 60, time.time() - 60))
+        self.cache.fetch(self.origin.url("new.mp4"))
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(self.cache.fetch(self.origin.url("new.mp4"))))
+
+    def test_stream_serves_ranges_while_downloading(self):
+
+        self.origin.chunk_delay = 0.02
+        download = self.cache.start(self.origin.url())
+        download.wait_started()
+        stream_url = self.cache.stream_url(download)
+
+        response = self.cache.session.get(stream_url, headers={"Range": "bytes=250000-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[250000:])
+        self.assertEqual(self.cache.session.get(stream_url).content, self.data)
+
+        # Finished downloads aren't kept; the stream serves the cached file instead.
+        download.wait()
+        time.sleep(0.1)
+        self.assertEqual(self.cache._active, {})
+        response = self.cache.session.get(stream_url, headers={"Range": "bytes=250000-"})
+        self.assertEqual(response.content, self.data[250000:])
+        self.assertEqual(self.cache.session.get(stream_url.replace(download.key, "0" * 64)).status_code, 404)
+
+@unittest.skipIf(find_ffmpeg() is None, "ffmpeg is not available")
+class TestStreamingIngest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        raw_path = make_test_video(os.path.join(self.temp_dir, "raw.mp4"), num_scenes=3)
+        # Moves the index to the front of the file, as web-ready videos have it, so
+        # frames can be decoded before the download completes.
+        self.video_path = os.path.join(self.temp_dir, "video.mp4")
+        subprocess.run(
+            [find_ffmpeg(), "-v", "error", "-i", raw_path, "-c", "copy", "-movflags", "+faststart", self.video_path],
+            check=True
+        )
+        with open(self.video_path, "rb") as f:
+            self.origin = FakeOrigin(f.read(), chunk_size=4096)
+        self.cache = DownloadCache(os.path.join(self.temp_dir, "downloads"), chunk_size=4096)
+        self.handler = VideoInputHandler(download_cache=self.cache, stream_urls=True)
+
+    def tearDown(self):
+
+        self.cache.close()
+        self.origin.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_probe_and_detection_start_before_download_completes(self):
+
+        self.origin.chunk_delay = 0.01
+        url = self.origin.url()
+
+        metadata = self.handler.handle_input(url)
+        download = self.handler._downloads[url]
+        self.assertFalse(download.done)
+        self.assertTrue(metadata.path.startswith("http://127.0.0.1"))
+        self.assertEqual(metadata.frame_count, 135)
+
+        streamed = [(s.start_time, s.end_time) for s in SceneAnalyzer().iter_scenes(metadata.path)]
+        local = [(s.start_time, s.end_time) for s in SceneAnalyzer().detect_scenes(self.video_path)]
+        self.assertEqual(streamed, local)
+
+        cached_path = self.handler.local_path(url)
+        with open(cached_path, "rb") as f:
+            self.assertEqual(f.read(), self.origin.data)
+
+    def test_cached_source_is_probed_locally(self):
+
+        url = self.origin.url()
+        self.handler.local_path(url)
+
+        metadata = self.handler.handle_input(url)
+        self.assertEqual(metadata.path, self.cache.fetch(url))
+        self.assertEqual(self.origin.requests[-1].get("If-None-Match"), '"v1"')
+
+if __name__ == '__main__':
+    unittest.main()
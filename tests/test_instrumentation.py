@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+import contextvars
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+import instrumentation
+from fake_clients import FakeOpenAI, FakeElevenLabs
+from narrative_generator import VisualNarrativeGenerator
+from audio_generator import AudioGenerator
+import main
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+
+NARRATIVE = json.dumps({"segments": [
+    {"scene_idx": 0, "start_time": 0.0, "end_time": 1.0, "text": "It begins."},
+    {"scene_idx": 1, "start_time": 1.0, "end_time": 2.0, "text": "It goes on."}
+]})
+
+class TestRunProfile(unittest.TestCase):
+
+    def test_measurements_are_noops_outside_a_profile(self):
+
+        with instrumentation.stage("vision"), instrumentation.request("openai.vision"):
+            instrumentation.count("openai.bytes_sent", 10)
+        self.assertIsNone(instrumentation.current())
+
+    def test_report_histograms_and_threads(self):
+
+        with instrumentation.profiling() as profile:
+            for seconds in (0.01, 0.3, 0.3, 200.0):
+                profile.observe("elevenlabs.tts", seconds)
+            with self.assertRaises(RuntimeError), instrumentation.request("elevenlabs.tts"):
+                raise RuntimeError("quota exceeded")
+
+            # Work on another thread is recorded if it runs in a copy of the context.
+            thread = threading.Thread(
+                target=contextvars.copy_context().run, args=(instrumentation.count, "tts_cache.hits", 2)
+            )
+            thread.start()
+            thread.join()
+
+            with instrumentation.stage("scene_detection"):
+                pass
+
+        report = profile.report()
+        tts = report["requests"]["elevenlabs.tts"]
+        self.assertEqual((tts["count"], tts["errors"]), (5, 1))
+        self.assertEqual(tts["buckets"]["0.05"], 2)
+        self.assertEqual(tts["buckets"]["0.5"], 4)
+        self.assertEqual(tts["buckets"]["120.0"], 4)
+        self.assertEqual(tts["buckets"]["+Inf"], 5)
+        self.assertEqual(report["counters"], {"tts_cache.hits": 2})
+
+        merged = instrumentation.merge_reports([report, report])
+        self.assertEqual(merged["requests"]["elevenlabs.tts"]["buckets"]["+Inf"], 10)
+        self.assertEqual(merged["counters"]["tts_cache.hits"], 4)
+
+        text = instrumentation.to_prometheus(merged)
+        self.assertIn("# TYPE narration_request_seconds histogram\n", text)
+        self.assertIn('narration_request_seconds_bucket{request="elevenlabs.tts",le="+Inf"} 10\n', text)
+        self.assertIn('narration_request_seconds_count{request="elevenlabs.tts"} 10\n', text)
+        self.assertIn('narration_request_errors_total{request="elevenlabs.tts"} 2\n', text)
+        self.assertIn("narration_tts_cache_hits_total 4\n", text)
+        self.assertIn('narration_stage_wall_seconds{stage="scene_detection"}', text)
+
+class TestProfiledRun(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        cls.clip = make_tone_mp3(find_ffmpeg(), 0.5)
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.video = make_test_video(os.path.join(self.temp_dir, "video.mp4"), num_scenes=2, frames_per_scene=30)
+        main.load_components()
+        self.saved = (main.narrative_generator, main.audio_generator, main.artifact_store)
+        main.artifact_store = None
+        main.narrative_generator = VisualNarrativeGenerator(max_concurrency=2, description_cache=None)
+        main.narrative_generator.description_cache = None
+        main.narrative_generator.client = FakeOpenAI(narrative_response=NARRATIVE)
+        main.audio_generator = AudioGenerator(max_concurrency=2, tts_cache=None)
+        main.audio_generator.tts_cache = None
+        main.audio_generator.client = FakeElevenLabs(audio=self.clip)
+
+    def tearDown(self):
+
+        main.narrative_generator, main.audio_generator, main.artifact_store = self.saved
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_profile_covers_every_stage(self):
+
+        result = main.process_video(self.video, "output", profile=True)
+        report = result["profile"]
+
+        for stage in ("run", "probe", "scene_detection", "vision", "narrative", "audio", "mix", "render"):
+            self.assertIn(stage, report["stages"])
+        self.assertLessEqual(report["stages"]["vision"]["wall_seconds"], report["stages"]["run"]["wall_seconds"])
+
+        # Requests made on worker threads are attributed to the run.
+        self.assertEqual(report["requests"]["openai.vision"]["count"], 2)
+        self.assertEqual(report["requests"]["openai.narrative"]["count"], 1)
+        self.assertEqual(report["requests"]["elevenlabs.tts"]["count"], 2)
+        self.assertEqual(report["requests"]["ffmpeg.decode"]["count"], 2)
+        self.assertEqual(report["counters"]["elevenlabs.bytes_received"], 2 * len(self.clip))
+        self.assertGreater(report["counters"]["openai.bytes_sent"], report["counters"]["openai.bytes_received"])
+
+        with open(result["outputs"]["profile"], "r") as f:
+            self.assertEqual(json.load(f), report)
+
+        # Without profile nothing is measured.
+        self.assertNotIn("profile", main.process_video(self.video, "output"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import time
+import threading
+import unittest
+import json
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.dirname(__file__))
+
+from narrative_generator import VisualNarrativeGenerator, SegmentStreamParser
+from scene_analyzer import VideoScene
+from video_handler import VideoMetadata
+from fake_clients import FakeOpenAI
+
+class TestVisualNarrativeGenerator(unittest.TestCase):
+
+    def setUp(self):
+
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.environ["NARRATION_CACHE_DIR"] = os.path.join(self.temp_dir.name, "cache")
+        rng = np.random.default_rng(0)
+        self.scenes = []
+        for i in range(8):
+            blocks = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+            image = cv2.resize(blocks, (64, 48), interpolation=cv2.INTER_NEAREST)
+            self.scenes.append(VideoScene(
+                start_time=i * 5.0,
+                end_time=(i + 1) * 5.0,
+                duration=5.0,
+                scene_type="wide-shot",
+                keyframe=cv2.imencode(".jpg", image)[1].tobytes()
+            ))
+        self.metadata = VideoMetadata(
+            path="video.mp4", duration=40.0, fps=30.0, frame_count=1200, width=64, height=48, has_audio=False
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_concurrent_analysis_keeps_order_and_fallbacks(self):
+
+        generator = VisualNarrativeGenerator(max_concurrency=8)
+        generator.client = FakeOpenAI(latency=0.2, fail_scenes={2})
+
+        started = time.perf_counter()
+        segments = generator.generate_narrative(self.scenes, self.metadata)
+        elapsed = time.perf_counter() - started
+
+        # The storytelling call fails to parse, so each scene's description is
+        # used as its segment text, in scene order.
+        self.assertEqual([segment.scene_idx for segment in segments], list(range(8)))
+        for i, segment in enumerate(segments):
+            if i == 2:
+                self.assertEqual(segment.text, "In this scene, Scene 3 (analysis failed)")
+            else:
+                self.assertEqual(segment.text, f"In this scene, Description of scene {i+1}")
+        self.assertLess(elapsed, 8 * 0.2 / 2)
+
+    def test_concurrency_limit(self):
+
+        generator = VisualNarrativeGenerator(max_concurrency=2)
+        generator.client = FakeOpenAI(latency=0.05)
+
+        generator.generate_narrative(self.scenes, self.metadata)
+
+        self.assertEqual(generator.client.chat.completions.max_active, 2)
+
+    def test_keyframe_sources_and_detail(self):
+
+        keyframe_path = os.path.join(self.temp_dir.name, "scene.jpg")
+        with open(keyframe_path, "wb") as f:
+            f.write(self.scenes[0].keyframe)
+        scenes = [
+            self.scenes[0].model_copy(update={"keyframe": b"", "keyframe_path": keyframe_path}),
+            self.scenes[1].model_copy(update={"keyframe": b""}),
+        ]
+
+        generator = VisualNarrativeGenerator(image_detail="low")
+        generator.client = FakeOpenAI()
+        segments = generator.generate_narrative(scenes, self.metadata)
+
+        self.assertEqual(segments[0].text, "In this scene, Description of scene 1")
+        self.assertEqual(segments[1].text, "In this scene, Scene 2 (unknown content)")
+        image_part = generator.client.chat.completions.calls[0]["messages"][-1]["content"][1]
+        self.assertEqual(image_part["image_url"]["detail"], "low")
+
+    def test_repeat_run_uses_description_cache(self):
+
+        generator = VisualNarrativeGenerator()
+        generator.client = FakeOpenAI(fail_scenes={2})
+        generator.generate_narrative(self.scenes, self.metadata)
+
+        # Failed analyses are not cached, so only scene 3 is requested again.
+        rerun = VisualNarrativeGenerator()
+        rerun.client = FakeOpenAI()
+        segments = rerun.generate_narrative(self.scenes, self.metadata)
+
+        vision_calls = [call for call in rerun.client.chat.completions.calls if call["model"] == rerun.model]
+        self.assertEqual(len(vision_calls), 1)
+        self.assertEqual(rerun.description_cache.stats()["hits"], 7)
+        self.assertEqual(segments[0].text, "In this scene, Description of scene 1")
+
+    def test_batched_requests(self):
+
+        generator = VisualNarrativeGenerator(batch_size=3)
+        generator.client = FakeOpenAI()
+        segments = generator.generate_narrative(self.scenes, self.metadata)
+
+        vision_calls = [call for call in generator.client.chat.completions.calls if call["model"] == generator.model]
+        self.assertEqual(len(vision_calls), 3)
+        for i, segment in enumerate(segments):
+            self.assertEqual(segment.text, f"In this scene, Description of scene {i+1}")
+
+    def test_malformed_batch_falls_back_to_single_frames(self):
+
+        generator = VisualNarrativeGenerator(batch_size=4)
+        generator.client = FakeOpenAI(malformed_batches=True)
+        segments = generator.generate_narrative(self.scenes, self.metadata)
+
+        vision_calls = [call for call in generator.client.chat.completions.calls if call["model"] == generator.model]
+        self.assertEqual(len(vision_calls), 2 + 8)
+        for i, segment in enumerate(segments):
+            self.assertEqual(segment.text, f"In this scene, Description of scene {i+1}")
+
+    def test_streamed_scenes_are_analyzed_as_they_arrive(self):
+
+        for batch_size in (1, 2):
+            os.environ["NARRATION_CACHE_DIR"] = os.path.join(self.temp_dir.name, f"cache-{batch_size}")
+            generator = VisualNarrativeGenerator(batch_size=batch_size)
+            generator.client = FakeOpenAI()
+            completions = generator.client.chat.completions
+            requested_before = []
+
+            def scene_stream():
+                for i, scene in enumerate(self.scenes):
+                    if i:
+                        time.sleep(0.05)
+                    requested_before.append(len(completions.calls))
+                    yield scene
+
+            segments = generator.generate_narrative(scene_stream(), self.metadata)
+
+            # Requests go out while later scenes are still being produced.
+            self.assertGreaterEqual(requested_before[-1], (len(self.scenes) - 1) // batch_size - 1)
+            for i, segment in enumerate(segments):
+                self.assertEqual(segment.text, f"In this scene, Description of scene {i+1}")
+
+    def _narrative_response(self, count: int) -> str:
+
+        return json.dumps({"segments": [
+            {"scene_idx": i, "start_time": i * 5.0, "end_time": (i + 1) * 5.0, "text": f'Part {i} says "{{[hi]}}"'}
+            for i in range(count)
+        ]}, indent=2)
+
+    def test_stream_parser_emits_complete_segments(self):
+
+        response = self._narrative_response(3)
+        parser = SegmentStreamParser()
+        emitted = []
+        for i, char in enumerate(response):
+            for segment in parser.feed(char):
+                emitted.append((i, segment))
+
+        self.assertEqual([segment for _, segment in emitted], json.loads(response)["segments"])
+        # Each segment is emitted on the character that closes it.
+        self.assertEqual(response[emitted[0][0]], "}")
+        self.assertLess(emitted[1][0], len(response) - 10)
+
+    def test_streamed_narrative_hands_segments_over_early(self):
+
+        generator = VisualNarrativeGenerator()
+        generator.client = FakeOpenAI(narrative_response=self._narrative_response(8), stream_latency=0.001)
+        completions = generator.client.chat.completions
+        handed_over = []
+
+        def on_segment(segment):
+            handed_over.append((completions.streamed_chunks, segment))
+
+        segments = generator.generate_narrative(self.scenes, self.metadata, on_segment=on_segment)
+
+        self.assertEqual([segment for _, segment in handed_over], segments)
+        self.assertEqual(segments[3].text, 'Part 3 says "{[hi]}"')
+        total_chunks = completions.streamed_chunks
+        self.assertLess(handed_over[0][0], total_chunks / 4)
+        self.assertTrue(completions.calls[-1]["stream"])
+
+    def test_token_usage_is_tracked_per_run(self):
+
+        generator = VisualNarrativeGenerator(max_concurrency=4, description_cache=None)
+        generator.description_cache = None
+        generator.client = FakeOpenAI(narrative_response=self._narrative_response(8), latency=0.01)
+        results = {}
+
+        def run(name, scenes):
+            with generator.track_usage() as usage:
+                scene_descriptions, _ = generator.describe_scenes(scenes)
+                generator.narrate(scene_descriptions, self.metadata, on_segment=lambda segment: None)
+            results[name] = usage.summary(self.metadata.duration)
+
+        threads = [threading.Thread(target=run, args=("a", self.scenes[:5])), threading.Thread(target=run, args=("b", self.scenes[5:]))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Vision requests made on worker threads count towards the run they were made for.
+        self.assertEqual(results["a"]["models"]["gpt-4o"]["requests"], 5)
+        self.assertEqual(results["b"]["models"]["gpt-4o"]["requests"], 3)
+        self.assertEqual(results["a"]["models"]["gpt-4o"]["image_tokens"], 5 * (85 + 170))
+        # The streamed narrative reports its usage in the last chunk.
+        narrator = results["a"]["models"]["gpt-4-turbo"]
+        self.assertEqual(narrator["requests"], 1)
+        self.assertGreater(narrator["completion_tokens"], 0)
+        self.assertGreater(results["a"]["per_video_minute"]["prompt_tokens"], 0)
+        self.assertEqual(generator.token_usage.summary()["requests"], 10)
+
+        # Scene descriptions go into the narrative prompt in the compact encoding.
+        prompt = next(
+            call["messages"][-1]["content"] for call in generator.client.chat.completions.calls
+            if call.get("stream") and '"s":0.0' in call["messages"][-1]["content"]
+        )
+        self.assertIn('{"i":0,"s":0.0,"e":5.0,"k":"wide-shot","d":"Description of scene 1"}', prompt)
+        self.assertNotIn("  ", prompt)
+
+    def _windowed_response(self, broken_part=None):
+        # Answers the outline request, and narrates each part as two segments with a
+        # gap between them, the second running past the end of the part.
+
+        def respond(prompt):
+            if "Summarize the story of each part" in prompt:
+                parts = [int(n) for n in re.findall(r"^Part (\d+) ", prompt, re.MULTILINE)]
+                return json.dumps({"parts": [{"part": n, "summary": f"Summary of part {n}."} for n in parts]})
+            part = int(re.search(r"narrating part (\d+) of", prompt).group(1))
+            if part == broken_part:
+                return "not json"
+            start, end = (float(t) for t in re.search(r"from ([\d.]+)s to ([\d.]+)s", prompt).groups())
+            return json.dumps({"segments": [
+                {"scene_idx": 0, "start_time": start, "end_time": start + 1.0, "text": f"Part {part} opens."},
+                {"scene_idx": 0, "start_time": start + 3.0, "end_time": end + 5.0, "text": f"Part {part} goes on."}
+            ]})
+        return respond
+
+    def test_windowed_narrative_is_generated_concurrently_and_stitched(self):
+
+        generator = VisualNarrativeGenerator(max_concurrency=4, window_seconds=12.0)
+        generator.client = FakeOpenAI(narrative_response=self._windowed_response(), latency=0.05)
+        completions = generator.client.chat.completions
+        scene_descriptions = [{
+            "scene_idx": i, "start_time": scene.start_time, "end_time": scene.end_time,
+            "duration": scene.duration, "description": f"Scene {i+1} happens. More detail.", "scene_type": "wide-shot"
+        } for i, scene in enumerate(self.scenes)]
+        handed_over = []
+
+        segments, complete = generator.narrate(scene_descriptions, self.metadata, on_segment=handed_over.append)
+
+        # One outline request, then the three windows (0-15s, 15-30s, 30-40s) at once.
+        self.assertTrue(complete)
+        self.assertEqual(len(completions.calls), 4)
+        self.assertEqual(completions.max_active, 3)
+        self.assertIn("- Scene 1 happens.\n", completions.calls[0]["messages"][-1]["content"])
+        self.assertNotIn("More detail", completions.calls[0]["messages"][-1]["content"])
+        middle = next(call["messages"][-1]["content"] for call in completions.calls if "part 2 of 3" in call["messages"][-1]["content"])
+        self.assertIn("The story so far: Summary of part 1.", middle)
+        self.assertIn("What comes next: Summary of part 3.", middle)
+
+        self.assertEqual([segment.text for segment in handed_over], [segment.text for segment in segments])
+        self.assertEqual([segment.start_time for segment in segments], [0.0, 3.0, 15.0, 18.0, 30.0, 33.0])
+        for segment, following in zip(segments, segments[1:]):
+            self.assertEqual(segment.end_time, following.start_time)
+        self.assertEqual(segments[-1].end_time, 40.0)
+
+        # A window that fails falls back to its scenes; the others are kept.
+        generator.client = FakeOpenAI(narrative_response=self._windowed_response(broken_part=2))
+        segments, complete = generator.narrate(scene_descriptions, self.metadata)
+        self.assertFalse(complete)
+        self.assertEqual([segment.start_time for segment in segments], [0.0, 3.0, 15.0, 20.0, 25.0, 30.0, 33.0])
+        self.assertTrue(segments[2].text.startswith("In this scene, Scene 4"))
+        self.assertEqual(segments[-1].end_time, 40.0)
+
+    def test_long_video_is_outlined_in_groups_and_stitched_from_zero(self):
+
+        generator = VisualNarrativeGenerator(max_concurrency=4, window_seconds=1.0)
+        generator.client = FakeOpenAI(narrative_response=self._windowed_response())
+        completions = generator.client.chat.completions
+        # 90 one-second windows, the first scene starting after a second of black.
+        scene_descriptions = [{
+            "scene_idx": i, "start_time": i + 1.0, "end_time": i + 2.0,
+            "duration": 1.0, "description": f"Scene {i+1} happens.", "scene_type": "wide-shot"
+        } for i in range(90)]
+        metadata = self.metadata.model_copy(update={"duration": 91.0})
+
+        segments, complete = generator.narrate(scene_descriptions, metadata)
+
+        outlines = [call for call in completions.calls if "Summarize the story" in call["messages"][-1]["content"]]
+        self.assertEqual([call["max_tokens"] for call in outlines], [4000, 4000, 1000])
+        self.assertTrue(complete)
+        self.assertEqual(segments[0].start_time, 0.0)
+        self.assertEqual(segments[0].end_time, segments[1].start_time)
+        self.assertEqual(segments[-1].end_time, 91.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from output_renderer import OutputRenderer, OutputFormat
+from narrative_generator import NarrativeSegment, VisualNarrativeGenerator
+from audio_generator import AudioGenerator
+from fake_clients import FakeOpenAI, FakeElevenLabs
+import main
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+
+RATE = 44100
+
+def decode_audio(path: str) -> np.ndarray:
+    result = subprocess.run(
+        [find_ffmpeg(), "-v", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(RATE), "-"],
+        capture_output=True,
+        check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float64) / 32768
+
+def playlist_entries(path: str) -> list:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def tone_level(samples: np.ndarray, start: float, end: float, frequency: int) -> float:
+    # Amplitude of a sine at frequency between start and end seconds.
+    window = samples[int(start * RATE):int(end * RATE)]
+    t = np.arange(len(window)) / RATE
+    return 2 * abs(np.dot(window, np.exp(-2j * np.pi * frequency * t))) / len(window)
+
+class TestSinglePassRender(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.renderer = OutputRenderer()
+        self.video = os.path.join(self.temp_dir, "video.mp4")
+        # Four seconds of video, with a keyframe every second and a steady 200 Hz soundtrack.
+        subprocess.run(
+            [
+                find_ffmpeg(), "-v", "error",
+                "-f", "lavfi", "-i", "testsrc=size=160x120:rate=25:duration=4",
+                "-f", "lavfi", "-i", "sine=frequency=200:duration=4",
+                "-ac", "2", "-c:v", "libx264", "-g", "25", "-c:a", "aac", "-shortest", self.video
+            ],
+            check=True
+        )
+        self.narrative = [
+            NarrativeSegment(scene_idx=0, start_time=1.0, end_time=2.0, duration=1.0, text="It begins."),
+            NarrativeSegment(scene_idx=1, start_time=2.5, end_time=3.5, duration=1.0, text="It goes on.")
+        ]
+        self.clips = []
+        for i, segment in enumerate(self.narrative):
+            path = os.path.join(self.temp_dir, f"segment_{i}.mp3")
+            with open(path, "wb") as f:
+                f.write(make_tone_mp3(find_ffmpeg(), 0.8, frequency=800))
+            self.clips.append(dict(segment.model_dump(), path=path))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_mix_duck_and_mux_into_several_containers(self):
+
+        output_dir = os.path.join(self.temp_dir, "output")
+        outputs = self.renderer.render_single_pass(
+            self.narrative, self.clips, self.video, 4.0, output_dir, OutputFormat.VTT, containers=["mp4", "mkv"]
+        )
+
+        self.assertTrue(outputs["script"].endswith(".vtt"))
+        self.assertEqual(outputs["muxed_video"], outputs["muxed_videos"]["mp4"])
+        self.assertEqual(sorted(os.listdir(output_dir)), ["narrated_video.mkv", "narrated_video.mp4", "narration_script.vtt"])
+
+        for path in outputs["muxed_videos"].values():
+            samples = decode_audio(path)
+            self.assertAlmostEqual(len(samples) / RATE, 4.0, delta=0.1)
+            # The narration sits at its segment's start, over the soundtrack turned down.
+            self.assertLess(tone_level(samples, 0.2, 0.8, 800), 0.01)
+            self.assertGreater(tone_level(samples, 1.2, 1.7, 800), 0.05)
+            self.assertGreater(tone_level(samples, 2.7, 3.2, 800), 0.05)
+            self.assertLess(tone_level(samples, 1.2, 1.7, 200), tone_level(samples, 0.2, 0.8, 200) / 2)
+            self.assertAlmostEqual(tone_level(samples, 3.6, 3.9, 200), tone_level(samples, 0.2, 0.8, 200), delta=0.03)
+
+    def test_video_without_a_soundtrack(self):
+
+        silent = make_test_video(os.path.join(self.temp_dir, "silent.mp4"), num_scenes=2, frames_per_scene=60)
+        outputs = self.renderer.render_single_pass(
+            self.narrative, self.clips, silent, 4.0, self.temp_dir, has_audio=False
+        )
+
+        samples = decode_audio(outputs["muxed_video"])
+        self.assertGreater(tone_level(samples, 1.2, 1.7, 800), 0.05)
+        self.assertLess(tone_level(samples, 0.2, 0.8, 800), 0.01)
+
+    def test_hls_segments_are_published_as_the_narration_becomes_final(self):
+
+        self.renderer.hls_segment_seconds = 1
+        output_dir = os.path.join(self.temp_dir, "output")
+        package = self.renderer.start_hls(self.narrative, self.video, 4.0, output_dir)
+        hls_dir = os.path.join(output_dir, "hls")
+
+        def published():
+            return len(playlist_entries(os.path.join(hls_dir, "video.m3u8")))
+
+        self.assertEqual(len(package.segments), 4)
+        # Until the first clip arrives, only the second before it is final; then
+        # everything before the second clip's start.
+        self.assertEqual(published(), 1)
+        package.add_clip(self.clips[0])
+        self.assertEqual(published(), 2)
+        self.assertEqual(playlist_entries(os.path.join(hls_dir, "subtitles.m3u8")), ["subtitles_000.vtt", "subtitles_001.vtt"])
+        with open(os.path.join(hls_dir, "subtitles_001.vtt"), "r") as f:
+            self.assertIn("00:00:01.000 --> 00:00:02.000\nIt begins.", f.read())
+        package.add_clip(self.clips[1])
+        self.assertEqual(published(), 4)
+
+        outputs = package.finish()
+        self.assertTrue(outputs["script"].endswith("narration_script.vtt"))
+        with open(outputs["playlist"], "r") as f:
+            master = f.read()
+        for playlist in ("video.m3u8", "audio.m3u8", "subtitles.m3u8"):
+            self.assertIn(playlist, master)
+            with open(os.path.join(hls_dir, playlist), "r") as f:
+                self.assertTrue(f.read().rstrip().endswith("#EXT-X-ENDLIST"))
+
+        # The audio rendition is the narration over the ducked soundtrack.
+        audio_path = os.path.join(self.temp_dir, "audio.mp4")
+        with open(audio_path, "wb") as f:
+            for name in ["audio_init.mp4"] + playlist_entries(os.path.join(hls_dir, "audio.m3u8")):
+                with open(os.path.join(hls_dir, name), "rb") as segment:
+                    f.write(segment.read())
+        samples = decode_audio(audio_path)
+        self.assertAlmostEqual(len(samples) / RATE, 4.0, delta=0.1)
+        self.assertGreater(tone_level(samples, 1.2, 1.7, 800), 0.05)
+        self.assertLess(tone_level(samples, 1.2, 1.7, 200), tone_level(samples, 0.2, 0.8, 200) / 2)
+
+    def test_unsupported_container(self):
+
+        with self.assertRaises(ValueError):
+            self.renderer.mux_narration(self.video, self.clips, 4.0, self.temp_dir, containers=["avi"])
+
+class TestRunWithoutNarrationTrack(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        cls.clip = make_tone_mp3(find_ffmpeg(), 0.5)
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.video = make_test_video(os.path.join(self.temp_dir, "video.mp4"), num_scenes=2, frames_per_scene=30)
+        main.load_components()
+        self.saved = (main.narrative_generator, main.audio_generator, main.artifact_store)
+        main.artifact_store = None
+        main.narrative_generator = VisualNarrativeGenerator(max_concurrency=2, description_cache=None)
+        main.narrative_generator.description_cache = None
+        main.narrative_generator.client = FakeOpenAI(narrative_response=json.dumps({"segments": [
+            {"scene_idx": 0, "start_time": 0.0, "end_time": 1.0, "text": "It begins."},
+            {"scene_idx": 1, "start_time": 1.0, "end_time": 2.0, "text": "It goes on."}
+        ]}))
+        main.audio_generator = AudioGenerator(max_concurrency=2, tts_cache=None)
+        main.audio_generator.tts_cache = None
+        main.audio_generator.client = FakeElevenLabs(audio=self.clip)
+
+    def tearDown(self):
+
+        main.narrative_generator, main.audio_generator, main.artifact_store = self.saved
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_no_narration_track_is_written(self):
+
+        result = main.process_video(self.video, "output", single_pass=True, containers=["mkv", "mov"], profile=True)
+
+        outputs = result["outputs"]
+        self.assertNotIn("audio", outputs)
+        self.assertEqual(sorted(outputs["muxed_videos"]), ["mkv", "mov"])
+        self.assertFalse(os.path.exists(os.path.join(result["output_dir"], "narration.wav")))
+        self.assertAlmostEqual(len(decode_audio(outputs["muxed_video"])) / RATE, 2.0, delta=0.1)
+        # The clips are never decoded on their own, nor mixed into a track.
+        self.assertNotIn("ffmpeg.decode", result["profile"]["requests"])
+        self.assertNotIn("mix", result["profile"]["stages"])
+        self.assertEqual(result["profile"]["requests"]["ffmpeg.mux"]["count"], 1)
+
+    def test_hls_package(self):
+
+        result = main.process_video(self.video, "output", OutputFormat.HLS)
+
+        outputs = result["outputs"]
+        self.assertTrue(os.path.exists(outputs["playlist"]))
+        self.assertTrue(outputs["script"].endswith(".vtt"))
+        self.assertFalse(os.path.exists(os.path.join(result["output_dir"], "narration.wav")))
+        self.assertGreater(len(playlist_entries(os.path.join(outputs["hls_dir"], "audio.m3u8"))), 0)
+
+if __name__ == "__main__":
+    unittest.main()
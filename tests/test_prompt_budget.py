@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from prompt_budget import count_tokens, encode_scenes, fit_descriptions, image_tokens, TokenUsage
+
+def _scene(i: int, description: str):
+    return {
+        "scene_idx": i,
+        "start_time": i * 7.6,
+        "end_time": (i + 1) * 7.6,
+        "duration": 7.6,
+        "description": description,
+        "scene_type": "wide-shot"
+    }
+
+class TestPromptBudget(unittest.TestCase):
+
+    def test_encoding_is_compact_and_rounds_times(self):
+
+        scenes = [_scene(i, f"Scene {i} shows a harbour at dawn.") for i in range(3)]
+        self.assertEqual(scenes[2]["end_time"], 22.799999999999997)
+
+        encoded = encode_scenes(scenes)
+        lines = encoded.split("\n")
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[2]), {
+            "i": 2, "s": 15.2, "e": 22.8, "k": "wide-shot", "d": "Scene 2 shows a harbour at dawn."
+        })
+        self.assertLess(count_tokens(encoded), count_tokens(json.dumps(scenes, indent=2)) / 2)
+
+    def test_long_descriptions_are_trimmed_first(self):
+
+        long_description = " ".join(f"Sentence number {n} goes on about the view." for n in range(40))
+        scenes = [_scene(0, "A door opens."), _scene(1, long_description), _scene(2, long_description)]
+        self.assertIs(fit_descriptions(scenes, 10000), scenes)
+
+        fitted = fit_descriptions(scenes, 200)
+        self.assertLessEqual(count_tokens(encode_scenes(fitted)), 200)
+        self.assertEqual(fitted[0]["description"], "A door opens.")
+        for scene in fitted[1:]:
+            self.assertTrue(long_description.startswith(scene["description"]))
+            self.assertTrue(scene["description"].endswith("about the view."))
+            self.assertGreater(count_tokens(scene["description"]), 40)
+        # The input is left as it was.
+        self.assertEqual(scenes[1]["description"], long_description)
+
+    def test_image_tokens_follow_detail_and_size(self):
+
+        image = cv2.imencode(".jpg", np.zeros((768, 1024, 3), dtype=np.uint8))[1].tobytes()
+        self.assertEqual(image_tokens(image, "low"), 85)
+        # 1024x768 stays within 768 on its short side: 2x2 tiles.
+        self.assertEqual(image_tokens(image, "high"), 85 + 170 * 4)
+        self.assertEqual(image_tokens(image, "auto"), 85 + 170 * 4)
+
+        wide = cv2.imencode(".jpg", np.zeros((1000, 4000, 3), dtype=np.uint8))[1].tobytes()
+        # Scaled to 2048x512, then kept: 4x1 tiles.
+        self.assertEqual(image_tokens(wide, "high"), 85 + 170 * 4)
+
+    def test_usage_totals_per_model_and_video_minute(self):
+
+        usage = TokenUsage()
+        usage.add("vision", type("Usage", (), {"prompt_tokens": 900, "completion_tokens": 100})(), image_tokens=765)
+        usage.add("vision", type("Usage", (), {"prompt_tokens": 900, "completion_tokens": 100})(), image_tokens=765)
+        usage.add("narrator", type("Usage", (), {"prompt_tokens": 1200, "completion_tokens": 800})())
+        usage.add("narrator")
+
+        summary = usage.summary(video_seconds=30.0)
+        self.assertEqual(summary["models"]["vision"], {
+            "requests": 2, "prompt_tokens": 1800, "completion_tokens": 200, "image_tokens": 1530
+        })
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["prompt_tokens"], 3000)
+        self.assertEqual(summary["per_video_minute"]["completion_tokens"], 2000.0)
+
+if __name__ == "__main__":
+    unittest.main()
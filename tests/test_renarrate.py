@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import wave
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from narrative_generator import NarrativeSegment
+from fake_clients import FakeElevenLabs
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+from audio_generator import AudioGenerator
+from output_renderer import OutputRenderer, OutputFormat
+from renarrate import renarrate, diff_timeline, load_script
+
+def _segments():
+    # Segment 1's clip runs past the start of segment 2.
+    return [
+        NarrativeSegment(start_time=i * 2.0, end_time=(i + 1) * 2.0, duration=2.0, text=f"Line {i}", scene_idx=i)
+        for i in range(5)
+    ]
+
+def _frames(path: str) -> bytes:
+
+    with wave.open(path, "rb") as track:
+        return track.readframes(track.getnframes())
+
+class TestRenarrate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        if find_ffmpeg() is None:
+            raise unittest.SkipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        cls.clips = {
+            length: {
+                frequency: make_tone_mp3(find_ffmpeg(), length, frequency=frequency)
+                for frequency in (300, 500, 700, 900, 1100)
+            }
+            for length in (1.5, 2.5)
+        }
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.mkdtemp()
+        os.environ["NARRATION_CACHE_DIR"] = os.path.join(self.temp_dir, "cache")
+        self.generator = AudioGenerator(max_concurrency=2)
+        self.generator.client = FakeElevenLabs(audio=self._audio)
+        self.tts = self.generator.client.text_to_speech
+        self.renderer = OutputRenderer()
+        self.output_dir = os.path.join(self.temp_dir, "output")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _audio(self, text: str) -> bytes:
+        # Every text gets its own tone, and "Line 1" a clip long enough to overlap the next.
+        length = 2.5 if text == "Line 1" else 1.5
+        return self.clips[length][(300, 500, 700, 900, 1100)[sum(map(ord, text)) % 5]]
+
+    def _render(self, segments, video_path=None):
+
+        work_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        audio_path = self.generator.generate_audio(segments, work_dir)
+        return self.renderer.generate_outputs(segments, audio_path, video_path, self.output_dir, OutputFormat.JSON)
+
+    def _edit(self, edit):
+
+        script_path = os.path.join(self.output_dir, "narration_script.json")
+        with open(script_path, "r") as f:
+            script = json.load(f)
+        edit(script["segments"])
+        with open(script_path, "w") as f:
+            json.dump(script, f)
+        return script_path
+
+    def test_diff_keeps_clips_whose_text_and_start_are_unchanged(self):
+
+        segments = _segments()
+        clips = [dict(segment.model_dump(), clip_seconds=1.5) for segment in segments]
+        edited = [segment.model_copy() for segment in segments]
+        edited[1] = edited[1].model_copy(update={"text": "  Line   1 "})
+        edited[2] = edited[2].model_copy(update={"end_time": 5.0})
+        edited[3] = edited[3].model_copy(update={"text": "A new line"})
+        del edited[4]
+
+        kept, added, removed = diff_timeline(clips, edited)
+        self.assertEqual([i for i, _ in kept], [0, 1, 2])
+        self.assertEqual(added, [3])
+        self.assertEqual([clip["text"] for clip in removed], ["Line 3", "Line 4"])
+
+    def test_spliced_track_matches_full_remix(self):
+
+        self._render(_segments())
+        calls_before = len(self.tts.calls)
+
+        def edit(segments):
+            segments[2]["text"] = "A rewritten line"
+            segments[3]["start_time"] = 6.5
+            segments[3]["duration"] = 1.5
+            del segments[4]
+        script_path = self._edit(edit)
+
+        result = renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+
+        # Only the rewritten line goes to the API; the retimed one is a cache hit.
+        self.assertEqual([call["text"] for call in self.tts.calls[calls_before:]], ["A rewritten line"])
+        self.assertEqual(result["synthesized"], 2)
+        self.assertEqual(result["removed"], 3)
+        self.assertFalse(result["remuxed"])
+
+        full_remix = self.generator.generate_audio(load_script(script_path), tempfile.mkdtemp(dir=self.temp_dir))
+        self.assertEqual(_frames(os.path.join(self.output_dir, "narration.wav")), _frames(full_remix))
+
+        # The updated timeline is the baseline for the next edit.
+        result = renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+        self.assertEqual((result["synthesized"], result["removed"], result["windows"]), (0, 0, []))
+
+    def test_unchanged_clips_come_from_the_track_without_the_tts_cache(self):
+
+        self._render(_segments())
+        self.generator.tts_cache = None
+        calls_before = len(self.tts.calls)
+
+        def retime(segments):
+            segments[4]["start_time"] = 7.0
+        script_path = self._edit(retime)
+        renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+
+        # "Line 3" reaches into the edit, and is cut from the track rather than synthesized.
+        self.assertEqual([call["text"] for call in self.tts.calls[calls_before:]], ["Line 4"])
+        full_remix = self.generator.generate_audio(load_script(script_path), tempfile.mkdtemp(dir=self.temp_dir))
+        self.assertEqual(_frames(os.path.join(self.output_dir, "narration.wav")), _frames(full_remix))
+
+        # "Line 1" overlaps "Line 2" in the track, so it can't be cut from it.
+        def rewrite(segments):
+            segments[2]["text"] = "A rewritten line"
+        self._edit(rewrite)
+        with self.assertRaises(ValueError):
+            renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+
+    def test_single_pass_and_hls_runs_are_reported_as_unsupported(self):
+
+        os.makedirs(os.path.join(self.output_dir, "hls"))
+        with self.assertRaisesRegex(ValueError, "HLS outputs"):
+            renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+
+        os.rmdir(os.path.join(self.output_dir, "hls"))
+        open(os.path.join(self.output_dir, "narrated_video.mp4"), "wb").close()
+        with self.assertRaisesRegex(ValueError, "single-pass outputs"):
+            renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+
+    def test_remux_only_when_the_track_changes(self):
+
+        video_path = make_test_video(os.path.join(self.temp_dir, "video.mp4"), num_scenes=2, frames_per_scene=150)
+        outputs = self._render(_segments(), video_path)
+        muxed_path = outputs["muxed_video"]
+        first_mux = os.stat(muxed_path).st_mtime_ns
+
+        def retime_end(segments):
+            segments[0]["end_time"] = 1.8
+        self._edit(retime_end)
+        result = renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+        self.assertFalse(result["remuxed"])
+        self.assertEqual(os.stat(muxed_path).st_mtime_ns, first_mux)
+        with open(os.path.join(self.output_dir, "narration_script.json"), "r") as f:
+            self.assertEqual(json.load(f)["segments"][0]["end_time"], 1.8)
+
+        def rewrite(segments):
+            segments[0]["text"] = "A different opening"
+        self._edit(rewrite)
+        result = renarrate(self.output_dir, audio_generator=self.generator, output_renderer=self.renderer)
+        self.assertTrue(result["remuxed"])
+        self.assertNotEqual(os.stat(muxed_path).st_mtime_ns, first_mux)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import threading
+import unittest
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import cv2
+import numpy as np
+from scenedetect import detect, ContentDetector
+
+from scene_analyzer import SceneAnalyzer, _KeyframeTracker, _closest_to_middle
+from fixtures import make_test_video
+
+class TestSceneAnalyzer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.video_path = make_test_video(
+            os.path.join(cls.temp_dir.name, "scenes.mp4"), num_scenes=5, frames_per_scene=45
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def test_boundaries_match_scenedetect(self):
+
+        analyzer = SceneAnalyzer()
+        scenes = analyzer.detect_scenes(self.video_path)
+        expected = detect(self.video_path, ContentDetector(
+            threshold=analyzer.threshold,
+            min_scene_len=analyzer.min_scene_len
+        ))
+
+        self.assertEqual(len(scenes), len(expected))
+        for scene, (start, end) in zip(scenes, expected):
+            self.assertAlmostEqual(scene.start_time, start.frame_num / float(start.frame_rate), places=3)
+            self.assertAlmostEqual(scene.end_time, (end.frame_num - 1) / float(start.frame_rate), places=3)
+
+    def test_keyframes_come_from_their_scene(self):
+
+        scenes = SceneAnalyzer(keyframe_candidates=4).detect_scenes(self.video_path)
+
+        for scene in scenes:
+            self.assertTrue(scene.keyframe)
+            self.assertNotEqual(scene.scene_type, "unknown")
+            self.assertGreaterEqual(scene.keyframe_time, scene.start_time - 1e-6)
+            self.assertLessEqual(scene.keyframe_time, scene.end_time + 1e-6)
+
+    def test_single_scene_video(self):
+
+        path = make_test_video(
+            os.path.join(self.temp_dir.name, "single.mp4"), num_scenes=1, frames_per_scene=60
+        )
+        scenes = SceneAnalyzer().detect_scenes(path)
+
+        self.assertEqual(len(scenes), 1)
+        self.assertEqual(scenes[0].start_time, 0.0)
+        self.assertAlmostEqual(scenes[0].end_time, 2.0, places=3)
+        self.assertTrue(scenes[0].keyframe)
+
+    def test_fast_mode_refines_cuts_to_exact_frames(self):
+
+        reference = SceneAnalyzer().detect_scenes(self.video_path)
+        fast = SceneAnalyzer(frame_skip=3, detect_width=128).detect_scenes(self.video_path)
+
+        self.assertEqual(len(fast), len(reference))
+        for fast_scene, scene in zip(fast, reference):
+            self.assertAlmostEqual(fast_scene.start_time, scene.start_time, places=3)
+            self.assertAlmostEqual(fast_scene.end_time, scene.end_time, places=3)
+
+    def test_compare_with_reference(self):
+
+        report = SceneAnalyzer(frame_skip=2).compare_with_reference(self.video_path)
+
+        self.assertEqual(report.reference_cuts, 4)
+        self.assertEqual(report.candidate_cuts, 4)
+        self.assertEqual(report.precision, 1.0)
+        self.assertEqual(report.recall, 1.0)
+        self.assertGreater(report.speedup, 0.0)
+
+    def test_parallel_matches_serial(self):
+
+        # 9 scenes of 40 frames: 3 workers put the range edges exactly on cuts,
+        # 4 workers put them inside scenes.
+        path = make_test_video(
+            os.path.join(self.temp_dir.name, "long.mp4"), num_scenes=9, frames_per_scene=40, seed=1
+        )
+        serial = SceneAnalyzer().detect_scenes(path)
+
+        for workers in (3, 4):
+            analyzer = SceneAnalyzer(workers=workers, min_chunk_seconds=1.0, chunk_overlap=1.0)
+            parallel = analyzer.detect_scenes(path)
+
+            self.assertEqual(len(parallel), len(serial))
+            for parallel_scene, scene in zip(parallel, serial):
+                self.assertAlmostEqual(parallel_scene.start_time, scene.start_time, places=3)
+                self.assertAlmostEqual(parallel_scene.end_time, scene.end_time, places=3)
+                self.assertTrue(parallel_scene.keyframe)
+                self.assertEqual(parallel_scene.scene_type, scene.scene_type)
+
+            streamed = list(analyzer.iter_scenes(path, max_pending=1))
+            self.assertEqual(
+                [(s.start_time, s.end_time) for s in streamed],
+                [(s.start_time, s.end_time) for s in parallel]
+            )
+            self.assertTrue(all(s.keyframe for s in streamed))
+
+    def test_streamed_scenes_match_detect_scenes(self):
+
+        single = make_test_video(
+            os.path.join(self.temp_dir.name, "single_stream.mp4"), num_scenes=1, frames_per_scene=60
+        )
+        for analyzer in (SceneAnalyzer(), SceneAnalyzer(frame_skip=3, detect_width=128)):
+            for path in (self.video_path, single):
+                expected = analyzer.detect_scenes(path)
+                streamed = list(analyzer.iter_scenes(path, max_pending=1))
+
+                self.assertEqual(len(streamed), len(expected))
+                for streamed_scene, scene in zip(streamed, expected):
+                    self.assertAlmostEqual(streamed_scene.start_time, scene.start_time, places=3)
+                    self.assertAlmostEqual(streamed_scene.end_time, scene.end_time, places=3)
+                    self.assertTrue(streamed_scene.keyframe)
+                    self.assertGreaterEqual(streamed_scene.keyframe_time, streamed_scene.start_time - 1e-6)
+                    self.assertLessEqual(streamed_scene.keyframe_time, streamed_scene.end_time + 1e-6)
+                    if not analyzer.frame_skip:
+                        self.assertEqual(streamed_scene.keyframe, scene.keyframe)
+
+    def test_streaming_applies_backpressure_and_stops_early(self):
+
+        produced = []
+
+        class CountingAnalyzer(SceneAnalyzer):
+            def _scan_range(self, video_path, own_start, own_end, on_piece=None):
+                def counted(piece, last):
+                    produced.append(piece["start_frame"])
+                    on_piece(piece, last)
+                return super()._scan_range(video_path, own_start, own_end, counted)
+
+        stream = CountingAnalyzer().iter_scenes(self.video_path, max_pending=1)
+        first = next(stream)
+        time.sleep(0.5)
+
+        # One scene consumed, one waiting in the queue, one blocked handing itself over.
+        self.assertEqual(first.start_time, 0.0)
+        self.assertLessEqual(len(produced), 3)
+        stream.close()
+        self.assertFalse(any(t.name == "scene-detection" for t in threading.enumerate()))
+
+    def test_keyframes_are_scaled_to_budget(self):
+
+        scenes = SceneAnalyzer(
+            keyframe_max_width=160, keyframe_max_height=160, keyframe_quality=50
+        ).detect_scenes(self.video_path)
+
+        for scene in scenes:
+            image = cv2.imdecode(np.frombuffer(scene.keyframe, np.uint8), cv2.IMREAD_COLOR)
+            self.assertEqual(image.shape[:2], (120, 160))
+            self.assertEqual(scene.keyframe_path, "")
+
+    def test_tracker_keeps_candidates_bounded(self):
+
+        tracker = _KeyframeTracker(max_candidates=8)
+        for frame_num in range(1000):
+            tracker.add_frame(frame_num, frame_num)
+            self.assertLessEqual(len(tracker.candidates), 8)
+
+        start, end, candidates = tracker.close_scene(999)
+        self.assertEqual((start, end), (0, 999))
+        keyframe_num, _ = _closest_to_middle(candidates, start, end)
+        self.assertLessEqual(abs(keyframe_num - 499), 1000 // 8)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+import tempfile
+import urllib.request
+import urllib.error
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.dirname(__file__))
+
+from service import NarrationService, create_server
+from fake_clients import FakeOpenAI, FakeElevenLabs
+from narrative_generator import VisualNarrativeGenerator
+from audio_generator import AudioGenerator
+import main
+from fixtures import find_ffmpeg, make_test_video, make_tone_mp3
+
+class FakeProcess:
+    # Stands in for process_video: records the order jobs run in and writes a script
+    # file as the job's only output.
+
+    def __init__(self, output_dir: str):
+
+        self.output_dir = output_dir
+        self.order = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, video_path, output_dir, output_format, mux_video):
+
+        self.release.wait()
+        if "missing" in video_path:
+            raise ValueError(f"Video file not found: {video_path}")
+        self.order.append(video_path)
+        script_path = os.path.join(self.output_dir, f"{os.path.basename(video_path)}.{output_format.value}")
+        with open(script_path, "w") as f:
+            f.write(f"script for {video_path}")
+        return {"outputs": {"script": script_path}, "output_dir": self.output_dir}
+
+def _wait_for(service, job_id, timeout=30.0):
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = service.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+class TestNarrationService(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_jobs_run_by_priority(self):
+
+        process = FakeProcess(self.temp_dir.name)
+        service = NarrationService(process=process, workers=1)
+        service.start()
+        try:
+            process.release.clear()
+            first = service.submit("first.mp4")
+            time.sleep(0.1)
+            low = service.submit("low.mp4", priority=0)
+            high = service.submit("high.mp4", priority=5)
+            failed = service.submit("missing.mp4", priority=-1)
+            self.assertEqual(service.get(low.id).status, "queued")
+            process.release.set()
+
+            for job in (first, low, high):
+                self.assertEqual(_wait_for(service, job.id).status, "succeeded")
+            failed = _wait_for(service, failed.id)
+        finally:
+            service.stop()
+
+        self.assertEqual(process.order, ["first.mp4", "high.mp4", "low.mp4"])
+        self.assertEqual(failed.status, "failed")
+        self.assertIn("not found", failed.error)
+
+    def test_http_api(self):
+
+        service = NarrationService(process=FakeProcess(self.temp_dir.name), workers=2)
+        service.start()
+        server = create_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def request(path, body=None):
+            data = json.dumps(body).encode("utf-8") if body is not None else None
+            with urllib.request.urlopen(urllib.request.Request(base_url + path, data=data)) as response:
+                return response.status, response.read()
+
+        try:
+            status, body = request("/jobs", {"video_path": "clip.mp4", "format": "srt", "priority": 2})
+            self.assertEqual(status, 202)
+            job_id = json.loads(body)["id"]
+            _wait_for(service, job_id)
+
+            status, body = request(f"/jobs/{job_id}")
+            job = json.loads(body)
+            self.assertEqual(job["status"], "succeeded")
+            self.assertEqual(job["output_format"], "srt")
+
+            status, body = request(f"/jobs/{job_id}/outputs/script")
+            self.assertEqual(body, b"script for clip.mp4")
+
+            status, body = request("/jobs")
+            self.assertEqual([job["id"] for job in json.loads(body)["jobs"]], [job_id])
+
+            for path, body, code in (
+                ("/jobs/unknown", None, 404),
+                ("/jobs", {"format": "json"}, 400),
+                ("/jobs", {"video_path": "clip.mp4", "format": "avi"}, 400),
+                (f"/jobs/{job_id}/outputs/audio", None, 404),
+            ):
+                with self.assertRaises(urllib.error.HTTPError) as context:
+                    request(path, body)
+                self.assertEqual(context.exception.code, code)
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.stop()
+
+    def test_input_root_directory_outputs_and_pruning(self):
+
+        def process(video_path, output_dir, output_format, mux_video):
+            hls_dir = os.path.join(output_dir, "hls")
+            os.makedirs(hls_dir, exist_ok=True)
+            return {"outputs": {"hls_dir": hls_dir, "muxed_videos": {"mp4": video_path}}}
+
+        root = os.path.join(self.temp_dir.name, "inputs")
+        service = NarrationService(process=process, output_dir=self.temp_dir.name, input_root=root, max_finished_jobs=2)
+        service.start()
+        server = create_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        try:
+            for path in ("../secret.mp4", "/etc/passwd"):
+                with self.assertRaises(ValueError):
+                    service.submit(path)
+            jobs = [_wait_for(service, service.submit(f"clip{i}.mp4").id) for i in range(3)]
+            self.assertEqual(jobs[0].video_path, os.path.join(os.path.realpath(root), "clip0.mp4"))
+            self.assertEqual(service.submit("https://example.com/clip.mp4").video_path, "https://example.com/clip.mp4")
+
+            for name, code in (("hls_dir", 400), ("muxed_videos", 404)):
+                with self.assertRaises(urllib.error.HTTPError) as context:
+                    urllib.request.urlopen(f"{base_url}/jobs/{jobs[2].id}/outputs/{name}")
+                self.assertEqual(context.exception.code, code)
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.stop()
+
+        # Only the two most recently finished jobs are kept.
+        self.assertIsNone(service.get(jobs[0].id))
+        self.assertEqual(sum(job.finished_at is not None for job in service.list_jobs()), 2)
+
+    def test_service_with_fake_backends(self):
+
+        if find_ffmpeg() is None:
+            self.skipTest("ffmpeg is not on PATH")
+        os.environ.setdefault("OPENAI_API_KEY", "test-key")
+        os.environ.setdefault("ELEVEN_API_KEY", "test-key")
+        os.environ["NARRATION_CACHE_DIR"] = os.path.join(self.temp_dir.name, "cache")
+
+        saved = (main.narrative_generator, main.audio_generator)
+        main.narrative_generator = VisualNarrativeGenerator()
+        main.narrative_generator.client = FakeOpenAI()
+        main.audio_generator = AudioGenerator()
+        main.audio_generator.client = FakeElevenLabs(audio=make_tone_mp3(find_ffmpeg(), 0.5))
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        service = NarrationService(output_dir="output", workers=2)
+        service.start()
+        try:
+            videos = [
+                make_test_video(os.path.join(self.temp_dir.name, f"video{i}.mp4"), num_scenes=2, frames_per_scene=20, seed=i)
+                for i in range(2)
+            ]
+            jobs = [_wait_for(service, service.submit(video).id) for video in videos]
+        finally:
+            service.stop()
+            os.chdir(cwd)
+            main.narrative_generator, main.audio_generator = saved
+
+        for job in jobs:
+            self.assertEqual(job.status, "succeeded", job.error)
+            self.assertEqual(job.result["scenes"], 2)
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, job.result["outputs"]["audio"])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(SRC_DIR)
+
+from toolchain import PROJECT_ROOT
+
+HEAVY_MODULES = ["cv2", "scenedetect", "numpy", "openai", "elevenlabs", "pydub", "requests"]
+
+class TestStartup(unittest.TestCase):
+
+    def _run(self, code: str) -> str:
+
+        env = {key: value for key, value in os.environ.items() if not key.endswith("_API_KEY")}
+        env["PYTHONPATH"] = SRC_DIR
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_importing_main_loads_no_heavy_dependencies(self):
+
+        tools_existed = os.path.exists(os.path.join(PROJECT_ROOT, "tools"))
+        output = self._run(
+            "import sys, json, main, service\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        )
+        # No API keys are needed and no clients are built.
+        self.assertEqual(json.loads(output), [])
+
+        # The audio module needs numpy for mixing, but finds ffmpeg only when it runs
+        # and never downloads it.
+        output = self._run(
+            "import sys, json, audio_generator\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        )
+        self.assertEqual(json.loads(output), ["numpy"])
+        self.assertEqual(os.path.exists(os.path.join(PROJECT_ROOT, "tools")), tools_existed)
+
+    def test_help_runs_without_api_keys(self):
+
+        env = {key: value for key, value in os.environ.items() if not key.endswith("_API_KEY")}
+        # Settings from the environment are only read once components are loaded.
+        env["SCENE_WORKERS"] = "many"
+        result = subprocess.run(
+            [sys.executable, os.path.join(SRC_DIR, "main.py"), "--help"],
+            env=env, capture_output=True, text=True, timeout=60
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("--batch", result.stdout)
+
+    def test_malformed_setting_is_reported(self):
+
+        import main
+        os.environ["SCENE_WORKERS"] = "many"
+        try:
+            with self.assertRaisesRegex(ValueError, "SCENE_WORKERS must be a number"):
+                main._setting(None, "SCENE_WORKERS", 1, minimum=1)
+        finally:
+            del os.environ["SCENE_WORKERS"]
+        self.assertEqual(main._setting(None, "SCENE_WORKERS", 1, minimum=1), 1)
+        self.assertEqual(main._setting(3, "SCENE_WORKERS", 1, minimum=1), 3)
+        with self.assertRaises(ValueError):
+            main._setting(0, "SCENE_WORKERS", 1, minimum=1)
+
+if __name__ == "__main__":
+    unittest.main()
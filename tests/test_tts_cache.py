@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import unittest
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from tts_cache import TTSCache
+
+class TestTTSCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "tts")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _clip(self, name: str, data: bytes) -> str:
+
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_key_covers_voice_settings_and_normalized_text(self):
+
+        cache = TTSCache(self.cache_dir)
+        key = cache.key("Once upon  a time.\n", "voice", "model", 0.5, 0.75)
+
+        self.assertEqual(key, cache.key(" Once upon a time.", "voice", "model", 0.5, 0.75))
+        self.assertNotEqual(key, cache.key("Once upon a time!", "voice", "model", 0.5, 0.75))
+        self.assertNotEqual(key, cache.key("Once upon a time.", "other", "model", 0.5, 0.75))
+        self.assertNotEqual(key, cache.key("Once upon a time.", "voice", "other", 0.5, 0.75))
+        self.assertNotEqual(key, cache.key("Once upon a time.", "voice", "model", 0.6, 0.75))
+        self.assertNotEqual(key, cache.key("Once upon a time.", "voice", "model", 0.5, 0.8))
+
+    def test_get_and_put(self):
+
+        cache = TTSCache(self.cache_dir)
+        key = cache.key("text", "voice", "model", 0.5, 0.75)
+        destination = os.path.join(self.temp_dir.name, "segment_0.mp3")
+
+        self.assertFalse(cache.get(key, destination))
+        cache.put(key, self._clip("clip.mp3", b"audio"))
+        self.assertTrue(TTSCache(self.cache_dir).get(key, destination))
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), b"audio")
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertFalse([name for _, _, files in os.walk(self.cache_dir) for name in files if name.endswith(".part")])
+
+        # Putting the same key again replaces the clip rather than adding to the size.
+        cache.put(key, self._clip("clip.mp3", b"longer audio"))
+        self.assertEqual(cache.stats()["bytes"], len(b"longer audio"))
+
+    def test_evicts_least_recently_used(self):
+
+        cache = TTSCache(self.cache_dir, max_bytes=25)
+        keys = [cache.key(f"line {i}", "voice", "model", 0.5, 0.75) for i in range(3)]
+        destination = os.path.join(self.temp_dir.name, "segment.mp3")
+
+        cache.put(keys[0], self._clip("a.mp3", b"a" * 10))
+        time.sleep(0.01)
+        cache.put(keys[1], self._clip("b.mp3", b"b" * 10))
+        time.sleep(0.01)
+        self.assertTrue(cache.get(keys[0], destination))
+        time.sleep(0.01)
+        cache.put(keys[2], self._clip("c.mp3", b"c" * 10))
+
+        self.assertTrue(cache.get(keys[0], destination))
+        self.assertFalse(cache.get(keys[1], destination))
+        self.assertTrue(cache.get(keys[2], destination))
+        self.assertLessEqual(cache.stats()["bytes"], 25)
+
+if __name__ == "__main__":
+    unittest.main()
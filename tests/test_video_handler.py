@@ -0,0 +1,114 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import scene_analyzer
+import video_handler
+from video_handler import VideoInputHandler, probe_video
+from download_cache import DownloadCache
+from scene_analyzer import SceneAnalyzer
+from fixtures import find_ffmpeg, make_test_video
+
+@unittest.skipIf(find_ffmpeg() is None, "ffmpeg is not available")
+class TestVideoProbe(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.video_path = make_test_video(os.path.join(cls.temp_dir, "silent.mp4"), num_scenes=3)
+        cls.ffmpeg = find_ffmpeg()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def _ffmpeg(self, *args):
+        subprocess.run([self.ffmpeg, "-v", "error", "-y", *args], check=True)
+
+    def test_probe_reads_stream_properties(self):
+
+        handler = VideoInputHandler(download_cache=DownloadCache(os.path.join(self.temp_dir, "downloads")))
+        metadata = handler.handle_input(self.video_path)
+
+        self.assertEqual(metadata.path, self.video_path)
+        self.assertEqual((metadata.width, metadata.height), (320, 240))
+        self.assertAlmostEqual(metadata.fps, 30.0)
+        self.assertEqual(metadata.frame_count, 135)
+        self.assertAlmostEqual(metadata.duration, 4.5, places=2)
+        self.assertFalse(metadata.has_audio)
+
+    def test_audio_stream_is_detected(self):
+
+        with_audio = os.path.join(self.temp_dir, "with_audio.mp4")
+        self._ffmpeg(
+            "-f", "lavfi", "-i", "sine=duration=4.5", "-i", self.video_path,
+            "-map", "1:v", "-map", "0:a", "-c:v", "copy", "-shortest", with_audio
+        )
+
+        self.assertTrue(probe_video(with_audio).has_audio)
+
+    def test_variable_frame_rate_frames_are_counted(self):
+
+        # 30 frames at 30 fps, then the rest at 10 fps, in a container without a
+        # frame count in its header.
+        vfr_path = os.path.join(self.temp_dir, "vfr.mkv")
+        self._ffmpeg(
+            "-i", self.video_path,
+            "-vf", "setpts='if(lt(N,30),N,30+(N-30)*3)/30/TB'",
+            "-fps_mode", "passthrough", "-c:v", "mpeg4", vfr_path
+        )
+
+        self.assertEqual(probe_video(vfr_path).frame_count, 135)
+
+    def test_probe_is_memoized_until_the_file_changes(self):
+
+        path = os.path.join(self.temp_dir, "memo.mp4")
+        shutil.copyfile(self.video_path, path)
+
+        before = video_handler._probe_file.cache_info()
+        first = probe_video(path)
+        second = probe_video(path)
+        after = video_handler._probe_file.cache_info()
+        self.assertEqual(first, second)
+        self.assertEqual(after.misses - before.misses, 1)
+        self.assertEqual(after.hits - before.hits, 1)
+
+        make_test_video(path, num_scenes=2)
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        self.assertEqual(probe_video(path).frame_count, 90)
+
+    def test_detection_takes_timing_from_metadata(self):
+
+        metadata = probe_video(self.video_path)
+        opened = []
+        original_open_video = scene_analyzer.open_video
+
+        def counting_open_video(path, *args, **kwargs):
+            opened.append(path)
+            return original_open_video(path, *args, **kwargs)
+
+        scene_analyzer.open_video = counting_open_video
+        try:
+            with_metadata = SceneAnalyzer().detect_scenes(self.video_path, metadata)
+            opens_with_metadata = len(opened)
+            opened.clear()
+            without_metadata = SceneAnalyzer().detect_scenes(self.video_path)
+        finally:
+            scene_analyzer.open_video = original_open_video
+
+        self.assertEqual(
+            [(s.start_time, s.end_time) for s in with_metadata],
+            [(s.start_time, s.end_time) for s in without_metadata]
+        )
+        self.assertEqual(opens_with_metadata, 1)
+        self.assertEqual(len(opened), 2)
+
+if __name__ == '__main__':
+    unittest.main()